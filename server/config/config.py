@@ -24,12 +24,45 @@ RECENT_K = 18
 PLANNER_RECENT = 6
 KEEP_RECENT = 4
 SUMMARIZE_AFTER = 18
+# analyze_node summarizes the web factors once this many credible ones are in, without waiting for the slower source; 0 (default) waits for all
+ANALYZE_ENOUGH_FACTORS = int(os.getenv("ANALYZE_ENOUGH_FACTORS", "0"))
 
 # retrieve config
 CHUNK_SIZE = 835
 CHUNK_OVERLAP = 120
-EMB_MODEL = os.getenv("EMB_MODEL", "text-embedding-3-large")
+EMB_MODEL = os.getenv("EMB_MODEL", "text-embedding-3-large")  # OpenAI model | local[:<hf model>] | hashing[:<dim>]
 RERANKER_MODEL = os.getenv("RERANKER_MODEL", "BAAI/bge-reranker-v2-m3")
+RERANKER_BACKEND = os.getenv("RERANKER_BACKEND", "torch")  # torch | onnx (int8, CPU)
+RERANKER_ONNX_DIR = Path(os.getenv("RERANKER_ONNX_DIR", str(DATA_DIR / "reranker_onnx")))
+RERANKER_THREADS = int(os.getenv("RERANKER_THREADS", "0"))  # onnx intra-op threads, 0 = all cores
+RERANK_BATCH_WINDOW_MS = float(os.getenv("RERANK_BATCH_WINDOW_MS", "5"))
+RERANK_MAX_BATCH = int(os.getenv("RERANK_MAX_BATCH", "256"))
+# seconds a rerank waits for its scores; past RETRIEVE_STAGE_TIMEOUT the query keeps the fused order, and the scores still fill the cache
+RERANK_TIMEOUT = float(os.getenv("RERANK_TIMEOUT", "120"))
+RERANK_CACHE_MAX = int(os.getenv("RERANK_CACHE_MAX", "50000"))
+RERANK_CACHE_PERSIST = os.getenv("RERANK_CACHE_PERSIST", "false").lower() == "true"
+RERANK_CACHE_PATH = DATA_DIR / "rerank_cache.db"
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0"))  # chunking processes, 0 = all cores
+INGEST_EMBED_BATCH = int(os.getenv("INGEST_EMBED_BATCH", "64"))  # chunks per embedding request
+INGEST_EMBED_CONCURRENCY = int(os.getenv("INGEST_EMBED_CONCURRENCY", "4"))  # embedding requests in flight
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.9"))  # MinHash Jaccard from which chunks collapse into one, 0 disables
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")  # chroma | local (in-process int8 index, no Chroma client)
+VECTOR_HNSW_MIN = int(os.getenv("VECTOR_HNSW_MIN", "10000"))  # local backend adds an HNSW graph from this many chunks (needs hnswlib)
+RRF_K = int(os.getenv("RRF_K", "60"))  # rank-fusion damping constant
+# per-leg rank-fusion weights, "leg=weight,..."; legs not listed weigh 1.0
+RRF_WEIGHTS = {
+    leg.strip(): float(weight)
+    for leg, _, weight in (item.partition("=") for item in os.getenv("RRF_WEIGHTS", "dense=1.0,sparse=1.0").split(","))
+    if leg.strip()
+}
+RETRIEVE_WORKERS = int(os.getenv("RETRIEVE_WORKERS", "8"))  # thread pool shared by the dense / sparse / rerank stages
+RETRIEVE_STAGE_TIMEOUT = float(os.getenv("RETRIEVE_STAGE_TIMEOUT", "10"))  # seconds per stage before it is skipped
+RESULT_CACHE_MAX = int(os.getenv("RESULT_CACHE_MAX", "1024"))  # cached db_retrieve answers, 0 disables
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))  # seconds
+RETRIEVE_WARMUP = os.getenv("RETRIEVE_WARMUP", "true").lower() == "true"  # load retrieval models in the background at launch
+SPARSE_TOKENIZER = os.getenv("SPARSE_TOKENIZER", "bigram")  # bigram | jieba (bigram + dictionary words)
+EMB_CACHE_PATH = DATA_DIR / "emb_cache.db"
+EMB_CACHE_MAX = int(os.getenv("EMB_CACHE_MAX", "200000"))
 
 # reddit client param
 CLIENT_ID = os.getenv("CLIENT_ID")
@@ -38,6 +71,33 @@ REDDIT_PASSWORD = os.getenv("REDDIT_PASSWORD")
 REDDIT_USERNAME = os.getenv("REDDIT_USERNAME")
 USER_AGENT = os.getenv("USER_AGENT")
 
+# search clients, shared by every tool call
+SEARCH_POOL_SIZE = int(os.getenv("SEARCH_POOL_SIZE", "8"))  # keep-alive connections per upstream host
+REDDIT_POOL_SIZE = int(os.getenv("REDDIT_POOL_SIZE", "4"))  # praw.Reddit clients, one per concurrent Reddit search
+SEARCH_BRANCH_WORKERS = int(os.getenv("SEARCH_BRANCH_WORKERS", "8"))  # threads running advan_web_search branches, two per call
+SEARCH_BRANCH_TIMEOUT = float(os.getenv("SEARCH_BRANCH_TIMEOUT", "30"))  # seconds per advan_web_search source before partial results are returned
+SEARCH_CACHE_PATH = DATA_DIR / "search_cache.db"
+SEARCH_CACHE_MAX = int(os.getenv("SEARCH_CACHE_MAX", "20000"))  # cached Tavily / Zhihu / Reddit responses, 0 disables
+SEARCH_CACHE_STALE = float(os.getenv("SEARCH_CACHE_STALE", "86400"))  # seconds past its TTL a response is still served while it is refreshed
+# per-source response TTLs in seconds, "source=seconds,..."; sources not listed keep responses for an hour
+SEARCH_CACHE_TTLS = {
+    source.strip(): float(ttl)
+    for source, _, ttl in (item.partition("=") for item in os.getenv("SEARCH_CACHE_TTLS", "tavily=86400,zhihu=21600,reddit=3600").split(","))
+    if source.strip()
+}
+# record / replay of the Tavily, Zhihu and Reddit HTTP traffic, for offline tests and load tests:
+# live (default) | record (call upstream, append every response to the cassettes) | replay (serve the
+# cassettes from a local stand-in server, no credentials needed)
+SEARCH_HTTP_MODE = os.getenv("SEARCH_HTTP_MODE", "live").strip().lower()
+SEARCH_CASSETTE_DIR = Path(os.getenv("SEARCH_CASSETTE_DIR", str(BASE_DIR / "tests" / "cassettes")))
+# injected replay latency in seconds per upstream, "upstream=seconds,...", varied by +-SEARCH_REPLAY_JITTER of itself
+SEARCH_REPLAY_LATENCY = {
+    upstream.strip(): float(delay)
+    for upstream, _, delay in (item.partition("=") for item in os.getenv("SEARCH_REPLAY_LATENCY", "tavily=0.8,zhihu=0.3,reddit=0.4").split(","))
+    if upstream.strip()
+}
+SEARCH_REPLAY_JITTER = float(os.getenv("SEARCH_REPLAY_JITTER", "0.2"))
+
 
 def get_config_summary():
     return {
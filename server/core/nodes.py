@@ -14,12 +14,12 @@ from langgraph.prebuilt import ToolNode
 from langgraph.types import interrupt, Command
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-from config import DB_PATH, MODEL, SIDE_MODEL, MAX_ROUNDS, RECENT_K, KEEP_RECENT, SUMMARIZE_AFTER
+from config import DB_PATH, MODEL, SIDE_MODEL, MAX_ROUNDS, RECENT_K, KEEP_RECENT, SUMMARIZE_AFTER, ANALYZE_ENOUGH_FACTORS
 from utils.search import web_search
-from utils.retrieve import db_retrieve
+from utils.retrieve import db_retrieve, db_retrieve_many
 from .db import DBManager
 
-TOOLS = [web_search, db_retrieve]
+TOOLS = [web_search, db_retrieve, db_retrieve_many]
 tool_node = ToolNode(TOOLS)
 DB = DBManager(str(DB_PATH))
 LLM = ChatOpenAI(model=MODEL)
@@ -133,8 +133,9 @@ def analyze_node(state: AgentState) -> Command:
         else:
             cn_query = en_query = query_text
 
-        from utils.search import advan_web_search
-        factors_json = advan_web_search.invoke({"cn_query": cn_query, "en_query": en_query})
+        from utils.search import stream_advan_web_search, collect_factors
+        # batches arrive per Zhihu answer / subreddit; stop reading once enough credible factors are in
+        factors_json = json.dumps(collect_factors(stream_advan_web_search(cn_query, en_query), enough=ANALYZE_ENOUGH_FACTORS))
         extract_sys = SystemMessage(content=("You are a rigorous cross-source summarizer. "
                                             "Your task is to extract ONLY the key, non-duplicated factors related to the user query "
                                             "from two sources in the JSON below: `factors_from_zhihu` and `factors_from_reddit`.\n\n"
@@ -294,7 +295,9 @@ def llm_node(state: AgentState) -> dict:
     sys = SystemMessage(content=("You are concise and helpful. "
                                 "do NOT repeat, quote, or paraphrase the summary in your reply unless explicitly asked. "
                                 "When the user asks for China universities' rankings/majors/admission or needs education information, "
-                                "call `db_retrieve(query, top_k)`.\n"
+                                "call `db_retrieve(query, top_k)`; to look up several such questions at once, "
+                                "call `db_retrieve_many(queries, top_k)`. When the user names a province or a time span, "
+                                "also pass `province` and/or `date_from` / `date_to` to narrow the search.\n"
                                 "When the user needs broader, recent info across the web, call `web_search(query)`.\n"
                                 "If a tool is used, ALWAYS read its ToolMessage and then produce a final answer."
                                 ))
@@ -4,6 +4,7 @@
 Agentic Planner System runtime
 """
 import sys
+import json
 import logging
 from pathlib import Path
 from typing import Annotated, Sequence, TypedDict, Literal, List
@@ -17,6 +18,7 @@ from langgraph.types import Command
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 from config import DB_PATH, DB_CHECKPOINTER_PATH
+from utils.metrics import METRICS
 from .db import DBManager
 from .nodes import (
     router_node, router, rewrite_node, analyze_node, planner_sys_node, 
@@ -66,7 +68,7 @@ graph.add_edge("planner_sys", END)
 
 
 def run_app():
-    print("\nAgentic Planner System activated successfully. [Type 'exit' or 'quit' to quit]\n")
+    print("\nAgentic Planner System activated successfully. [Type 'exit' or 'quit' to quit, '/stats' for runtime metrics]\n")
 
     # user selection
     while True:
@@ -175,6 +177,9 @@ def _run_cli_loop(app, user_id: int, thread_id: str):
             return
         if not user_input:
             continue
+        if user_input.lower() == "/stats":
+            print(json.dumps(METRICS.snapshot(), ensure_ascii=False, indent=2))
+            continue
 
         initial_state = {
                     "messages": [HumanMessage(content=user_input)],
@@ -14,7 +14,7 @@ sys.path.insert(0, str(project_root))
 
 
 from core.run_time import run_app
-from config.config import get_config_summary
+from config.config import get_config_summary, RETRIEVE_WARMUP
 
 logging.basicConfig(
     level=logging.INFO,
@@ -65,6 +65,11 @@ def main():
     for key, value in config.items():
         logger.info(f"{key}: {value}")
 
+    # load embedder / reranker / indexes while the user is still picking a thread
+    if RETRIEVE_WARMUP:
+        from utils.retrieve import warm_up
+        warm_up(background=True)
+
     # launching the system
     try:
         logger.info("System initializing...")
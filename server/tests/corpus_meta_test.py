@@ -0,0 +1,49 @@
+# server/tests/corpus_meta_test.py
+# date bounds of the db_retrieve filter: separators, single-digit parts, and dates that do not exist.
+#   cd server && python -m pytest tests/corpus_meta_test.py -q
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from utils.corpus_meta import parse_date_bound, ChunkFilter
+
+
+@pytest.mark.parametrize("value, lower, upper", [
+    ("2024", 20240101, 20241231),
+    ("2024-02", 20240201, 20240229),
+    ("2023-02", 20230201, 20230228),
+    ("2024-2", 20240201, 20240229),
+    ("2024-2-5", 20240205, 20240205),
+    ("2024/02/05", 20240205, 20240205),
+    ("2024.2.5", 20240205, 20240205),
+    ("20240205", 20240205, 20240205),
+    ("202411", 20241101, 20241130),
+    ("2024年", 20240101, 20241231),
+    ("2024年2月", 20240201, 20240229),
+    ("2024年2月5日", 20240205, 20240205),
+    (" 2024-12-31 ", 20241231, 20241231),
+])
+def test_date_bounds(value, lower, upper):
+    assert parse_date_bound(value) == lower
+    assert parse_date_bound(value, upper=True) == upper
+
+
+@pytest.mark.parametrize("value", [
+    "2024-13", "2024-0", "2024-02-30", "2023-02-29", "2024-04-31", "20241301", "2024-2-5-1",
+    "24-02", "2024-002", "last year", "",
+])
+def test_bad_dates(value):
+    with pytest.raises(ValueError):
+        parse_date_bound(value)
+
+
+def test_filter_range():
+    flt = ChunkFilter.parse(province="江苏省", date_from="2024-2", date_to="2024年2月")
+    assert (flt.province, flt.date_from, flt.date_to) == ("江苏", 20240201, 20240229)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -1,26 +1,43 @@
 # server/tests/quick_test.py
+# test_replayed_search runs the recorded questions in tests/cassettes offline, without the translator
+# or any credentials (see tests/search_load_test.py for recording them); with SEARCH_HTTP_MODE=replay
+# the script runs it instead of the live search
 
+import os
 import sys
 import json
+import subprocess
 from pathlib import Path
 from typing import Dict, Any
+
+import pytest
 from tavily import TavilyClient
 from langchain_core.messages import SystemMessage
 from langchain_openai import ChatOpenAI
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 from utils import search
-from config import SIDE_MODEL, TAVILY_API_KEY
+from config import SIDE_MODEL, TAVILY_API_KEY, SEARCH_HTTP_MODE
 
-SIDE_LLM = ChatOpenAI(model=SIDE_MODEL, temperature=0)
+SERVER_ROOT = Path(__file__).resolve().parents[1]
+CASSETTE_DIR = Path(__file__).resolve().parent / "cassettes"
+REPLAY_SNIPPET = """
+import json
+from utils import search
+outs = [json.loads(search.advan_web_search.invoke({{"cn_query": cn, "en_query": en}})) for cn, en in {pairs!r}]
+print(json.dumps(outs, ensure_ascii=False))
+"""
 
 
 def test_search(query: str):
+    if SEARCH_HTTP_MODE == "replay":
+        test_replayed_search()
+        return
     trans_prompt = ("You are a bilingual translator; input is a user query; output EXACTLY "
                     "'<Chinese translation> ### <English translation>'; preserve meaning; no extra text/explanations.\n\n"
                     f"The query:\n{query}")
     sys_msg = SystemMessage(content=trans_prompt)
-    res = SIDE_LLM.invoke([sys_msg])
+    res = ChatOpenAI(model=SIDE_MODEL, temperature=0).invoke([sys_msg])
     print(f"The res is: {res.content}")
 
     parts = [p.strip() for p in res.content.split("###", 1)]
@@ -34,6 +51,31 @@ def test_search(query: str):
     print(json.dumps(json.loads(out), ensure_ascii=False, indent=2))
 
 
+def test_replayed_search():
+    manifest = CASSETTE_DIR / "queries.json"
+    if not manifest.exists():
+        pytest.skip(f"no recorded questions in {CASSETTE_DIR}")
+    pairs = json.loads(manifest.read_text(encoding="utf-8"))
+    # config reads the mode at import time, so the replay gets a fresh interpreter with it forced:
+    # whatever the environment says, nothing here reaches the live APIs
+    env = {
+        **os.environ,
+        "SEARCH_HTTP_MODE": "replay",
+        "SEARCH_CASSETTE_DIR": str(CASSETTE_DIR),
+        "SEARCH_CACHE_MAX": "0",
+        "SEARCH_REPLAY_LATENCY": "tavily=0,zhihu=0,reddit=0",
+    }
+    done = subprocess.run(
+        [sys.executable, "-c", REPLAY_SNIPPET.format(pairs=pairs)],
+        cwd=SERVER_ROOT, env=env, capture_output=True, text=True, timeout=300,
+    )
+    assert done.returncode == 0, done.stderr
+    for (cn_query, _), out in zip(pairs, json.loads(done.stdout.strip().splitlines()[-1])):
+        print(json.dumps(out, ensure_ascii=False, indent=2))
+        assert out["factors_from_zhihu"] or out["factors_from_reddit"], f"nothing replayed for {cn_query!r}"
+        assert "incomplete" not in out, out["incomplete"]
+
+
 if __name__ == "__main__":
     test_search("近视手术安全么")
 
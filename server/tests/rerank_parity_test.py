@@ -0,0 +1,63 @@
+# server/tests/rerank_parity_test.py
+# parity between the PyTorch (sentence_transformers) and int8 ONNX reranker backends.
+# export first:  cd server && python -m utils.rerank export
+
+import sys
+import glob
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import RERANKER_MODEL, RERANKER_ONNX_DIR, RERANKER_THREADS
+from utils.rerank import OnnxCrossEncoder, QUANTIZED_FILE, ONNX_FILE
+from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+
+DOCS_DIR = Path(__file__).resolve().parents[1] / "data" / "education"
+QUERIES = ["江苏610分，985还是211怎么选？", "想学医应该报哪些学校", "电子信息专业就业怎么样"]
+
+MAX_ABS_DIFF = 0.05  # on the model's relevance scores
+MIN_TOP5_OVERLAP = 4  # of the torch top-5 per query, how many the int8 model must keep
+
+
+def _sample_pairs(n_passages: int = 20):
+    passages = []
+    for path in sorted(glob.glob(str(DOCS_DIR / "*.txt")))[:n_passages]:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            passages.append(f.read()[:400])
+    return [(q, p) for q in QUERIES for p in passages]
+
+
+def test_onnx_matches_torch():
+    if not any((RERANKER_ONNX_DIR / name).exists() for name in (QUANTIZED_FILE, ONNX_FILE)):
+        pytest.skip(f"no exported model under {RERANKER_ONNX_DIR} (python -m utils.rerank export)")
+
+    pairs = _sample_pairs()
+    torch_ce = HuggingFaceCrossEncoder(model_name=RERANKER_MODEL)
+    onnx_ce = OnnxCrossEncoder(str(RERANKER_ONNX_DIR), intra_op_threads=RERANKER_THREADS)
+
+    t0 = time.perf_counter()
+    ref = np.asarray(list(torch_ce.score(pairs)), dtype=np.float32)
+    t1 = time.perf_counter()
+    got = np.asarray(onnx_ce.score(pairs), dtype=np.float32)
+    t2 = time.perf_counter()
+    print(f"torch {t1 - t0:.2f}s | onnx ({Path(onnx_ce.model_path).name}) {t2 - t1:.2f}s | {len(pairs)} pairs")
+
+    diff = float(np.abs(ref - got).max())
+    print(f"max |torch - onnx| = {diff:.4f}")
+    assert diff < MAX_ABS_DIFF, f"max |torch - onnx| = {diff:.4f} exceeds {MAX_ABS_DIFF}"
+
+    # reranking only needs the order to survive quantization
+    per_query = len(pairs) // len(QUERIES)
+    for i, query in enumerate(QUERIES):
+        sl = slice(i * per_query, (i + 1) * per_query)
+        top_ref = set(np.argsort(-ref[sl])[:5])
+        top_got = set(np.argsort(-got[sl])[:5])
+        print(f"{query}: top-5 overlap {len(top_ref & top_got)}/5")
+        assert len(top_ref & top_got) >= MIN_TOP5_OVERLAP, f"{query}: top-5 overlap {len(top_ref & top_got)}/5"
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q", "-s", "-rs"]))
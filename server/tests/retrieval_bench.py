@@ -0,0 +1,216 @@
+# server/tests/retrieval_bench.py
+# offline latency / quality benchmark of the db_retrieve pipeline over data/education.
+# runs without network: the deterministic hashing embedder stands in for the OpenAI model (or pick a
+# cached local model with --embedding local), every index is built in a scratch directory, and the
+# reranker is used only if it is already in the local HF cache.
+# the embedding filter uses the backend's own threshold, so "final" quality under the hashing embedder
+# is only meaningful run-to-run; "fused" / "reranked" quality is comparable to production.
+#
+#   cd server && python tests/retrieval_bench.py --out bench.json [--baseline old.json]
+
+import os
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+os.environ.setdefault("OPENAI_API_KEY", "offline")
+
+import re
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from utils import retrieve
+from utils.emb_cache import CachedEmbeddings
+from utils.rerank import RerankScoreCache
+from utils.metrics import MetricsRegistry
+from utils.embeddings import parse_spec, build_embeddings
+
+KS = (1, 5, 10)
+STAGES = ("dense", "sparse", "rrf", "rerank", "filter", "total")
+
+
+class Passthrough:
+    """stand-in when the cross-encoder is not cached locally; keeps the fused order"""
+
+    def compress_documents(self, documents, query):
+        return list(documents)[:50]
+
+    def compress_many(self, requests, stats=None):
+        return [self.compress_documents(docs, query) for query, docs in requests]
+
+
+def labelled_queries(docs_dir: str) -> List[Dict[str, str]]:
+    """
+    one query per file, from its title: the date prefix and the "专家" framing are dropped
+    "20240205_专家，江苏610分，苏大和985怎么选？.txt" -> "江苏610分，苏大和985怎么选"
+    """
+    queries = []
+    for path in sorted(Path(docs_dir).glob("*.txt")):
+        title = path.stem.split("_", 1)[-1]
+        parts = [p for p in re.split(r"[，,！!？?：:。]", title) if p.strip() and "专家" not in p]
+        query = "，".join(parts) or title
+        queries.append({"query": query, "rel_path": path.name})
+    return queries
+
+
+def rss_mb() -> float:
+    """peak resident set size so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def dir_mb(path: str) -> float:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file()) / (1024 * 1024)
+
+
+def isolate(workdir: str, embedding: str) -> str:
+    """point every index and cache of the retrieve module at a scratch directory"""
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    retrieve.CHROMA_DIR = os.path.join(workdir, "retriever.db")
+    retrieve.BM25_DIR = os.path.join(workdir, "bm25_index")
+    retrieve.VECTOR_DIR = os.path.join(workdir, "vector_index")
+    retrieve.INGEST_DB = os.path.join(workdir, "ingest.db")
+    retrieve._STORE = None
+    spec = parse_spec(embedding)
+    retrieve._EMB = CachedEmbeddings(build_embeddings(spec), model=spec.cache_key, db_path=os.path.join(workdir, "emb.db"))
+    # chunk boundaries must not depend on the stand-in embedder
+    retrieve._SPLITTER = RecursiveCharacterTextSplitter(chunk_size=retrieve.CHUNK_SIZE, chunk_overlap=retrieve.CHUNK_OVERLAP)
+    retrieve._USE_SEMANTIC = False
+    retrieve.RERANK_CACHE = RerankScoreCache(model="bench")
+    retrieve.RESULT_CACHE.max_entries = 0
+    retrieve.FILTER_THRESHOLD = spec.filter_threshold
+    return spec.cache_key
+
+
+def load_reranker(enabled: bool) -> str:
+    if enabled:
+        try:
+            retrieve.get_reranker()
+            return f"{retrieve.RERANKER_BACKEND}:{retrieve.RERANKER_MODEL}"
+        except Exception as e:
+            print(f"reranker unavailable offline ({type(e).__name__}), rerank stage is a passthrough", file=sys.stderr)
+    retrieve._RERANKER = Passthrough()
+    return "none"
+
+
+def first_hit(docs, rel_path: str) -> int:
+    """1-based rank of the first chunk from the labelled file (or collapsed with one of its chunks), 0 if absent"""
+    for rank, d in enumerate(docs, start=1):
+        if d.metadata.get("source") == rel_path or rel_path in d.metadata.get("sources", ()):
+            return rank
+    return 0
+
+
+def quality(ranks: List[int]) -> Dict[str, float]:
+    n = len(ranks) or 1
+    out = {f"recall@{k}": sum(1 for r in ranks if 0 < r <= k) / n for k in KS}
+    out["mrr"] = sum(1.0 / r for r in ranks if r) / n
+    return out
+
+
+def run(args) -> Dict:
+    workdir = args.workdir or tempfile.mkdtemp(prefix="retrieval_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    embedding = isolate(workdir, args.embedding)
+    memory = {"after_import": rss_mb()}
+
+    t0 = time.perf_counter()
+    stats = retrieve.ingest_corpus(workers=1)
+    ingest_s = time.perf_counter() - t0
+    reranker = load_reranker(not args.no_rerank)
+    memory["after_index"] = rss_mb()
+
+    queries = labelled_queries(retrieve.DOCS_DIR)[: args.limit or None]
+    top_k = max(KS)
+    timings = MetricsRegistry(window=len(queries) * args.passes + 1)
+    ranks = {"fused": [], "reranked": [], "final": []}
+
+    for p in range(args.passes):
+        for item in queries:
+            q = item["query"]
+            start = time.perf_counter()
+            with timings.timer("dense"):
+                query_vec, dense = retrieve._dense_leg(q, max(20, top_k))
+            with timings.timer("sparse"):
+                sparse = retrieve._sparse_leg(q, max(50, top_k))
+            with timings.timer("rrf"):
+                fused = retrieve._rrf_fuse({"dense": dense, "sparse": sparse}, k=max(50, top_k))
+            with timings.timer("rerank"):
+                reranked = retrieve._rerank(q, fused)
+            with timings.timer("filter"):
+                final = retrieve._select(reranked, query_vec, top_k)
+            timings.observe("total", (time.perf_counter() - start) * 1000)
+
+            if p == 0:
+                ranks["fused"].append(first_hit(fused, item["rel_path"]))
+                ranks["reranked"].append(first_hit(reranked, item["rel_path"]))
+                ranks["final"].append(first_hit(final, item["rel_path"]))
+    memory["after_queries"] = rss_mb()
+
+    summaries = timings.snapshot()["summaries"]
+    return {
+        "setup": {
+            "embedding": embedding,
+            "vector_backend": retrieve.VECTOR_BACKEND,
+            "reranker": reranker,
+            "sparse_tokenizer": retrieve._BM25.tokenizer_name,
+            "queries": len(queries),
+            "passes": args.passes,
+            "top_k": top_k,
+        },
+        "corpus": {
+            "files": stats.files_total,
+            "chunks": stats.chunks,
+            "near_duplicates": stats.duplicates,
+            "ingest_s": round(ingest_s, 3),
+            "vector_mb": round(dir_mb(retrieve.CHROMA_DIR if retrieve.VECTOR_BACKEND == "chroma" else retrieve.VECTOR_DIR), 2),
+            "bm25_mb": round(dir_mb(retrieve.BM25_DIR), 2),
+        },
+        "memory_peak_rss_mb": {k: round(v, 1) for k, v in memory.items()},
+        "latency_ms": {
+            stage: {k: round(v, 3) for k, v in summaries[stage].items() if k != "count"} for stage in STAGES
+        },
+        "quality": {stage: {k: round(v, 4) for k, v in quality(r).items()} for stage, r in ranks.items()},
+    }
+
+
+def compare(report: Dict, baseline: Dict) -> None:
+    """print p50/p95 latency and final-stage quality against a previous report"""
+    for stage in STAGES:
+        for pct in ("p50", "p95"):
+            old, new = baseline["latency_ms"][stage][pct], report["latency_ms"][stage][pct]
+            print(f"{stage:>7} {pct}: {old:9.3f} -> {new:9.3f} ms ({(new - old) / old * 100 if old else 0:+.1f}%)")
+    for metric, new in report["quality"]["final"].items():
+        old = baseline["quality"]["final"][metric]
+        print(f"{metric:>10}: {old:.4f} -> {new:.4f} ({new - old:+.4f})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline db_retrieve latency / quality benchmark")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--baseline", help="previous JSON report to diff against")
+    parser.add_argument("--passes", type=int, default=1, help="query passes; later passes run on warm caches")
+    parser.add_argument("--limit", type=int, default=0, help="use only the first N labelled queries")
+    parser.add_argument("--embedding", default="hashing", help="EMB_MODEL-style spec, e.g. hashing | local:BAAI/bge-small-zh-v1.5")
+    parser.add_argument("--no-rerank", action="store_true", help="skip the cross-encoder even if it is cached")
+    parser.add_argument("--workdir", help="scratch directory for indexes (default: a new temp dir)")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+    if args.baseline:
+        compare(report, json.loads(Path(args.baseline).read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
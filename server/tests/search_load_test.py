@@ -0,0 +1,135 @@
+# server/tests/search_load_test.py
+# deterministic offline load test of advan_web_search. `record` runs the questions once against the
+# live Tavily / Zhihu / Reddit APIs and captures every response into cassettes (credentials needed);
+# `load` replays them from the in-process stand-in server with injected latency, so a change to the
+# search path can be measured without credentials, network or rate limits. the search response
+# cache is off during both, so every call reaches the HTTP layer.
+#
+#   cd server && python tests/search_load_test.py record --query "近视手术安全么 ### Is LASIK surgery safe?"
+#   cd server && python tests/search_load_test.py load --concurrency 8 --requests 64 [--latency tavily=0.8,zhihu=0.3,reddit=0.4]
+
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent import futures
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+MANIFEST = "queries.json"
+DEFAULT_QUERIES = ["近视手术安全么 ### Is LASIK eye surgery safe?"]
+
+
+def _setup(mode: str, args) -> None:
+    # config reads these at import time
+    os.environ["SEARCH_HTTP_MODE"] = mode
+    os.environ["SEARCH_CACHE_MAX"] = "0"
+    if args.cassettes:
+        os.environ["SEARCH_CASSETTE_DIR"] = args.cassettes
+    if getattr(args, "latency", None) is not None:
+        os.environ["SEARCH_REPLAY_LATENCY"] = args.latency
+    if getattr(args, "jitter", None) is not None:
+        os.environ["SEARCH_REPLAY_JITTER"] = str(args.jitter)
+
+
+def _call(search, cn_query: str, en_query: str) -> Dict:
+    start = time.perf_counter()
+    out = json.loads(search.advan_web_search.invoke({"cn_query": cn_query, "en_query": en_query}))
+    return {
+        "latency_s": time.perf_counter() - start,
+        "zhihu": len(out["factors_from_zhihu"]),
+        "reddit": len(out["factors_from_reddit"]),
+        "incomplete": out.get("incomplete", {}),
+    }
+
+
+def record(args) -> None:
+    _setup("record", args)
+    from config import SEARCH_CASSETTE_DIR
+    from utils import search
+
+    pairs = [[p.strip() for p in q.split("###", 1)] for q in (args.query or DEFAULT_QUERIES)]
+    manifest = SEARCH_CASSETTE_DIR / MANIFEST
+    known: List[List[str]] = json.loads(manifest.read_text(encoding="utf-8")) if manifest.exists() else []
+    for cn_query, en_query in pairs:
+        result = _call(search, cn_query, en_query)
+        print(f"recorded {cn_query!r} / {en_query!r}: {json.dumps(result, ensure_ascii=False)}", file=sys.stderr)
+        if result["incomplete"]:
+            print("  incomplete: replaying this question will be incomplete as well", file=sys.stderr)
+        if [cn_query, en_query] not in known:
+            known.append([cn_query, en_query])
+    SEARCH_CASSETTE_DIR.mkdir(parents=True, exist_ok=True)
+    manifest.write_text(json.dumps(known, ensure_ascii=False, indent=1), encoding="utf-8")
+
+
+def load(args) -> Dict:
+    _setup("replay", args)
+    from config import SEARCH_CASSETTE_DIR, SEARCH_REPLAY_LATENCY, SEARCH_REPLAY_JITTER
+    from utils import search
+    from utils.clients import stand_in
+    from utils.metrics import METRICS
+
+    manifest = SEARCH_CASSETTE_DIR / MANIFEST
+    if not manifest.exists():
+        sys.exit(f"no {manifest}: record some questions first (python tests/search_load_test.py record)")
+    pairs = json.loads(manifest.read_text(encoding="utf-8"))
+
+    stand_in()
+    wall = time.perf_counter()
+    with futures.ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        calls = [pool.submit(_call, search, *pairs[i % len(pairs)]) for i in range(args.requests)]
+        results = [c.result() for c in calls]
+    wall = time.perf_counter() - wall
+
+    lat = np.asarray([r["latency_s"] for r in results])
+    report = {
+        "setup": {
+            "questions": len(pairs), "requests": args.requests, "concurrency": args.concurrency,
+            "latency_s": SEARCH_REPLAY_LATENCY, "jitter": SEARCH_REPLAY_JITTER,
+        },
+        "latency_s": {p: round(float(np.percentile(lat, q)), 3) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "throughput_rps": round(len(results) / wall, 2),
+        "wall_s": round(wall, 2),
+        "incomplete": sum(1 for r in results if r["incomplete"]),
+        "metrics": {k: v for k, v in METRICS.snapshot().items() if k in ("http_stand_in", "reddit_clients")},
+    }
+    print(
+        f"{args.requests} calls x{args.concurrency}: p50 {report['latency_s']['p50']:.3f}s | p95 {report['latency_s']['p95']:.3f}s | "
+        f"{report['throughput_rps']} calls/s | incomplete {report['incomplete']} | "
+        f"unmatched requests {report['metrics']['http_stand_in']['unmatched']}",
+        file=sys.stderr,
+    )
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="record / replay load test of advan_web_search")
+    parser.add_argument("--cassettes", help="cassette directory (default: SEARCH_CASSETTE_DIR)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rec = sub.add_parser("record", help="call the live APIs and capture the responses")
+    rec.add_argument("--query", action="append", help="'<Chinese query> ### <English query>', repeatable")
+    rep = sub.add_parser("load", help="replay the cassettes concurrently")
+    rep.add_argument("--concurrency", type=int, default=8)
+    rep.add_argument("--requests", type=int, default=64)
+    rep.add_argument("--latency", help="injected seconds per upstream, e.g. tavily=0.8,zhihu=0.3,reddit=0.4")
+    rep.add_argument("--jitter", type=float, help="latency varies by +- this fraction of itself")
+    rep.add_argument("--out", help="write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args)
+        return
+    text = json.dumps(load(args), indent=2, ensure_ascii=False)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
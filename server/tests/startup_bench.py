@@ -0,0 +1,55 @@
+# server/tests/startup_bench.py
+# startup cost of the server: import time of core.nodes and latency of the first db_retrieve,
+# each measured in a fresh interpreter so module caches don't hide anything.
+
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+SERVER_ROOT = Path(__file__).resolve().parents[1]
+QUERY = "江苏610分，985还是211怎么选？"
+
+IMPORT_SNIPPET = """
+import time, json
+t0 = time.perf_counter()
+import core.nodes
+print(json.dumps({"import_core_nodes_s": time.perf_counter() - t0}))
+"""
+
+FIRST_QUERY_SNIPPET = """
+import time, json
+t0 = time.perf_counter()
+from utils.retrieve import db_retrieve, warm_up
+t1 = time.perf_counter()
+if {warm}:
+    warm_up(background=False)
+t2 = time.perf_counter()
+db_retrieve.invoke({{"query": {query!r}, "top_k": 5}})
+t3 = time.perf_counter()
+db_retrieve.invoke({{"query": {query!r}, "top_k": 5}})
+t4 = time.perf_counter()
+print(json.dumps({{"import_s": t1 - t0, "warm_up_s": t2 - t1, "first_query_s": t3 - t2, "second_query_s": t4 - t3}}))
+"""
+
+
+def _run(snippet: str) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", snippet], cwd=SERVER_ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def test_startup(repeat: int = 3):
+    imports = [_run(IMPORT_SNIPPET)["import_core_nodes_s"] for _ in range(repeat)]
+    report = {
+        "import_core_nodes_s": {"min": min(imports), "max": max(imports)},
+        "lazy_first_query": _run(FIRST_QUERY_SNIPPET.format(warm=False, query=QUERY)),
+        "warmed_first_query": _run(FIRST_QUERY_SNIPPET.format(warm=True, query=QUERY)),
+    }
+    print(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    test_startup()
@@ -0,0 +1,182 @@
+# server/tests/vector_bench.py
+# query latency, peak memory and recall of the vector store backends on the same vectors:
+# Chroma vs the in-process int8 index (VECTOR_BACKEND=local), flat and with an HNSW graph.
+# the vectors are synthetic and clustered, so any corpus size can be tried offline; every
+# backend is built in one process and queried in a fresh one, so the reported RSS is what
+# serving from that backend costs on its own.
+#
+#   cd server && python tests/vector_bench.py --n 20000 --dim 1024 [--out vector_bench.json]
+
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import tempfile
+import subprocess
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+BACKENDS = ("chroma", "local", "local-hnsw")
+CHROMA_BATCH = 4000
+
+
+def _proc_status_mb(field: str) -> float:
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def rss_mb() -> float:
+    """peak resident set size of this process so far"""
+    # ru_maxrss survives exec, so a child would report the parent's peak; VmHWM does not
+    peak = _proc_status_mb("VmHWM")
+    if peak:
+        return peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def anon_mb() -> float:
+    """resident memory that is not file-backed: mmapped index pages are page cache the kernel can drop"""
+    return _proc_status_mb("RssAnon")
+
+
+def dir_mb(path: str) -> float:
+    return sum(f.stat().st_size for f in Path(path).rglob("*") if f.is_file()) / (1024 * 1024)
+
+
+def make_data(workdir: str, n: int, dim: int, n_queries: int, k: int, seed: int = 0) -> None:
+    """clustered unit vectors, queries near random corpus vectors, exact top-k as ground truth"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 100), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.5 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.integers(0, n, n_queries)] + 0.3 * rng.standard_normal((n_queries, dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    np.save(os.path.join(workdir, "vectors.npy"), vectors)
+    np.save(os.path.join(workdir, "queries.npy"), queries)
+    np.save(os.path.join(workdir, "truth.npy"), truth)
+
+
+def open_store(backend: str, workdir: str, n: int):
+    path = os.path.join(workdir, backend)
+    if backend == "chroma":
+        from langchain_chroma.vectorstores import Chroma
+        return Chroma(collection_name="bench", persist_directory=path, embedding_function=None)
+    from utils.vector_index import LocalVectorStore
+    return LocalVectorStore(path, embedding_function=None, hnsw_threshold=n if backend == "local-hnsw" else n + 1)
+
+
+def build(backend: str, workdir: str) -> Dict:
+    vectors = np.load(os.path.join(workdir, "vectors.npy"))
+    ids = [f"doc{i}" for i in range(len(vectors))]
+    texts = [f"document {i}" for i in range(len(vectors))]
+    store = open_store(backend, workdir, len(vectors))
+    start = time.perf_counter()
+    if backend == "chroma":
+        for s in range(0, len(ids), CHROMA_BATCH):
+            store._collection.add(ids=ids[s:s + CHROMA_BATCH], embeddings=vectors[s:s + CHROMA_BATCH], documents=texts[s:s + CHROMA_BATCH])
+    else:
+        store.add_vectors(ids, vectors, texts, [{} for _ in ids])
+        store.flush(generation=1)
+    return {"build_s": round(time.perf_counter() - start, 3), "disk_mb": round(dir_mb(os.path.join(workdir, backend)), 2)}
+
+
+def query(backend: str, workdir: str, k: int) -> Dict:
+    memory = {"after_import": 0.0, "after_open": 0.0, "after_queries": 0.0}
+    queries = np.load(os.path.join(workdir, "queries.npy"))
+    truth = np.load(os.path.join(workdir, "truth.npy"))
+    n = len(np.load(os.path.join(workdir, "vectors.npy"), mmap_mode="r"))
+    if backend == "chroma":
+        from langchain_chroma.vectorstores import Chroma  # noqa: F401  (import cost is not serving cost)
+    else:
+        from utils.vector_index import LocalVectorStore  # noqa: F401
+    memory["after_import"] = rss_mb()
+    store = open_store(backend, workdir, n)
+    memory["after_open"] = rss_mb()
+
+    latencies: List[float] = []
+    recalls: List[float] = []
+    for q, expected in zip(queries, truth):
+        start = time.perf_counter()
+        docs = store.similarity_search_by_vector(q.tolist(), k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        got = {int(d.id[3:]) for d in docs}
+        recalls.append(len(got & set(expected[:k].tolist())) / k)
+    memory["after_queries"] = rss_mb()
+
+    lat = np.asarray(latencies[1:] or latencies)  # first query pays for lazy loading
+    return {
+        "latency_ms": {p: round(float(np.percentile(lat, q)), 3) for p, q in (("p50", 50), ("p95", 95), ("p99", 99))},
+        "first_query_ms": round(latencies[0], 3),
+        f"recall@{k}": round(float(np.mean(recalls)), 4),
+        "peak_rss_mb": {key: round(v, 1) for key, v in memory.items()},
+        "anon_rss_mb": round(anon_mb(), 1),
+    }
+
+
+def child(args) -> None:
+    out = build(args.child, args.workdir) if args.phase == "build" else query(args.child, args.workdir, args.k)
+    print(json.dumps(out))
+
+
+def run_child(backend: str, phase: str, args) -> Dict:
+    cmd = [sys.executable, __file__, "--child", backend, "--phase", phase, "--workdir", args.workdir, "--k", str(args.k)]
+    done = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chroma vs in-process int8 / HNSW vector index")
+    parser.add_argument("--n", type=int, default=20000, help="corpus vectors")
+    parser.add_argument("--dim", type=int, default=1024, help="vector dimension (text-embedding-3-large: 3072)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20, help="neighbours per query (the dense leg asks for 20)")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help=f"comma-separated subset of {BACKENDS}")
+    parser.add_argument("--out", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--workdir", help="scratch directory (default: a new temp dir)")
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--phase", choices=("build", "query"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    args.workdir = args.workdir or tempfile.mkdtemp(prefix="vector_bench_")
+    os.makedirs(args.workdir, exist_ok=True)
+    make_data(args.workdir, args.n, args.dim, args.queries, args.k)
+    report = {"setup": {"n": args.n, "dim": args.dim, "queries": args.queries, "k": args.k}, "backends": {}}
+    for backend in args.backends.split(","):
+        result = run_child(backend, "build", args)
+        result.update(run_child(backend, "query", args))
+        report["backends"][backend] = result
+        print(
+            f"{backend:>10}: p50 {result['latency_ms']['p50']:8.3f} ms | p95 {result['latency_ms']['p95']:8.3f} ms | "
+            f"recall@{args.k} {result[f'recall@{args.k}']:.3f} | peak RSS {result['peak_rss_mb']['after_queries']:7.1f} MB "
+            f"(anon {result['anon_rss_mb']:7.1f} MB) | "
+            f"disk {result['disk_mb']:7.1f} MB | build {result['build_s']:.1f}s",
+            file=sys.stderr,
+        )
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text, encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
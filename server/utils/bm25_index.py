@@ -0,0 +1,235 @@
+import os
+import json
+import shutil
+import bisect
+import logging
+from collections import Counter
+from typing import List, Tuple, Optional, Sequence
+
+import numpy as np
+from scipy import sparse
+
+from utils.cjk_tokenizer import TOKENIZERS, resolve_tokenizer
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "CURRENT"
+
+
+class StringTable(Sequence):
+    """read-only sorted/unsorted string list backed by a utf-8 blob + offsets, mmap friendly"""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    @staticmethod
+    def encode(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8) if encoded else np.zeros(0, dtype=np.uint8)
+        return blob, offsets
+
+
+class BM25Index:
+    """
+    Okapi BM25 over a prebuilt inverted index.
+    the full BM25 term weight idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)) is
+    precomputed at build time and stored as a sparse doc x term matrix in CSC layout
+    (indptr / doc rows / weights), each part a .npy file that is memory-mapped on open,
+    so worker processes start instantly and share the page cache.
+    scoring a query is then a single sparse matrix-vector product.
+    """
+
+    def __init__(self, path: str, mmap: bool = True):
+        mode = "r" if mmap else None
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mode)
+
+        self.path = path
+        self.generation: int = int(self.meta["generation"])
+        self.tokenizer_name: str = self.meta["tokenizer"]
+        self.tokenizer = TOKENIZERS[self.tokenizer_name]
+        self.vocab = StringTable(load("vocab_blob"), load("vocab_offsets"))
+        self.chunk_ids = StringTable(load("ids_blob"), load("ids_offsets"))
+        self.matrix = sparse.csc_matrix(
+            (load("weights"), load("rows"), load("indptr")),
+            shape=(int(self.meta["n_docs"]), int(self.meta["n_terms"])),
+            copy=False,
+        )
+        self._row_of: Optional[dict] = None  # chunk_id -> row, built on the first filtered search
+
+    @property
+    def n_docs(self) -> int:
+        return self.matrix.shape[0]
+
+    @classmethod
+    def open(cls, root: str) -> Optional["BM25Index"]:
+        """open the current build under root, or None if there is none"""
+        try:
+            with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+                name = f.read().strip()
+            return cls(os.path.join(root, name))
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug(f"No usable BM25 index under {root}: {e}")
+            return None
+
+    @classmethod
+    def build(
+        cls,
+        root: str,
+        docs: List[Tuple[str, str]],
+        generation: int,
+        tokenizer: str = "bigram",
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25,
+    ) -> "BM25Index":
+        """
+        build the index for (chunk_id, text) pairs and atomically make it current
+        idf follows rank_bm25.BM25Okapi, including the epsilon floor for negative idf
+        """
+        tokenizer = resolve_tokenizer(tokenizer)
+        tokenize = TOKENIZERS[tokenizer]
+        os.makedirs(root, exist_ok=True)
+        name = f"gen_{generation}_{os.getpid()}"
+        path = os.path.join(root, name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+        vocab: dict = {}
+        rows, cols, vals = [], [], []
+        doc_len = np.zeros(len(docs), dtype=np.float32)
+        for row, (_, text) in enumerate(docs):
+            tokens = tokenize(text)
+            doc_len[row] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                cols.append(vocab.setdefault(term, len(vocab)))
+                rows.append(row)
+                vals.append(tf)
+
+        # renumber terms in sorted order so lookups can bisect the mmapped vocab
+        terms = sorted(vocab)
+        remap = np.empty(len(vocab), dtype=np.int64)
+        for new_id, term in enumerate(terms):
+            remap[vocab[term]] = new_id
+        term_ids = remap[np.asarray(cols, dtype=np.int64)] if cols else np.zeros(0, dtype=np.int64)
+
+        order = np.argsort(term_ids, kind="stable")
+        term_ids = term_ids[order]
+        doc_rows = np.asarray(rows, dtype=np.int32)[order]
+        tf = np.asarray(vals, dtype=np.float32)[order]
+        df = np.bincount(term_ids, minlength=len(terms))
+        indptr = np.zeros(len(terms) + 1, dtype=np.int32)
+        indptr[1:] = np.cumsum(df)
+
+        n = len(docs)
+        idf = np.log(n - df + 0.5) - np.log(df + 0.5)
+        if len(idf):
+            idf[idf < 0] = epsilon * float(idf.mean())
+        avgdl = float(doc_len.mean()) if n else 0.0
+        norm = k1 * (1 - b + b * doc_len[doc_rows] / max(avgdl, 1e-9))
+        weights = (idf[term_ids] * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+        vocab_blob, vocab_offsets = StringTable.encode(terms)
+        ids_blob, ids_offsets = StringTable.encode([cid for cid, _ in docs])
+        arrays = {
+            "indptr": indptr, "rows": doc_rows, "weights": weights,
+            "vocab_blob": vocab_blob, "vocab_offsets": vocab_offsets,
+            "ids_blob": ids_blob, "ids_offsets": ids_offsets,
+        }
+        for key, arr in arrays.items():
+            np.save(os.path.join(path, f"{key}.npy"), arr)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "generation": generation,
+                "tokenizer": tokenizer,
+                "k1": k1,
+                "b": b,
+                "avgdl": avgdl,
+                "n_docs": n,
+                "n_terms": len(terms),
+            }, f)
+
+        tmp = os.path.join(root, CURRENT_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(tmp, os.path.join(root, CURRENT_FILE))
+        cls._drop_old_builds(root, keep=name)
+
+        logger.info(f"BM25 index built: {n} docs, {len(terms)} terms (generation {generation})")
+        return cls(path)
+
+    def search(self, query: str, k: int = 50, rows: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """top-k (chunk_id, score) with a positive score, best first; `rows` restricts scoring to those docs"""
+        return self.search_many([query], k=k, rows=rows)[0]
+
+    def search_many(
+        self, queries: List[str], k: int = 50, rows: Optional[np.ndarray] = None
+    ) -> List[List[Tuple[str, float]]]:
+        """search() for several queries with one sparse matrix product (docs x queries)"""
+        if not self.n_docs or not queries or (rows is not None and not len(rows)):
+            return [[] for _ in queries]
+        q = sparse.hstack([self.query_vector(query) for query in queries], format="csc")
+        if not q.nnz:
+            return [[] for _ in queries]
+        scores = self._scores(q, rows)
+        return [self._top_k(scores[:, j], k, rows) for j in range(len(queries))]
+
+    def rows_for(self, chunk_ids: List[str]) -> np.ndarray:
+        """sorted matrix rows of the given chunk ids; ids not in this build are skipped"""
+        if self._row_of is None:
+            self._row_of = {cid: i for i, cid in enumerate(self.chunk_ids)}
+        return np.asarray(sorted({self._row_of[cid] for cid in chunk_ids if cid in self._row_of}), dtype=np.int64)
+
+    def _scores(self, q: sparse.csc_matrix, rows: Optional[np.ndarray]) -> np.ndarray:
+        """
+        docs x queries scores. with `rows`, the query-term columns are cut out first and then only
+        those docs, so the work is bounded by the query postings and the filtered doc count.
+        """
+        if rows is None:
+            return np.asarray((self.matrix @ q).todense())
+        terms = np.unique(q.indices)
+        sub = self.matrix[:, terms][rows]
+        return np.asarray((sub @ q[terms]).todense())
+
+    def query_vector(self, query: str) -> sparse.csc_matrix:
+        """term-count column vector of a query; repeated terms count repeatedly, as in BM25Okapi"""
+        term_ids = [t for t in (self._term_id(tok) for tok in self.tokenizer(query)) if t is not None]
+        counts = np.ones(len(term_ids), dtype=np.float32)
+        return sparse.csc_matrix(
+            (counts, (term_ids, np.zeros(len(term_ids), dtype=np.int32))),
+            shape=(self.matrix.shape[1], 1),
+        )
+
+    def _top_k(self, scores: np.ndarray, k: int, rows: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """`scores[i]` belongs to row i, or to rows[i] when scoring was restricted"""
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        doc = (lambda i: int(i)) if rows is None else (lambda i: int(rows[i]))
+        return [(self.chunk_ids[doc(i)], float(scores[i])) for i in top if scores[i] > 0]
+
+    def _term_id(self, term: str) -> Optional[int]:
+        i = bisect.bisect_left(self.vocab, term)
+        if i < len(self.vocab) and self.vocab[i] == term:
+            return i
+        return None
+
+    @staticmethod
+    def _drop_old_builds(root: str, keep: str):
+        for name in os.listdir(root):
+            if name.startswith("gen_") and name != keep:
+                # open mmaps in other processes stay valid after unlink
+                shutil.rmtree(os.path.join(root, name), ignore_errors=True)
@@ -0,0 +1,81 @@
+import re
+import logging
+import unicodedata
+from functools import lru_cache
+from typing import Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# CJK unified ideographs (+ ext A) vs. latin letters / digits; everything else is a separator
+_RUN_RE = re.compile(r"[㐀-䶿一-鿿]+|[a-z0-9]+(?:[.'][a-z0-9]+)*")
+_CJK_RE = re.compile(r"[㐀-䶿一-鿿]")
+
+
+def normalize(text: str) -> str:
+    """full-width -> half-width, lower case"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def normalize_query(text: str) -> str:
+    """
+    punctuation / spacing / width insensitive form of a query, used for cache keys:
+    "江苏610分，985还是211？" and "江苏610分 985还是211" both become "江苏 610 分 985 还是 211".
+    text the runs do not cover (kana, Hangul, emoji) keeps its NFKC form, so such queries do not collide
+    """
+    text = normalize(text)
+    if any(ch.isalnum() or unicodedata.category(ch) == "So" for ch in _RUN_RE.sub("", text)):
+        return " ".join(text.split())
+    return " ".join(_RUN_RE.findall(text))
+
+
+def bigram_tokenize(text: str) -> List[str]:
+    """
+    CJK runs become overlapping character bigrams (a lone character stays a unigram),
+    latin/digit runs stay whole words, punctuation is dropped:
+    "江苏考生610分，苏大和985" -> ["江苏", "苏考", "考生", "610", "分", "苏大", "大和", "985"]
+    """
+    tokens: List[str] = []
+    for run in _RUN_RE.findall(normalize(text)):
+        if not _CJK_RE.match(run):
+            tokens.append(run)
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+@lru_cache(maxsize=1)
+def _jieba():
+    import jieba  # optional dependency
+    jieba.setLogLevel(logging.WARNING)
+    return jieba
+
+
+def jieba_tokenize(text: str) -> List[str]:
+    """character bigrams plus dictionary words from jieba's search-mode segmentation"""
+    tokens = bigram_tokenize(text)
+    for word in _jieba().cut_for_search(normalize(text)):
+        if len(word) > 2 and _CJK_RE.match(word):
+            tokens.append(word)
+    return tokens
+
+
+TOKENIZERS: Dict[str, Callable[[str], List[str]]] = {
+    "whitespace": str.split,
+    "bigram": bigram_tokenize,
+    "jieba": jieba_tokenize,
+}
+
+
+def resolve_tokenizer(name: str) -> str:
+    """effective tokenizer name, falling back to bigrams when jieba is not installed"""
+    if name not in TOKENIZERS:
+        raise ValueError(f"unknown sparse tokenizer: {name}")
+    if name == "jieba":
+        try:
+            _jieba()
+        except ImportError:
+            logger.warning("jieba not installed, sparse tokenizer falls back to bigram")
+            return "bigram"
+    return name
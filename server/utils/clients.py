@@ -0,0 +1,163 @@
+import sys
+import time
+import queue
+import inspect
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import praw
+import requests
+from requests.adapters import HTTPAdapter
+from tavily import TavilyClient
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from config import (
+    TAVILY_API_KEY, CLIENT_ID, CLIENT_SECRET, REDDIT_USERNAME, REDDIT_PASSWORD, USER_AGENT,
+    SEARCH_POOL_SIZE, REDDIT_POOL_SIZE,
+    SEARCH_HTTP_MODE, SEARCH_CASSETTE_DIR, SEARCH_REPLAY_LATENCY, SEARCH_REPLAY_JITTER,
+)
+from utils.http_replay import Cassette, RecordingAdapter, ReplayAdapter, StandIn
+from utils.metrics import METRICS
+
+logger = logging.getLogger(__name__)
+
+# process-wide clients, built on first use: every tool call reuses their keep-alive connections
+# (and Reddit's OAuth tokens) instead of paying a TLS handshake and a token fetch per call.
+# tools run on executor threads, also when a graph awaits them, so thread safety is what counts.
+_LOCK = threading.RLock()
+_SESSIONS: Dict[str, requests.Session] = {}
+_TAVILY: Optional[TavilyClient] = None
+_REDDIT: Optional["ClientPool"] = None
+_STAND_IN: Optional[StandIn] = None
+# replay needs no credentials; praw and Tavily just need something to send
+_REPLAY_SECRET = "replay"
+
+
+def http_session(name: str) -> requests.Session:
+    """
+    the shared session for one upstream ("tavily", "reddit", "zhihu"), keeping up to SEARCH_POOL_SIZE
+    connections per host alive; urllib3's pool is thread-safe and threads beyond it open a throwaway connection
+    """
+    with _LOCK:
+        session = _SESSIONS.get(name)
+        if session is None:
+            session = requests.Session()
+            adapter = _adapter(name, pool_connections=4, pool_maxsize=SEARCH_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _SESSIONS[name] = session
+        return session
+
+
+def _adapter(name: str, **pool) -> HTTPAdapter:
+    """transport for one upstream under SEARCH_HTTP_MODE"""
+    if SEARCH_HTTP_MODE == "record":
+        return RecordingAdapter(Cassette(SEARCH_CASSETTE_DIR / f"{name}.json"), **pool)
+    if SEARCH_HTTP_MODE == "replay":
+        return ReplayAdapter(stand_in(), name, **pool)
+    if SEARCH_HTTP_MODE != "live":
+        logger.warning(f"Unknown SEARCH_HTTP_MODE {SEARCH_HTTP_MODE!r}, using live")
+    return HTTPAdapter(**pool)
+
+
+def stand_in() -> StandIn:
+    """the local server replaying SEARCH_CASSETTE_DIR, started on first use"""
+    global _STAND_IN
+    with _LOCK:
+        if _STAND_IN is None:
+            _STAND_IN = StandIn(SEARCH_CASSETTE_DIR, latency=SEARCH_REPLAY_LATENCY, jitter=SEARCH_REPLAY_JITTER)
+            METRICS.register("http_stand_in", _STAND_IN.stats)
+        return _STAND_IN
+
+
+def content_clock(upstream: str) -> Callable[[], float]:
+    """
+    the "now" that the age of upstream content is judged against: the recording time when replaying,
+    so a cassette keeps replaying the same posts instead of fewer every month
+    """
+    if SEARCH_HTTP_MODE == "replay":
+        recorded_at = stand_in().cassette(upstream).recorded_at
+        if recorded_at is not None:
+            return lambda: recorded_at
+        logger.warning(f"{upstream} cassette has no recording time, content age is judged against the wall clock")
+    return time.time
+
+
+def _secret(value: Optional[str]) -> Optional[str]:
+    return value or (_REPLAY_SECRET if SEARCH_HTTP_MODE == "replay" else value)
+
+
+def get_tavily() -> TavilyClient:
+    """shared TavilyClient; tavily-python < 0.7.23 cannot take a session and connects per request"""
+    global _TAVILY
+    if _TAVILY is None:
+        with _LOCK:
+            if _TAVILY is None:
+                if "session" in inspect.signature(TavilyClient.__init__).parameters:
+                    _TAVILY = TavilyClient(api_key=_secret(TAVILY_API_KEY), session=http_session("tavily"))
+                else:
+                    logger.warning("tavily-python without session support, Tavily requests will not reuse connections")
+                    _TAVILY = TavilyClient(api_key=_secret(TAVILY_API_KEY))
+    return _TAVILY
+
+
+class ClientPool:
+    """
+    check-out pool for clients that must not be used by two threads at once (praw.Reddit).
+    clients are built on demand up to `size` and then kept, so each one holds on to its
+    OAuth token; a caller beyond `size` waits for a client to come back.
+    """
+
+    def __init__(self, factory: Callable[[], Any], size: int):
+        self._factory = factory
+        self._idle: "queue.LifoQueue[Any]" = queue.LifoQueue()  # most recently used first: its token is warm
+        self._slots = threading.BoundedSemaphore(max(1, size))
+        self._lock = threading.Lock()
+        self.size = max(1, size)
+        self.created = 0
+        self.checkouts = 0
+
+    @contextmanager
+    def client(self) -> Iterator[Any]:
+        with self._slots:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                client = self._factory()
+                with self._lock:
+                    self.created += 1
+            with self._lock:
+                self.checkouts += 1
+            try:
+                yield client
+            finally:
+                self._idle.put(client)
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": self.size, "created": self.created, "idle": self._idle.qsize(), "checkouts": self.checkouts}
+
+
+def reddit_pool() -> ClientPool:
+    """pool of script-app praw.Reddit clients sending through the shared "reddit" session"""
+    global _REDDIT
+    if _REDDIT is None:
+        with _LOCK:
+            if _REDDIT is None:
+                session = http_session("reddit")
+                _REDDIT = ClientPool(lambda: _new_reddit(session), REDDIT_POOL_SIZE)
+                METRICS.register("reddit_clients", _REDDIT.stats)
+    return _REDDIT
+
+
+def _new_reddit(session: requests.Session) -> praw.Reddit:
+    return praw.Reddit(
+        client_id=_secret(CLIENT_ID),
+        client_secret=_secret(CLIENT_SECRET),
+        username=_secret(REDDIT_USERNAME),
+        password=_secret(REDDIT_PASSWORD),
+        user_agent=_secret(USER_AGENT),
+        requestor_kwargs={"session": session},
+    )
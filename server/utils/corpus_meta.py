@@ -0,0 +1,226 @@
+import re
+import calendar
+from datetime import datetime
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+# fields every chunk of a file inherits; bump the version when extraction changes
+FILE_META_VERSION = "1"
+
+PROVINCES = (
+    "北京", "天津", "上海", "重庆", "河北", "山西", "辽宁", "吉林", "黑龙江", "江苏", "浙江", "安徽",
+    "福建", "江西", "山东", "河南", "湖北", "湖南", "广东", "海南", "四川", "贵州", "云南", "陕西",
+    "甘肃", "青海", "内蒙古", "广西", "西藏", "宁夏", "新疆", "香港", "澳门", "台湾",
+)
+# cities that stand in for a province in titles ("苏州620分", "济南市300名")
+CITY_PROVINCE = {
+    "济南": "山东", "青岛": "山东", "苏州": "江苏", "南京": "江苏", "无锡": "江苏", "杭州": "浙江",
+    "宁波": "浙江", "深圳": "广东", "广州": "广东", "成都": "四川", "武汉": "湖北", "荆门": "湖北",
+    "赣州": "江西", "郑州": "河南", "长沙": "湖南", "合肥": "安徽",
+}
+# a place followed by one of these is a school name ("天津大学", "南京邮电"), not where the student is
+_SCHOOL_SUFFIX = r"(?:大学|师范|理工|科技|工业|财经|医科|交通|邮电|航空|海事|农业|外国语|电子|工程)"
+# ... and one preceded by these is a destination ("想去北京发展", "在天津就业")
+_PLACE_PREFIX = r"(?<![去到在回留出])"
+
+# title aliases -> full names; several names for aggregate aliases
+SCHOOL_ALIASES: Dict[str, Tuple[str, ...]] = {
+    "清北": ("清华大学", "北京大学"), "清华": ("清华大学",), "北大": ("北京大学",),
+    "复旦": ("复旦大学",), "上交大": ("上海交通大学",), "上交": ("上海交通大学",),
+    "浙大": ("浙江大学",), "南大": ("南京大学",), "南京大学": ("南京大学",), "中科大": ("中国科学技术大学",),
+    "人大": ("中国人民大学",), "哈工大": ("哈尔滨工业大学",), "哈工威": ("哈尔滨工业大学（威海）",),
+    "哈工程": ("哈尔滨工程大学",), "西工大": ("西北工业大学",), "西交": ("西安交通大学",),
+    "西浦": ("西交利物浦大学",), "西电": ("西安电子科技大学",), "北航": ("北京航空航天大学",),
+    "北理工": ("北京理工大学",), "北理": ("北京理工大学",), "北邮": ("北京邮电大学",),
+    "北师大": ("北京师范大学",), "东北师大": ("东北师范大学",), "央财": ("中央财经大学",),
+    "南开": ("南开大学",), "天大": ("天津大学",), "天津大学": ("天津大学",), "天医": ("天津医科大学",),
+    "同济": ("同济大学",), "东南大学": ("东南大学",), "东南": ("东南大学",), "苏大": ("苏州大学",),
+    "南邮": ("南京邮电大学",), "南航": ("南京航空航天大学",), "武大": ("武汉大学",),
+    "华科": ("华中科技大学",), "中南大学": ("中南大学",), "电子科大": ("电子科技大学",),
+    "成电": ("电子科技大学",), "川大": ("四川大学",), "西南交大": ("西南交通大学",),
+    "重医大": ("重庆医科大学",), "中大": ("中山大学",), "华南理工": ("华南理工大学",),
+    "深大": ("深圳大学",), "南方医科大": ("南方医科大学",), "南科大": ("南方科技大学",),
+    "暨大": ("暨南大学",), "厦大": ("厦门大学",), "福大": ("福州大学",), "郑大": ("郑州大学",),
+    "杭电": ("杭州电子科技大学",), "吉大": ("吉林大学",), "山威": ("山东大学（威海）",),
+    "中国海洋": ("中国海洋大学",), "东大": ("东北大学",), "大工": ("大连理工大学",),
+    "大连理工": ("大连理工大学",), "大连海事": ("大连海事大学",), "兰大": ("兰州大学",),
+    "兰州大学": ("兰州大学",), "上大": ("上海大学",), "港中深": ("香港中文大学（深圳）",),
+    "港科大": ("香港科技大学",), "澳门大学": ("澳门大学",),
+}
+
+_DATE = re.compile(r"^(\d{8})_")
+_PROVINCE = re.compile(
+    _PLACE_PREFIX + "(" + "|".join(sorted(PROVINCES + tuple(CITY_PROVINCE), key=len, reverse=True)) + ")"
+    + "(?!" + _SCHOOL_SUFFIX + ")"
+)
+# longest alias first, so "东北师大" wins over "北师大" and "哈工大工科" is not read as "大工";
+# "上大" is also the start of "上大学"
+_SCHOOLS = re.compile("|".join(
+    re.escape(a) + ("(?!学)" if a == "上大" else "") for a in sorted(SCHOOL_ALIASES, key=len, reverse=True)
+))
+# "1000名", "5200位", "1万5千名", "排28", "省排1500"
+_RANK = re.compile(r"(?:排(\d+(?:万\d?千?)?)|(\d+(?:万\d?千?)?)(?:名|位))")
+# "610分", "500多分"
+_SCORE = re.compile(r"(\d{3})多?分")
+# a bare number right after the place or exam: "江西630，", "首考409", "山东13000，", "河南1万4，"
+_PLACE_NUMBER = re.compile(r"^(?:省|市|区)?(?:首考|文科|理科|物理|历史)?(\d{3,6}|\d+万\d?)(?![\d万千分名位])")
+SCORE_RANGE = (100, 750)
+TIERS = ("985", "211")
+
+
+@dataclass(frozen=True)
+class FileMeta:
+    """structured fields encoded in a corpus file name; None where the title says nothing"""
+    date: Optional[int] = None  # yyyymmdd
+    province: Optional[str] = None
+    score: Optional[int] = None
+    rank: Optional[int] = None
+    schools: Tuple[str, ...] = ()
+
+    def as_metadata(self) -> Dict[str, Any]:
+        """chunk metadata: scalar values only, unknown fields left out so vector-store filters skip them"""
+        out: Dict[str, Any] = {
+            "date": self.date, "province": self.province, "score": self.score, "rank": self.rank,
+            "schools": "、".join(self.schools) or None,
+        }
+        return {k: v for k, v in out.items() if v is not None}
+
+
+def extract_file_meta(file_name: str) -> FileMeta:
+    """
+    "20240205_专家，江苏610分，苏大和985怎么选？.txt"
+      -> FileMeta(date=20240205, province="江苏", score=610, schools=("苏州大学",))
+    """
+    stem = re.sub(r"\.\w+$", "", file_name.rsplit("/", 1)[-1])
+    m = _DATE.match(stem)
+    date = _valid_date(m.group(1)) if m else None
+    title = stem[m.end():] if m else stem
+
+    province, score, rank = None, None, None
+    place = _PROVINCE.search(title)
+    if place:
+        province = CITY_PROVINCE.get(place.group(1), place.group(1))
+        bare = _PLACE_NUMBER.match(title[place.end():])
+        if bare and bare.group(1) not in TIERS:
+            value = _number(bare.group(1))
+            if SCORE_RANGE[0] <= value <= SCORE_RANGE[1]:
+                score = value
+            elif value > SCORE_RANGE[1]:
+                rank = value
+
+    for m in _SCORE.finditer(title):
+        value = int(m.group(1))
+        if score is None and SCORE_RANGE[0] <= value <= SCORE_RANGE[1]:
+            score = value
+    for m in _RANK.finditer(title):
+        if rank is None:
+            rank = _number(m.group(1) or m.group(2))
+
+    schools: List[str] = []
+    for m in _SCHOOLS.finditer(title):
+        schools.extend(s for s in SCHOOL_ALIASES[m.group(0)] if s not in schools)
+    return FileMeta(date=date, province=province, score=score, rank=rank, schools=tuple(schools))
+
+
+def _valid_date(digits: str) -> Optional[int]:
+    try:
+        datetime.strptime(digits, "%Y%m%d")
+    except ValueError:
+        return None
+    return int(digits)
+
+
+def _number(text: str) -> int:
+    """"1万5千" -> 15000, "1万4" -> 14000, "2万" -> 20000"""
+    if "万" not in text:
+        return int(text)
+    wan, _, rest = text.partition("万")
+    return int(wan) * 10000 + int(rest.rstrip("千") or 0) * 1000
+
+
+def normalize_province(name: str) -> str:
+    """"江苏省" | "江苏" | "苏州" -> "江苏"; ValueError for anything else"""
+    name = re.sub(r"(?:省|市|壮族自治区|回族自治区|维吾尔自治区|自治区|特别行政区)$", "", name.strip())
+    if name in PROVINCES:
+        return name
+    if name in CITY_PROVINCE:
+        return CITY_PROVINCE[name]
+    raise ValueError(f"unknown province: {name}")
+
+
+def parse_date_bound(value: str, upper: bool = False) -> int:
+    """
+    "2024-02-05" | "2024-2-5" | "2024年2月5日" | "20240205" | "2024-02" | "2024" -> yyyymmdd.
+    a partial date covers its whole month / year: as an upper bound "2024-02" is 20240229.
+    ValueError for anything else, including months and days that do not exist.
+    """
+    text = str(value).strip()
+    if re.fullmatch(r"\d{4}(?:\d{2}){0,2}", text, re.ASCII):
+        parts = [part for part in (text[:4], text[4:6], text[6:8]) if part]
+    else:
+        parts = [part for part in re.split(r"[-/.年月日\s]+", text) if part]
+    if (
+        not 1 <= len(parts) <= 3
+        or not all(re.fullmatch(r"\d+", part, re.ASCII) for part in parts)
+        or len(parts[0]) != 4
+        or any(len(part) > 2 for part in parts[1:])
+    ):
+        raise ValueError(f"bad date: {value!r}, expected YYYY[-MM[-DD]]")
+
+    year = int(parts[0])
+    month = int(parts[1]) if len(parts) > 1 else (12 if upper else 1)
+    if not 1 <= month <= 12:
+        raise ValueError(f"bad date: {value!r}, no month {month}")
+    last_day = calendar.monthrange(year, month)[1]
+    day = int(parts[2]) if len(parts) > 2 else (last_day if upper else 1)
+    if not 1 <= day <= last_day:
+        raise ValueError(f"bad date: {value!r}, no day {day} in {year}-{month:02d}")
+    return year * 10000 + month * 100 + day
+
+
+@dataclass(frozen=True)
+class ChunkFilter:
+    """db_retrieve pre-filter; every set condition must hold, files without the field never match"""
+    province: Optional[str] = None
+    date_from: Optional[int] = None
+    date_to: Optional[int] = None
+
+    @classmethod
+    def parse(
+        cls, province: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None
+    ) -> Optional["ChunkFilter"]:
+        """None when no condition is given, so unfiltered calls take the plain path"""
+        if not (province or date_from or date_to):
+            return None
+        return cls(
+            province=normalize_province(province) if province else None,
+            date_from=parse_date_bound(str(date_from)) if date_from else None,
+            date_to=parse_date_bound(str(date_to), upper=True) if date_to else None,
+        )
+
+    @property
+    def key(self) -> str:
+        """stable text form, used to scope cached results"""
+        return f"province={self.province or ''}&date={self.date_from or ''}-{self.date_to or ''}"
+
+    def conditions(self) -> List[Tuple[str, str, Any]]:
+        """(field, op, value) with op one of "=", ">=", "<=" """
+        out: List[Tuple[str, str, Any]] = []
+        if self.province:
+            out.append(("province", "=", self.province))
+        if self.date_from:
+            out.append(("date", ">=", self.date_from))
+        if self.date_to:
+            out.append(("date", "<=", self.date_to))
+        return out
+
+    def where(self) -> Dict[str, Any]:
+        """chroma metadata filter"""
+        ops = {"=": "$eq", ">=": "$gte", "<=": "$lte"}
+        clauses = [{field: {ops[op]: value}} for field, op, value in self.conditions()]
+        return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+    def sql(self) -> Tuple[str, List[Any]]:
+        """WHERE clause over the file_meta side index"""
+        conditions = self.conditions()
+        return " AND ".join(f"{field} {op} ?" for field, op, _ in conditions), [v for _, _, v in conditions]
@@ -0,0 +1,88 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# how signatures are computed; part of the ingest schema, so a change re-ingests the corpus
+DEDUP_SCHEME = "minhash-c4-64x16-v1"
+SHINGLE = 4  # characters per shingle: CJK text has no word boundaries to shingle on
+NUM_PERM = 64
+BANDS = 16  # LSH bands of NUM_PERM // BANDS rows: pairs from Jaccard ~0.5 upwards become candidates
+_ROWS = NUM_PERM // BANDS
+_MASK64 = (1 << 64) - 1
+
+_rng = np.random.default_rng(20240205)
+# multiply-shift hash family, one (a, b) per permutation; odd multipliers
+_A = _rng.integers(1, 1 << 63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)
+# polynomial rolling hash of a shingle's code points
+_POWERS = np.array([pow(1_000_003, SHINGLE - 1 - i, 1 << 64) & _MASK64 for i in range(SHINGLE)], dtype=np.uint64)
+_EMPTY = np.full(NUM_PERM, np.iinfo(np.uint32).max, dtype=np.uint32)
+
+
+def minhash(text: str) -> np.ndarray:
+    """NUM_PERM uint32 minima over the character shingles of the text, whitespace and case ignored"""
+    cps = np.frombuffer(re.sub(r"\s+", "", text.lower()).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    if len(cps) == 0:
+        return _EMPTY.copy()
+    if len(cps) < SHINGLE:
+        cps = np.pad(cps, (0, SHINGLE - len(cps)))
+    shingles = np.unique(np.lib.stride_tricks.sliding_window_view(cps, SHINGLE) @ _POWERS)
+    return ((np.outer(_A, shingles) + _B[:, None]) >> np.uint64(32)).min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """estimated Jaccard similarity of the two shingle sets"""
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+def _band_keys(sig: np.ndarray) -> List[bytes]:
+    return [bytes([b]) + sig[b * _ROWS:(b + 1) * _ROWS].tobytes() for b in range(BANDS)]
+
+
+class NearDupIndex:
+    """
+    MinHash LSH over the canonical chunks: a chunk whose estimated Jaccard similarity to an
+    indexed one reaches `threshold` is its near-duplicate. lives for one ingest run, loaded
+    from the signatures kept in the chunk cache.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self._sigs: Dict[str, np.ndarray] = {}
+        self._buckets: Dict[bytes, List[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._sigs)
+
+    def load(self, signatures: Iterable[Tuple[str, bytes]]) -> "NearDupIndex":
+        for chunk_id, sig in signatures:
+            self.add(chunk_id, np.frombuffer(sig, dtype=np.uint32))
+        return self
+
+    def add(self, chunk_id: str, sig: np.ndarray) -> None:
+        if chunk_id in self._sigs:
+            return
+        self._sigs[chunk_id] = sig
+        for key in _band_keys(sig):
+            self._buckets.setdefault(key, []).append(chunk_id)
+
+    def discard(self, chunk_id: str) -> None:
+        sig = self._sigs.pop(chunk_id, None)
+        if sig is None:
+            return
+        for key in _band_keys(sig):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.remove(chunk_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def match(self, sig: np.ndarray) -> Optional[str]:
+        """the most similar indexed chunk at or above the threshold; ties keep the first candidate found"""
+        best, best_sim = None, self.threshold
+        for chunk_id in dict.fromkeys(cid for key in _band_keys(sig) for cid in self._buckets.get(key, ())):
+            sim = similarity(self._sigs[chunk_id], sig)
+            if sim > best_sim or (best is None and sim >= best_sim):
+                best, best_sim = chunk_id, sim
+        return best
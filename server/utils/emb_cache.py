@@ -0,0 +1,142 @@
+import time
+import sqlite3
+import hashlib
+import logging
+from typing import List, Dict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Content-addressed embedding cache in front of any langchain `Embeddings`.
+    vectors are keyed by (model, sha256(text)) and persisted in SQLite, least recently
+    used entries are evicted once the table grows past `max_entries`.
+    with `symmetric=True` queries share entries with documents (true for OpenAI models),
+    so a text embedded while chunking is never sent to the API again.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        model: str,
+        db_path: str,
+        max_entries: int = 200_000,
+        symmetric: bool = True,
+    ):
+        self.underlying = underlying
+        self.model = model
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.symmetric = symmetric
+        self.hits = 0
+        self.misses = 0
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute("PRAGMA busy_timeout = 5000;")
+        return conn
+
+    def _init_db(self):
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings(
+                  key TEXT PRIMARY KEY,
+                  model TEXT NOT NULL,
+                  dim INTEGER NOT NULL,
+                  vec BLOB NOT NULL,
+                  last_used REAL NOT NULL
+                )
+                """
+            )
+            cur.execute("CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings(last_used);")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts), namespace=self.model, embed_fn=self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.symmetric:
+            return self.embed_documents([text])[0]
+        embed_fn = lambda texts: [self.underlying.embed_query(t) for t in texts]
+        return self._embed([text], namespace=f"{self.model}#query", embed_fn=embed_fn)[0]
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """embed_query for several queries; misses go out as one request when symmetric"""
+        if self.symmetric:
+            return self.embed_documents(texts)
+        embed_fn = lambda batch: [self.underlying.embed_query(t) for t in batch]
+        return self._embed(list(texts), namespace=f"{self.model}#query", embed_fn=embed_fn)
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses}
+
+    def _embed(self, texts: List[str], namespace: str, embed_fn) -> List[List[float]]:
+        keys = [self._key(namespace, t) for t in texts]
+        found = self._lookup(keys)
+
+        # embed each distinct missing text once
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        self.hits += len(texts) - sum(1 for k in keys if k not in found)
+        self.misses += len(missing)
+
+        if missing:
+            vectors = embed_fn(list(missing.values()))
+            fresh = dict(zip(missing.keys(), vectors))
+            self._store(namespace, fresh)
+            found.update(fresh)
+
+        return [list(found[k]) for k in keys]
+
+    @staticmethod
+    def _key(namespace: str, text: str) -> str:
+        return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str], batch: int = 500) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.cursor()
+            for i in range(0, len(unique), batch):
+                part = unique[i:i + batch]
+                marks = ",".join("?" * len(part))
+                cur.execute(f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", part)
+                for key, blob in cur.fetchall():
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                cur.executemany("UPDATE embeddings SET last_used=? WHERE key=?", [(now, k) for k in found])
+        return found
+
+    def _store(self, namespace: str, vectors: Dict[str, List[float]]):
+        now = time.time()
+        rows = []
+        for key, vec in vectors.items():
+            arr = np.asarray(vec, dtype=np.float32)
+            rows.append((key, namespace, arr.shape[0], arr.tobytes(), now))
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.executemany(
+                "INSERT OR REPLACE INTO embeddings(key, model, dim, vec, last_used) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            cur.execute("SELECT COUNT(*) FROM embeddings")
+            count = cur.fetchone()[0]
+            if count > self.max_entries:
+                # evict down to 90% so we don't pay for eviction on every insert
+                drop = count - int(self.max_entries * 0.9)
+                cur.execute(
+                    "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                    (drop,),
+                )
+                logger.debug(f"Embedding cache evicted {drop} entries")
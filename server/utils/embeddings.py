@@ -0,0 +1,128 @@
+import re
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils.cjk_tokenizer import bigram_tokenize
+
+logger = logging.getLogger(__name__)
+
+# vectors of this backend predate per-backend collections and stay where they always were
+LEGACY = ("openai", "text-embedding-3-large")
+LEGACY_COLLECTION = "langchain"
+
+DEFAULT_MODELS = {
+    "openai": "text-embedding-3-large",
+    "local": "BAAI/bge-small-zh-v1.5",
+    "hashing": "512",
+}
+# cosine cut-off of the embedding filter; hashed bigrams rarely reach what dense models score
+FILTER_THRESHOLDS = {
+    "openai": 0.3,
+    "local": 0.3,
+    "hashing": 0.05,
+}
+
+
+@dataclass(frozen=True)
+class EmbeddingSpec:
+    """which backend / model EMB_MODEL selects, and where its vectors live"""
+    backend: str
+    model: str
+
+    @property
+    def is_legacy(self) -> bool:
+        return (self.backend, self.model) == LEGACY
+
+    @property
+    def cache_key(self) -> str:
+        """model name in the embedding cache; OpenAI keeps the bare name so old entries still hit"""
+        return self.model if self.backend == "openai" else f"{self.backend}:{self.model}"
+
+    @property
+    def slug(self) -> str:
+        """chroma collection / index directory name: 3-63 chars of [a-zA-Z0-9._-], alphanumeric at both ends"""
+        slug = re.sub(r"[^a-zA-Z0-9._-]+", "-", f"{self.backend}-{self.model}")
+        return slug.strip("-._")[:63].rstrip("-._")
+
+    @property
+    def collection(self) -> str:
+        return LEGACY_COLLECTION if self.is_legacy else self.slug
+
+    @property
+    def filter_threshold(self) -> float:
+        return FILTER_THRESHOLDS[self.backend]
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    signed feature hashing of character bigrams with sublinear tf, L2-normalized.
+    no model, no network, deterministic across runs and machines: meant for tests and benchmarks.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _embed(self, text: str) -> List[float]:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for token in bigram_tokenize(text):
+            h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vec[h % self.dim] += 1.0 if (h >> 63) & 1 else -1.0
+        vec = np.sign(vec) * np.log1p(np.abs(vec))
+        norm = np.linalg.norm(vec)
+        return (vec / norm if norm else vec).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def _openai(model: str) -> Embeddings:
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=model)
+
+
+def _local(model: str) -> Embeddings:
+    """sentence-transformers model on CPU; normalized so cosine == dot product like the OpenAI vectors"""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(
+        model_name=model,
+        model_kwargs={"device": "cpu"},
+        encode_kwargs={"normalize_embeddings": True},
+    )
+
+
+def _hashing(model: str) -> Embeddings:
+    return HashingEmbeddings(dim=int(model))
+
+
+EMBEDDING_BACKENDS: Dict[str, Callable[[str], Embeddings]] = {
+    "openai": _openai,
+    "local": _local,
+    "hashing": _hashing,
+}
+
+
+def parse_spec(value: str) -> EmbeddingSpec:
+    """
+    "text-embedding-3-large" | "openai:text-embedding-3-small"   -> OpenAI API
+    "local" | "local:BAAI/bge-small-zh-v1.5"                       -> sentence-transformers on CPU
+    "hashing" | "hashing:1024"                                     -> feature hashing, no model
+    """
+    backend, sep, model = value.strip().partition(":")
+    if not sep:
+        backend, model = (backend, "") if backend in EMBEDDING_BACKENDS else ("openai", backend)
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"unknown embedding backend: {backend}")
+    return EmbeddingSpec(backend, model or DEFAULT_MODELS[backend])
+
+
+def build_embeddings(spec: EmbeddingSpec) -> Embeddings:
+    logger.info(f"Embedding backend: {spec.backend} ({spec.model})")
+    return EMBEDDING_BACKENDS[spec.backend](spec.model)
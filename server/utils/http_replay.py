@@ -0,0 +1,234 @@
+import json
+import time
+import random
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# credentials never reach a cassette: dropped from request keys, blanked in response bodies
+SECRET_FIELDS = frozenset({"api_key", "password", "username", "client_id", "client_secret", "access_token", "refresh_token"})
+# response headers that describe the wire, not the recorded (already decoded) body
+_HOP_HEADERS = frozenset(
+    {"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive", "set-cookie", "date", "server"}
+)
+CASSETTE_VERSION = 1
+
+
+def _scrub_pairs(pairs: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    return sorted((k, v) for k, v in pairs if k not in SECRET_FIELDS)
+
+
+def _scrub_json(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: ("REDACTED" if k in SECRET_FIELDS else _scrub_json(v)) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_scrub_json(v) for v in value]
+    return value
+
+
+def _request_body(body: Any) -> str:
+    """request body in a stable form: JSON with sorted keys, or sorted form fields; secrets dropped"""
+    if body is None:
+        return ""
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return urlencode(_scrub_pairs(parse_qsl(body, keep_blank_values=True)))
+    if isinstance(data, dict):
+        data = {k: v for k, v in data.items() if k not in SECRET_FIELDS}
+    return json.dumps(data, sort_keys=True, ensure_ascii=False)
+
+
+def request_key(method: str, url: str, body: Any = None) -> str:
+    """what a recorded interaction is matched on: method, host, path, query and body, minus credentials"""
+    parts = urlsplit(url)
+    query = urlencode(_scrub_pairs(parse_qsl(parts.query, keep_blank_values=True)))
+    return f"{method.upper()} {parts.netloc}{parts.path}?{query} {_request_body(body)}"
+
+
+class Cassette:
+    """
+    recorded HTTP interactions of one upstream, kept as JSON in `<dir>/<name>.json`.
+    a request recorded several times is replayed in recorded order, then round robin.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.interactions: List[Dict[str, Any]] = []
+        self._by_key: Dict[str, List[Dict[str, Any]]] = {}
+        self._served: Dict[str, int] = {}
+        if self.path.exists():
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            for interaction in data.get("interactions", []):
+                self._index(interaction)
+
+    def __len__(self) -> int:
+        return len(self.interactions)
+
+    @property
+    def recorded_at(self) -> Optional[float]:
+        """when the latest interaction was recorded (epoch seconds); None for cassettes without timestamps"""
+        stamps = [i["recorded_at"] for i in self.interactions if "recorded_at" in i]
+        return max(stamps) if stamps else None
+
+    def _index(self, interaction: Dict[str, Any]) -> None:
+        self.interactions.append(interaction)
+        self._by_key.setdefault(interaction["request"]["key"], []).append(interaction["response"])
+
+    def record(self, method: str, url: str, body: Any, status: int, headers: Dict[str, str], text: str) -> None:
+        try:
+            text = json.dumps(_scrub_json(json.loads(text)), ensure_ascii=False)
+        except ValueError:
+            pass
+        interaction = {
+            "recorded_at": time.time(),
+            "request": {"method": method.upper(), "url": url, "key": request_key(method, url, body)},
+            "response": {
+                "status": status,
+                "headers": {k: v for k, v in headers.items() if k.lower() not in _HOP_HEADERS},
+                "body": text,
+            },
+        }
+        with self._lock:
+            self._index(interaction)
+            self._save()
+
+    def lookup(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            responses = self._by_key.get(key)
+            if not responses:
+                return None
+            n = self._served.get(key, 0)
+            self._served[key] = n + 1
+            return responses[n % len(responses)]
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".json.tmp")
+        tmp.write_text(
+            json.dumps({"version": CASSETTE_VERSION, "interactions": self.interactions}, ensure_ascii=False, indent=1),
+            encoding="utf-8",
+        )
+        tmp.replace(self.path)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """sends requests upstream as usual and appends every response to the cassette"""
+
+    def __init__(self, cassette: Cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        try:
+            self.cassette.record(
+                request.method, request.url, request.body, response.status_code, dict(response.headers), response.text
+            )
+        except Exception as e:
+            logger.warning(f"Recording {request.method} {request.url} failed: {e}")
+        return response
+
+
+class ReplayAdapter(HTTPAdapter):
+    """sends every request to the local stand-in instead of the upstream, over real loopback connections"""
+
+    def __init__(self, server: "StandIn", upstream: str, **kwargs):
+        super().__init__(**kwargs)
+        self.server = server
+        self.upstream = upstream
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = f"{self.server.url}/{self.upstream}/{parts.netloc}{parts.path}" + (f"?{parts.query}" if parts.query else "")
+        return super().send(request, **kwargs)
+
+
+class StandIn:
+    """
+    in-process HTTP server answering from the cassettes in `cassette_dir`, after an injected delay
+    per upstream (`latency` seconds, varied by +-`jitter` of itself). requests with no recording
+    get a 404, so a test notices a cassette that no longer matches the code.
+    """
+
+    def __init__(self, cassette_dir: Path, latency: Optional[Dict[str, float]] = None, jitter: float = 0.0, seed: int = 0):
+        self.cassette_dir = Path(cassette_dir)
+        self.latency = dict(latency or {})
+        self.jitter = jitter
+        self.cassettes: Dict[str, Cassette] = {}
+        self.served = 0
+        self.unmatched = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, name="http-stand-in", daemon=True).start()
+        logger.info(f"HTTP stand-in replaying {self.cassette_dir} at {self.url}")
+
+    def cassette(self, upstream: str) -> Cassette:
+        with self._lock:
+            if upstream not in self.cassettes:
+                self.cassettes[upstream] = Cassette(self.cassette_dir / f"{upstream}.json")
+            return self.cassettes[upstream]
+
+    def delay(self, upstream: str) -> float:
+        base = self.latency.get(upstream, 0.0)
+        if base <= 0:
+            return 0.0
+        with self._lock:
+            return max(0.0, base * (1 + self._rng.uniform(-self.jitter, self.jitter)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {"served": self.served, "unmatched": self.unmatched, "recorded": {k: len(c) for k, c in self.cassettes.items()}}
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _respond(self, method: str, path: str, body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        upstream, _, rest = path.lstrip("/").partition("/")
+        found = self.cassette(upstream).lookup(request_key(method, f"https://{rest}", body or None))
+        time.sleep(self.delay(upstream))
+        with self._lock:
+            if found is None:
+                self.unmatched += 1
+            else:
+                self.served += 1
+        if found is None:
+            logger.warning(f"No recorded response for {method} https://{rest}")
+            return 404, {"Content-Type": "application/json"}, json.dumps({"error": "not recorded"}).encode("utf-8")
+        return found["status"], found["headers"], found["body"].encode("utf-8")
+
+    def _handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, so client connection pools behave as upstream
+
+            def _serve(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                status, headers, payload = stand_in._respond(self.command, self.path, self.rfile.read(length))
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _serve
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
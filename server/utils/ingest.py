@@ -0,0 +1,401 @@
+import os
+import json
+import glob
+import sqlite3
+import hashlib
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Any, Optional
+
+from utils.corpus_meta import ChunkFilter, extract_file_meta
+
+logger = logging.getLogger(__name__)
+
+DOC_SUFFIXES = (".txt", ".md")
+CHUNK_ID_SCHEME = "content-sha1-v1"  # bump to force a full re-ingest when ids are derived differently
+
+
+@dataclass
+class FileEntry:
+    """one corpus file as seen on disk"""
+    rel_path: str
+    path: str
+    sha256: str
+    size: int
+    mtime: float
+
+
+class IngestStore:
+    """Manifest (path -> content hash) plus on-disk chunk cache for incremental ingestion"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute("PRAGMA busy_timeout = 5000;")
+        return conn
+
+    def _init_db(self):
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS manifest(
+                  rel_path TEXT PRIMARY KEY,
+                  sha256 TEXT NOT NULL,
+                  size INTEGER NOT NULL,
+                  mtime REAL NOT NULL,
+                  n_chunks INTEGER NOT NULL DEFAULT 0,
+                  updated_at TEXT DEFAULT (datetime('now'))
+                )
+                """
+            )
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS chunks(
+                  chunk_id TEXT PRIMARY KEY,
+                  rel_path TEXT NOT NULL,
+                  idx INTEGER NOT NULL,
+                  text TEXT NOT NULL,
+                  metadata TEXT NOT NULL DEFAULT '{}',
+                  dup_of TEXT,
+                  sig BLOB
+                )
+                """
+            )
+            # near-duplicate columns, added in place to caches created before them
+            columns = {row[1] for row in cur.execute("PRAGMA table_info(chunks)")}
+            for column, decl in (("dup_of", "TEXT"), ("sig", "BLOB")):
+                if column not in columns:
+                    cur.execute(f"ALTER TABLE chunks ADD COLUMN {column} {decl}")
+            cur.execute("CREATE INDEX IF NOT EXISTS ix_chunks_rel_path ON chunks(rel_path);")
+            cur.execute("CREATE INDEX IF NOT EXISTS ix_chunks_dup_of ON chunks(dup_of);")
+            # side index of the fields encoded in file names, for pre-filtered retrieval
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS file_meta(
+                  rel_path TEXT PRIMARY KEY,
+                  date INTEGER,
+                  province TEXT,
+                  score INTEGER,
+                  rank INTEGER,
+                  schools TEXT NOT NULL DEFAULT '[]'
+                )
+                """
+            )
+            cur.execute("CREATE INDEX IF NOT EXISTS ix_file_meta_province ON file_meta(province, date);")
+            cur.execute("CREATE INDEX IF NOT EXISTS ix_file_meta_date ON file_meta(date);")
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS meta(
+                  key TEXT PRIMARY KEY,
+                  value TEXT NOT NULL
+                )
+                """
+            )
+
+    def is_empty(self) -> bool:
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT 1 FROM manifest LIMIT 1")
+            return cur.fetchone() is None
+
+    def get_manifest(self) -> Dict[str, Tuple[str, int, float]]:
+        """rel_path -> (sha256, size, mtime)"""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT rel_path, sha256, size, mtime FROM manifest")
+            return {row[0]: (row[1], row[2], row[3]) for row in cur.fetchall()}
+
+    def diff(self, folder: str) -> Tuple[List[FileEntry], List[str]]:
+        """
+        compare the corpus folder against the manifest
+        :return: (new or edited files, rel_paths that disappeared)
+        files whose size/mtime are unchanged are not read at all; files that were
+        touched but hash identically only get their stat refreshed.
+        """
+        known = self.get_manifest()
+        changed: List[FileEntry] = []
+        seen = set()
+
+        for path in iter_corpus_files(folder):
+            rel = os.path.relpath(path, folder)
+            seen.add(rel)
+            st = os.stat(path)
+            prev = known.get(rel)
+            if prev and prev[1] == st.st_size and prev[2] == st.st_mtime:
+                continue
+
+            sha = file_sha256(path)
+            if prev and prev[0] == sha:
+                self._touch(rel, st.st_size, st.st_mtime)
+                continue
+            changed.append(FileEntry(rel, path, sha, st.st_size, st.st_mtime))
+
+        removed = [rel for rel in known if rel not in seen]
+        return changed, removed
+
+    def replace_file(
+        self,
+        entry: FileEntry,
+        chunks: List[Tuple[str, int, str, Dict[str, Any]]],
+        dedup: Optional[Dict[str, Tuple[Optional[str], Optional[bytes]]]] = None,
+    ) -> List[str]:
+        """
+        record the new chunk set of a file
+        :param chunks: list of (chunk_id, idx, text, metadata)
+        :param dedup: chunk_id -> (canonical chunk_id if it is a near-duplicate, minhash signature)
+        :return: indexed chunk ids of the previous version that no longer exist
+        """
+        new_ids = {c[0] for c in chunks}
+        dedup = dedup or {}
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT chunk_id FROM chunks WHERE rel_path=? AND dup_of IS NULL", (entry.rel_path,))
+            stale = [row[0] for row in cur.fetchall() if row[0] not in new_ids]
+            cur.execute("DELETE FROM chunks WHERE rel_path=?", (entry.rel_path,))
+            cur.executemany(
+                "INSERT OR REPLACE INTO chunks(chunk_id, rel_path, idx, text, metadata, dup_of, sig) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (cid, entry.rel_path, idx, text, json.dumps(meta, ensure_ascii=False), *dedup.get(cid, (None, None)))
+                    for cid, idx, text, meta in chunks
+                ],
+            )
+            cur.execute(
+                """
+                INSERT INTO manifest(rel_path, sha256, size, mtime, n_chunks, updated_at)
+                VALUES (?, ?, ?, ?, ?, datetime('now'))
+                ON CONFLICT(rel_path) DO UPDATE SET
+                  sha256=excluded.sha256, size=excluded.size, mtime=excluded.mtime,
+                  n_chunks=excluded.n_chunks, updated_at=excluded.updated_at
+                """,
+                (entry.rel_path, entry.sha256, entry.size, entry.mtime, len(chunks)),
+            )
+            fields = extract_file_meta(entry.rel_path)
+            cur.execute(
+                "INSERT OR REPLACE INTO file_meta(rel_path, date, province, score, rank, schools) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    entry.rel_path, fields.date, fields.province, fields.score, fields.rank,
+                    json.dumps(list(fields.schools), ensure_ascii=False),
+                ),
+            )
+        return stale
+
+    def remove_file(self, rel_path: str) -> List[str]:
+        """drop a file from manifest and cache, return its indexed chunk ids"""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT chunk_id FROM chunks WHERE rel_path=? AND dup_of IS NULL", (rel_path,))
+            ids = [row[0] for row in cur.fetchall()]
+            cur.execute("DELETE FROM chunks WHERE rel_path=?", (rel_path,))
+            cur.execute("DELETE FROM manifest WHERE rel_path=?", (rel_path,))
+            cur.execute("DELETE FROM file_meta WHERE rel_path=?", (rel_path,))
+        return ids
+
+    def chunk_positions(self, rel_path: str) -> Dict[str, int]:
+        """chunk_id -> idx of the version of a file that is currently indexed"""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT chunk_id, idx FROM chunks WHERE rel_path=?", (rel_path,))
+            return {row[0]: row[1] for row in cur.fetchall()}
+
+    def chunk_dedup(self, rel_path: str) -> Dict[str, Tuple[Optional[str], Optional[bytes]]]:
+        """chunk_id -> (canonical chunk_id or None, minhash signature) of the indexed version of a file"""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT chunk_id, dup_of, sig FROM chunks WHERE rel_path=?", (rel_path,))
+            return {row[0]: (row[1], row[2]) for row in cur.fetchall()}
+
+    def canonical_signatures(self) -> List[Tuple[str, bytes]]:
+        """(chunk_id, minhash signature) of every indexed chunk that has one"""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT chunk_id, sig FROM chunks WHERE dup_of IS NULL AND sig IS NOT NULL ORDER BY rel_path, idx")
+            return cur.fetchall()
+
+    def orphaned_chunks(self) -> List[Tuple[str, str, Dict[str, Any], bytes]]:
+        """near-duplicates whose canonical chunk is gone, as (chunk_id, text, metadata, signature)"""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT c.chunk_id, c.text, c.metadata, c.sig FROM chunks c
+                LEFT JOIN chunks k ON k.chunk_id = c.dup_of
+                WHERE c.dup_of IS NOT NULL AND k.chunk_id IS NULL
+                ORDER BY c.rel_path, c.idx
+                """
+            )
+            return [(row[0], row[1], json.loads(row[2]), row[3]) for row in cur.fetchall()]
+
+    def set_dup_of(self, updates: List[Tuple[str, Optional[str]]]) -> None:
+        """re-point chunks at a canonical chunk, or make them canonical (None)"""
+        with self._connect() as conn:
+            conn.executemany("UPDATE chunks SET dup_of=? WHERE chunk_id=?", [(dup_of, cid) for cid, dup_of in updates])
+
+    def duplicate_sources(self, chunk_ids: List[str]) -> Dict[str, List[str]]:
+        """canonical chunk_id -> files it stands for (its own first), for the given chunks that have near-duplicates"""
+        if not chunk_ids:
+            return {}
+        with self._connect() as conn:
+            cur = conn.cursor()
+            marks = ",".join("?" * len(chunk_ids))
+            cur.execute(
+                f"""
+                SELECT COALESCE(dup_of, chunk_id), rel_path, dup_of IS NOT NULL FROM chunks
+                WHERE chunk_id IN ({marks}) OR dup_of IN ({marks})
+                ORDER BY dup_of IS NOT NULL, rel_path, idx
+                """,
+                list(chunk_ids) * 2,
+            )
+            sources: Dict[str, List[str]] = {}
+            collapsed = set()
+            for canonical, rel_path, is_dup in cur.fetchall():
+                files = sources.setdefault(canonical, [])
+                if rel_path not in files:
+                    files.append(rel_path)
+                if is_dup:
+                    collapsed.add(canonical)
+        return {cid: files for cid, files in sources.items() if cid in collapsed}
+
+    def load_chunks(self) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """all indexed chunks (near-duplicates left out) as (chunk_id, text, metadata), in a stable order"""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT chunk_id, text, metadata FROM chunks WHERE dup_of IS NULL ORDER BY rel_path, idx")
+            return [(row[0], row[1], json.loads(row[2])) for row in cur.fetchall()]
+
+    def count_chunks(self) -> int:
+        """number of indexed chunks (near-duplicates left out), as load_chunks returns them"""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM chunks WHERE dup_of IS NULL")
+            return cur.fetchone()[0]
+
+    def get_chunks(self, chunk_ids: List[str]) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """cached chunks for the given ids, in the same order (unknown ids are skipped)"""
+        if not chunk_ids:
+            return []
+        with self._connect() as conn:
+            cur = conn.cursor()
+            marks = ",".join("?" * len(chunk_ids))
+            cur.execute(f"SELECT chunk_id, text, metadata FROM chunks WHERE chunk_id IN ({marks})", list(chunk_ids))
+            found = {row[0]: (row[0], row[1], json.loads(row[2])) for row in cur.fetchall()}
+        return [found[cid] for cid in chunk_ids if cid in found]
+
+    def filter_chunk_ids(self, flt: ChunkFilter) -> List[str]:
+        """
+        ids of the indexed chunks whose file matches the filter, answered from the file_meta side index;
+        a near-duplicate in a matching file brings in its canonical chunk
+        """
+        clause, params = flt.sql()
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT DISTINCT COALESCE(c.dup_of, c.chunk_id) FROM file_meta f JOIN chunks c ON c.rel_path = f.rel_path WHERE {clause}",
+                params,
+            )
+            return [row[0] for row in cur.fetchall()]
+
+    def duplicate_canonical_ids(self, flt: ChunkFilter) -> List[str]:
+        """canonical chunks with a near-duplicate in a file that matches the filter"""
+        clause, params = flt.sql()
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                f"SELECT DISTINCT c.dup_of FROM file_meta f JOIN chunks c ON c.rel_path = f.rel_path WHERE c.dup_of IS NOT NULL AND {clause}",
+                params,
+            )
+            return [row[0] for row in cur.fetchall()]
+
+    def get_meta(self, key: str) -> Optional[str]:
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT value FROM meta WHERE key=?", (key,))
+            row = cur.fetchone()
+            return row[0] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO meta(key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                (key, value),
+            )
+
+    def reset(self) -> None:
+        """forget every file and chunk; the generation keeps counting"""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM chunks")
+            cur.execute("DELETE FROM manifest")
+            cur.execute("DELETE FROM file_meta")
+
+    def get_generation(self) -> int:
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT value FROM meta WHERE key='generation'")
+            row = cur.fetchone()
+            return int(row[0]) if row else 0
+
+    def bump_generation(self) -> int:
+        """mark that the indexed corpus changed"""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                INSERT INTO meta(key, value) VALUES ('generation', '1')
+                ON CONFLICT(key) DO UPDATE SET value = CAST(CAST(value AS INTEGER) + 1 AS TEXT)
+                """
+            )
+            cur.execute("SELECT value FROM meta WHERE key='generation'")
+            return int(cur.fetchone()[0])
+
+    def _touch(self, rel_path: str, size: int, mtime: float):
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("UPDATE manifest SET size=?, mtime=? WHERE rel_path=?", (size, mtime, rel_path))
+
+
+def iter_corpus_files(folder: str):
+    """yield every ingestible file below folder, sorted for determinism"""
+    if not os.path.isdir(folder):
+        return
+    for path in sorted(glob.glob(os.path.join(folder, "**", "*"), recursive=True)):
+        if os.path.isdir(path):
+            continue
+        if path.lower().endswith(DOC_SUFFIXES):
+            yield path
+
+
+def file_sha256(path: str, block_size: int = 1 << 16) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def chunk_ids_for(rel_path: str, texts: List[str]) -> List[str]:
+    """
+    ids shared by the vector store, the chunk cache and the BM25 index, derived from
+    file path + chunk text: an edit only changes the ids of the chunks it touches, so
+    untouched chunks keep their vectors and cached rerank scores. a text repeated
+    within one file gets an occurrence suffix.
+    """
+    seen: Counter = Counter()
+    ids = []
+    for text in texts:
+        digest = hashlib.sha1(f"{rel_path}\0{text}".encode("utf-8")).hexdigest()[:24]
+        n = seen[digest]
+        seen[digest] += 1
+        ids.append(digest if n == 0 else f"{digest}-{n}")
+    return ids
+
+
+def read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        return f.read()
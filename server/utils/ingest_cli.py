@@ -0,0 +1,43 @@
+# command line of the ingestion pipeline:
+#   cd server && python -m utils.ingest_cli [--workers 8] [--embed-concurrency 8]
+# kept apart from utils.ingest_pipeline, which the utils package imports (through retrieve) before
+# runpy would run it as __main__
+
+import sys
+import logging
+import argparse
+from pathlib import Path
+from typing import List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+from utils.ingest_pipeline import IngestStats
+from utils.retrieve import ingest_corpus
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Sync the education corpus into Chroma and the BM25 index")
+    parser.add_argument("--workers", type=int, default=None, help="chunking processes (0 = all cores)")
+    parser.add_argument("--embed-batch", type=int, default=None, help="chunks per embedding request")
+    parser.add_argument("--embed-concurrency", type=int, default=None, help="embedding requests in flight")
+    parser.add_argument("--quiet", action="store_true", help="no progress line")
+    args = parser.parse_args(argv)
+
+    def show(stats: IngestStats):
+        print(f"\r{stats.line()}", end="", file=sys.stderr, flush=True)
+
+    overrides = {
+        "workers": args.workers,
+        "embed_batch": args.embed_batch,
+        "embed_concurrency": args.embed_concurrency,
+    }
+    stats = ingest_corpus(
+        progress=None if args.quiet else show, **{k: v for k, v in overrides.items() if v is not None}
+    )
+    if not args.quiet:
+        print(file=sys.stderr)
+    print(f"done: {stats.line()} | {stats.files_removed} removed")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
@@ -0,0 +1,332 @@
+import os
+import time
+import queue
+import random
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent import futures
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from utils.ingest import IngestStore, FileEntry
+from utils.dedup import NearDupIndex, minhash
+
+logger = logging.getLogger(__name__)
+
+FileChunks = Tuple[FileEntry, List[Document]]
+RETRYABLE_STATUS = (408, 409, 429, 500, 502, 503, 504)
+RETRYABLE_ERRORS = ("RateLimitError", "APITimeoutError", "APIConnectionError", "InternalServerError")
+POOL_MIN_FILES = 32  # below this, worker start-up costs more than chunking inline
+T = TypeVar("T")
+
+
+@dataclass
+class IngestStats:
+    files_total: int = 0
+    files_done: int = 0
+    files_removed: int = 0
+    chunks: int = 0
+    duplicates: int = 0
+    embed_batches: int = 0
+    embed_retries: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    elapsed: float = 0.0
+
+    @property
+    def chunks_per_s(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def files_per_s(self) -> float:
+        return self.files_done / self.elapsed if self.elapsed else 0.0
+
+    def line(self) -> str:
+        return (
+            f"{self.files_done}/{self.files_total} files | {self.chunks} chunks ({self.duplicates} near-duplicates) | "
+            f"{self.chunks_per_s:.1f} chunks/s | {self.files_per_s:.2f} files/s | "
+            f"{self.embed_batches} embed batches ({self.embed_retries} retries) | {self.elapsed:.1f}s"
+        )
+
+
+class IngestPipeline:
+    """
+    streaming chunk -> embed -> upsert, with the three stages overlapping.
+    changed files are chunked in a process pool (`chunk_fn` must be picklable), chunks of whole
+    files are grouped into batches that are embedded concurrently with backoff on rate limits,
+    and one writer thread drains a bounded queue into the vector store and commits each file
+    to the manifest. every stage has a bound on in-flight work, so memory stays flat however
+    large the corpus is, and an interrupted run resumes from the manifest.
+
+    `embeddings` should be the cached embedder the vector store was built with: the embed
+    stage fills the cache and the writer's add_documents is then served from it.
+
+    with a `dedup` index, every new chunk is checked against the canonical chunks before it is
+    embedded: a near-duplicate is only recorded in the chunk cache, pointing at its canonical
+    chunk, and is never embedded or indexed. chunks left without a canonical chunk by edits and
+    removals are re-assigned at the end of the run.
+    """
+
+    def __init__(
+        self,
+        store: IngestStore,
+        vector,
+        embeddings: Embeddings,
+        chunk_fn: Callable[[FileEntry], List[Document]],
+        workers: int = 0,
+        embed_batch: int = 64,
+        embed_concurrency: int = 4,
+        queue_size: int = 8,
+        max_retries: int = 6,
+        progress: Optional[Callable[[IngestStats], None]] = None,
+        dedup: Optional[NearDupIndex] = None,
+    ):
+        self.store = store
+        self.vector = vector
+        self.embeddings = embeddings
+        self.chunk_fn = chunk_fn
+        self.workers = workers or os.cpu_count() or 1
+        self.embed_batch = embed_batch
+        self.embed_concurrency = max(1, embed_concurrency)
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.progress = progress
+        self.dedup = dedup
+        # chunk id -> (canonical chunk id or None, signature), from the dedup step to the writer
+        self._dups: Dict[str, Tuple[Optional[str], Optional[bytes]]] = {}
+        self._lock = threading.Lock()
+        self._error: Optional[BaseException] = None
+
+    def run(self, changed: Sequence[FileEntry], removed: Sequence[str]) -> IngestStats:
+        stats = IngestStats(files_total=len(changed))
+        if self.dedup is not None:
+            self.dedup.load(self.store.canonical_signatures())
+        for rel_path in removed:
+            stale = self.store.remove_file(rel_path)
+            if stale:
+                self.vector.delete(ids=stale)
+                self._forget(stale)
+            stats.files_removed += 1
+        if changed:
+            self._run_changed(changed, stats)
+        # not after a failure: the dedup index may then hold chunks that were never written, and an
+        # orphan must not join one of those. the failed files are still changed in the manifest, so
+        # the next sync runs the pipeline again and settles the orphans then
+        if self.dedup is not None:
+            self._adopt_orphans(stats)
+        stats.elapsed = time.perf_counter() - stats.started
+        return stats
+
+    def _run_changed(self, changed: Sequence[FileEntry], stats: IngestStats) -> None:
+        ready: "queue.Queue[Optional[List[FileChunks]]]" = queue.Queue(maxsize=self.queue_size)
+        writer = threading.Thread(target=self._write, args=(ready, stats), name="ingest-writer", daemon=True)
+        writer.start()
+        try:
+            with futures.ThreadPoolExecutor(self.embed_concurrency, thread_name_prefix="ingest-embed") as embed_pool:
+                inflight: deque = deque()
+                batches = self._batches(self._deduped(self._chunked(changed)))
+                try:
+                    for batch in batches:
+                        if self._error is not None:
+                            break  # the writer failed: the rest would be embedded (and paid for) for nothing
+                        inflight.append(embed_pool.submit(self._embed, batch, stats))
+                        # hand batches over in order; blocks while the writer is behind
+                        while len(inflight) > self.embed_concurrency or (inflight and inflight[0].done()):
+                            ready.put(inflight.popleft().result())
+                    while inflight and self._error is None:
+                        ready.put(inflight.popleft().result())
+                finally:
+                    batches.close()  # stops the chunking pool too
+                    for fut in inflight:
+                        fut.cancel()
+        finally:
+            ready.put(None)
+            writer.join()
+
+        if self._error is not None:
+            raise self._error
+
+    def _chunked(self, changed: Sequence[FileEntry]) -> Iterator[FileChunks]:
+        """(file, chunks) as files finish chunking, at most 2 * workers files in flight"""
+        workers = min(self.workers, len(changed))
+        if workers <= 1 or len(changed) < POOL_MIN_FILES:
+            for entry in changed:
+                yield entry, self.chunk_fn(entry)
+            return
+
+        # spawn: the caller may already run model / pool threads that must not be forked
+        ctx = multiprocessing.get_context("spawn")
+        with futures.ProcessPoolExecutor(workers, mp_context=ctx) as pool:
+            todo = iter(changed)
+            pending: Dict[futures.Future, FileEntry] = {}
+            for entry in todo:
+                pending[pool.submit(self.chunk_fn, entry)] = entry
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                for fut in done:
+                    entry = pending.pop(fut)
+                    nxt = next(todo, None)
+                    if nxt is not None:
+                        pending[pool.submit(self.chunk_fn, nxt)] = nxt
+                    yield entry, fut.result()
+
+    def _deduped(self, chunked: Iterator[FileChunks]) -> Iterator[FileChunks]:
+        """
+        decide for every chunk whether it is canonical or a near-duplicate, in corpus order.
+        a chunk id the store already has keeps its current role, so an edit never demotes an
+        indexed chunk; the file's old chunks that go away stop being match targets.
+        """
+        for entry, docs in chunked:
+            if self.dedup is not None:
+                known = self.store.chunk_dedup(entry.rel_path)
+                new_ids = {d.id for d in docs}
+                self._forget([cid for cid, (dup_of, _) in known.items() if dup_of is None and cid not in new_ids])
+                for d in docs:
+                    dup_of, sig = known.get(d.id, (None, None))
+                    signature = minhash(d.page_content) if sig is None else None
+                    if d.id not in known:
+                        dup_of = self.dedup.match(signature)
+                        if dup_of is None:
+                            self.dedup.add(d.id, signature)
+                    self._dups[d.id] = (dup_of, sig if signature is None else signature.tobytes())
+            yield entry, docs
+
+    def _forget(self, chunk_ids: List[str]) -> None:
+        if self.dedup is not None:
+            for cid in chunk_ids:
+                self.dedup.discard(cid)
+
+    def _canonical(self, doc: Document) -> bool:
+        return self._dups.get(doc.id, (None, None))[0] is None
+
+    def _batches(self, chunked: Iterator[FileChunks]) -> Iterator[List[FileChunks]]:
+        """whole files grouped until a batch holds at least `embed_batch` chunks to embed"""
+        batch: List[FileChunks] = []
+        size = 0
+        for entry, docs in chunked:
+            batch.append((entry, docs))
+            size += sum(1 for d in docs if self._canonical(d))
+            if size >= self.embed_batch:
+                yield batch
+                batch, size = [], 0
+        if batch:
+            yield batch
+
+    def _embed(self, batch: List[FileChunks], stats: IngestStats) -> List[FileChunks]:
+        texts = [d.page_content for _, docs in batch for d in docs if self._canonical(d)]
+        if not texts:
+            return batch
+
+        def retried() -> None:
+            with self._lock:
+                stats.embed_retries += 1
+
+        with_backoff(lambda: self.embeddings.embed_documents(texts), self.max_retries, on_retry=retried)
+        with self._lock:
+            stats.embed_batches += 1
+        return batch
+
+    def _write(self, ready: "queue.Queue[Optional[List[FileChunks]]]", stats: IngestStats) -> None:
+        while True:
+            batch = ready.get()
+            if batch is None:
+                return
+            if self._error is not None:
+                continue  # keep draining so the producer never blocks on a dead writer
+            try:
+                # chunks whose id and position are unchanged are already in the vector store,
+                # near-duplicates never are
+                docs = []
+                for entry, file_docs in batch:
+                    indexed = self.store.chunk_positions(entry.rel_path)
+                    docs.extend(d for d in file_docs if self._canonical(d) and indexed.get(d.id) != d.metadata["idx"])
+                if docs:
+                    self.vector.add_documents(docs, ids=[d.id for d in docs])
+                for entry, file_docs in batch:
+                    dedup = {d.id: self._dups.pop(d.id) for d in file_docs if d.id in self._dups}
+                    stale = self.store.replace_file(
+                        entry, [(d.id, d.metadata["idx"], d.page_content, d.metadata) for d in file_docs], dedup=dedup
+                    )
+                    if stale:
+                        self.vector.delete(ids=stale)
+                    stats.files_done += 1
+                    stats.chunks += len(file_docs)
+                    stats.duplicates += sum(1 for dup_of, _ in dedup.values() if dup_of is not None)
+                stats.elapsed = time.perf_counter() - stats.started
+                if self.progress:
+                    self.progress(stats)
+            except BaseException as e:
+                self._error = e
+
+
+    def _adopt_orphans(self, stats: IngestStats) -> None:
+        """near-duplicates whose canonical chunk went away join another one or become canonical and get indexed"""
+        updates: List[Tuple[str, Optional[str]]] = []
+        promoted: List[Document] = []
+        for cid, text, metadata, sig in self.store.orphaned_chunks():
+            signature = np.frombuffer(sig, dtype=np.uint32) if sig else minhash(text)
+            dup_of = self.dedup.match(signature)
+            if dup_of is None:
+                self.dedup.add(cid, signature)
+                promoted.append(Document(id=cid, page_content=text, metadata=metadata))
+            updates.append((cid, dup_of))
+        if promoted:
+            self.vector.add_documents(promoted, ids=[d.id for d in promoted])
+        if updates:
+            self.store.set_dup_of(updates)
+            logger.info(f"Near-duplicates re-assigned: {len(updates)} orphaned, {len(promoted)} promoted to canonical")
+
+
+class BackoffEmbeddings(Embeddings):
+    """
+    embeddings whose requests back off on rate limits as the embed stage does, for embedding calls
+    made outside it: the semantic chunker's, in the chunking processes
+    """
+
+    def __init__(self, underlying: Embeddings, max_retries: int = 6):
+        self.underlying = underlying
+        self.max_retries = max_retries
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return with_backoff(lambda: self.underlying.embed_documents(texts), self.max_retries)
+
+    def embed_query(self, text: str) -> List[float]:
+        return with_backoff(lambda: self.underlying.embed_query(text), self.max_retries)
+
+
+def with_backoff(call: Callable[[], T], max_retries: int = 6, on_retry: Optional[Callable[[], None]] = None) -> T:
+    """call(), retried on rate limits and transient errors after Retry-After or a jittered exponential delay"""
+    for attempt in range(max_retries + 1):
+        try:
+            return call()
+        except Exception as e:
+            if attempt == max_retries or not _is_retryable(e):
+                raise
+            delay = _retry_after(e) or min(60.0, 2.0 ** attempt) * (0.5 + random.random() / 2)
+            if on_retry is not None:
+                on_retry()
+            logger.warning(f"Embedding request failed ({type(e).__name__}), retry {attempt + 1} in {delay:.1f}s")
+            time.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+def _is_retryable(e: BaseException) -> bool:
+    status = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS
+    return isinstance(e, (TimeoutError, ConnectionError)) or type(e).__name__ in RETRYABLE_ERRORS
+
+
+def _retry_after(e: BaseException) -> Optional[float]:
+    headers = getattr(getattr(e, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,128 @@
+import time
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, Optional
+
+import numpy as np
+
+
+class MetricsRegistry:
+    """
+    process-wide metrics: monotonically increasing counters, bounded windows of observed
+    values (latencies in ms) summarized as percentiles, and pull-style collectors that
+    components register to report their own stats (cache hit ratios etc.) on snapshot.
+    """
+
+    def __init__(self, window: int = 2048):
+        self.window = window
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._samples: Dict[str, Deque[float]] = {}
+        self._collectors: Dict[str, Callable[[], Dict]] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(float(value))
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """observe the wall time of the block in milliseconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+
+    def register(self, name: str, collector: Callable[[], Dict]) -> None:
+        self._collectors[name] = collector
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            counters = dict(self._counters)
+            samples = {name: np.asarray(values) for name, values in self._samples.items() if values}
+        summaries = {
+            name: {
+                "count": int(arr.size),
+                "mean": float(arr.mean()),
+                "p50": float(np.percentile(arr, 50)),
+                "p95": float(np.percentile(arr, 95)),
+                "p99": float(np.percentile(arr, 99)),
+                "max": float(arr.max()),
+            }
+            for name, arr in samples.items()
+        }
+        return {
+            "counters": counters,
+            "summaries": summaries,
+            **{name: collector() for name, collector in self._collectors.items()},
+        }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._samples.clear()
+
+
+class StageTrace:
+    """
+    timings and counters of one request, stage by stage. stages may run on pool threads;
+    each writes only its own record. finish() stamps the total and pushes every numeric
+    value to the registry as a sample ("<prefix>.<stage>.<key>") and every flag as a counter;
+    later calls are no-ops, so it can sit in a `finally` after an early finish.
+    """
+
+    def __init__(self, prefix: str, registry: Optional[MetricsRegistry] = None):
+        self.prefix = prefix
+        self.registry = registry
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.total_ms: Optional[float] = None
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, **values) -> Iterator[Dict[str, Any]]:
+        """time the block; the yielded record takes counters such as n_in / n_out"""
+        record = self.stages.setdefault(name, {})
+        record.update(values)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["ms"] = round((time.perf_counter() - start) * 1000, 3)
+
+    def note(self, name: str, **values) -> None:
+        self.stages.setdefault(name, {}).update(values)
+
+    def finish(self) -> "StageTrace":
+        if self.total_ms is not None:
+            return self
+        self.total_ms = round((time.perf_counter() - self._start) * 1000, 3)
+        registry = self.registry or METRICS
+        registry.incr(f"{self.prefix}.calls")
+        registry.observe(f"{self.prefix}.total_ms", self.total_ms)
+        for stage, record in list(self.stages.items()):
+            for key, value in list(record.items()):
+                name = f"{self.prefix}.{stage}.{key}"
+                if isinstance(value, bool):
+                    registry.incr(name, int(value))
+                elif isinstance(value, (int, float)):
+                    registry.observe(name, value)
+        return self
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"total_ms": self.total_ms, "stages": {name: dict(record) for name, record in self.stages.items()}}
+
+
+def hit_ratio(hits: float, misses: float) -> float:
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+METRICS = MetricsRegistry()
@@ -3,8 +3,9 @@
 import praw
 import time
 import logging
+import threading
 import json
-from typing import Optional
+from typing import Callable, Optional
 from config import DATA_DIR
 from collections import deque
 
@@ -16,11 +17,21 @@ class RedditCollector:
     # ['AskEngineers' ,'financialindependence' ,'Entrepreneur' ,'smallbusiness' , 'lifehacks' ,
     # 'productivity', 'GetMotivated' ,'GetStudying' ,'Cooking' ,'fantasywriters' ,'WritingPrompts' ,'ShortStories','Jokes']
     # subr = "funny"
-    def __init__(self, client: praw.Reddit, subr_list: list[str], month_limit: int = 12, log: Optional[logging.Logger] = logger):
+    def __init__(
+        self,
+        client: praw.Reddit,
+        subr_list: list[str],
+        month_limit: int = 12,
+        log: Optional[logging.Logger] = logger,
+        clock: Callable[[], float] = time.time,
+    ):
         self.reddit = client
+        self.clock = clock  # "now" for the age of posts and comments; deadlines always use real time
         self.subr_list = subr_list
         self.month_limit = month_limit
         self.logger = log
+        self.timed_out = False
+        self._stop: Optional[threading.Event] = None
 
 
     def search(
@@ -32,6 +43,9 @@ class RedditCollector:
         max_seconds: int = 5,
         per_item_max_chars: int = 500,
         max_total_chars: int = 2000,
+        timeout: Optional[float] = None,
+        on_factor: Optional[Callable[[list], None]] = None,
+        stop: Optional[threading.Event] = None,
     ):
         """
         params:
@@ -42,19 +56,29 @@ class RedditCollector:
             max_seconds: time limit per subreddit
             per_item_max_chats: maximum text length for each
             max_total_chats: total budget for each subreddit
+            timeout: seconds for all subreddits together; the rest are skipped and `timed_out` is set
+            on_factor: called with each subreddit's pieces as soon as they are collected
+            stop: once set, the search ends as at the deadline (the caller has stopped waiting)
         """
         factors = []
+        self.timed_out = False
+        self._stop = stop
+        overall = time.time() + timeout if timeout is not None else float("inf")
         for subr in self.subr_list:
+            if self._expired(overall):
+                self.timed_out = True
+                self.logger.debug(f"Deadline reached, r/{subr} and later subreddits skipped")
+                break
             subreddit = self.reddit.subreddit(subr)
             collect_list = []
             start = time.time()
-            deadline = start + max_seconds
+            deadline = min(start + max_seconds, overall)
             taken_comments = 0
             used_chars = 0
             seen_submissions = 0
 
             for subm in subreddit.hot(limit=max_submissions):
-                if time.time() >= deadline:
+                if self._expired(deadline):
                     break
                 if not self._has_time_efficiency(getattr(subm, "created_utc", 0)):
                     continue
@@ -93,16 +117,21 @@ class RedditCollector:
                 used_chars += got_chars
                 seen_submissions += 1
 
-                if time.time() >= deadline or used_chars >= max_total_chars or taken_comments >= max_comments:
+                if self._expired(deadline) or used_chars >= max_total_chars or taken_comments >= max_comments:
                     break
 
                 time.sleep(0.2)
 
+            if self._expired(overall):
+                self.timed_out = True
+
             if len(collect_list) > max_count:
                 collect_list = collect_list[:max_count]
 
             if return_factor:
                 factors.extend(collect_list)
+                if on_factor is not None and collect_list:
+                    on_factor(collect_list)
             else:
                 self._dump_a_subreddit(collect_list, subr)
 
@@ -110,6 +139,10 @@ class RedditCollector:
             return factors
 
 
+    def _expired(self, deadline: float) -> bool:
+        return time.time() >= deadline or (self._stop is not None and self._stop.is_set())
+
+
     def _clip_text(self, text: str, per_item_max_chars: int) -> str:
         if not text:
             return ""
@@ -147,9 +180,9 @@ class RedditCollector:
 
     def _has_time_efficiency(self, created_utc, dateback_months: int = 3):
         if dateback_months:
-            return time.time() - created_utc <= dateback_months*30*24*3600
+            return self.clock() - created_utc <= dateback_months*30*24*3600
         else:
-            return time.time() - created_utc <= self.month_limit*30*24*3600
+            return self.clock() - created_utc <= self.month_limit*30*24*3600
     
 
     def _contents_in_a_submission(self, submission):
@@ -182,7 +215,7 @@ class RedditCollector:
         used_chars = 0
 
         for comment in getattr(submission, "comments", []):
-            if time.time() >= deadline:
+            if self._expired(deadline):
                 break
             body = getattr(comment, "body", None)
             if body and body != "[deleted]":
@@ -197,7 +230,7 @@ class RedditCollector:
 
             dq = deque(getattr(comment, "replies", []) or [])
             while dq:
-                if time.time() >= deadline:
+                if self._expired(deadline):
                     break
                 reply = dq.popleft()
                 rbody = getattr(reply, "body", None)
@@ -0,0 +1,435 @@
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import argparse
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from pathlib import Path
+from typing import List, Tuple, Dict, Optional, Sequence
+
+import numpy as np
+from pydantic import ConfigDict
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import Document, BaseDocumentCompressor
+from langchain_community.cross_encoders import BaseCrossEncoder, HuggingFaceCrossEncoder
+
+from utils.cjk_tokenizer import normalize
+
+logger = logging.getLogger(__name__)
+
+ONNX_FILE = "model.onnx"
+QUANTIZED_FILE = "model_quantized.onnx"
+
+
+class OnnxCrossEncoder(BaseCrossEncoder):
+    """
+    Cross-encoder running an exported (optionally int8-quantized) model on ONNX Runtime CPU.
+    scores are sigmoid(logit), the same activation sentence_transformers applies for
+    single-label rerankers, so it is a drop-in for HuggingFaceCrossEncoder inside CrossEncoderReranker.
+    """
+
+    def __init__(self, model_dir: str, intra_op_threads: int = 0, max_length: int = 512, batch_size: int = 32):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path = os.path.join(model_dir, QUANTIZED_FILE)
+        if not os.path.exists(model_path):
+            model_path = os.path.join(model_dir, ONNX_FILE)
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = intra_op_threads
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.model_path = model_path
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        pad_token = _pad_token(model_dir)
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+
+    def score(self, text_pairs: List[Tuple[str, str]]) -> List[float]:
+        scores: List[float] = []
+        for i in range(0, len(text_pairs), self.batch_size):
+            scores.extend(self._score_batch(text_pairs[i:i + self.batch_size]))
+        return scores
+
+    def _score_batch(self, pairs: List[Tuple[str, str]]) -> List[float]:
+        if not pairs:
+            return []
+        encodings = self.tokenizer.encode_batch([(q, p) for q, p in pairs])
+        feeds = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+        }
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.asarray([e.type_ids for e in encodings], dtype=np.int64)
+        logits = self.session.run(None, feeds)[0]
+        if logits.ndim > 1 and logits.shape[1] > 1:
+            # two-class heads: keep the "relevant" logit, as HuggingFaceCrossEncoder does
+            logits = logits[:, 1]
+        return (1.0 / (1.0 + np.exp(-logits.reshape(-1)))).tolist()
+
+
+class BatchingCrossEncoder(BaseCrossEncoder):
+    """
+    Cross-request micro-batching in front of a cross-encoder.
+    concurrent `score` calls are queued; a single worker thread collects pairs arriving within
+    `window_ms` (only while more than one caller is in flight, so a lone query never waits),
+    sorts them by length to minimize padding, runs one forward pass and scatters the scores back.
+    a caller of `score` waits at most `timeout` seconds; `submit` hands out the future itself.
+    """
+
+    def __init__(self, model: BaseCrossEncoder, window_ms: float = 5.0, max_batch: int = 256, timeout: Optional[float] = 30.0):
+        self.model = model
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.batches = 0
+        self.requests = 0
+        self._queue: "queue.Queue[Tuple[List[Tuple[str, str]], Future]]" = queue.Queue()
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="rerank-batcher", daemon=True)
+        self._worker.start()
+
+    def score(self, text_pairs: List[Tuple[str, str]]) -> List[float]:
+        return self.submit(text_pairs).result(timeout=self.timeout)
+
+    def submit(self, text_pairs: List[Tuple[str, str]]) -> Future:
+        """queue the pairs; the future resolves to their scores, or the batch's exception"""
+        pairs = list(text_pairs)
+        fut: Future = Future()
+        if not pairs:
+            fut.set_result([])
+            return fut
+        with self._lock:
+            self._inflight += 1
+        fut.add_done_callback(self._resolved)
+        self._queue.put((pairs, fut))
+        return fut
+
+    def _resolved(self, _: Future) -> None:
+        with self._lock:
+            self._inflight -= 1
+
+    def _collect(self) -> List[Tuple[List[Tuple[str, str]], Future]]:
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.window
+        while size < self.max_batch:
+            try:
+                # drain whatever is queued already; only wait if other callers are still on their way
+                if self._inflight > len(batch):
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._score_batch(batch)
+            except BaseException as e:
+                # every caller of the batch gets an answer, and the worker lives on for the next one
+                if not isinstance(e, Exception):
+                    logger.error(f"Rerank batch aborted: {e!r}")
+                    e = RuntimeError(f"rerank batch aborted: {e!r}")
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+
+    def _score_batch(self, batch: List[Tuple[List[Tuple[str, str]], Future]]) -> None:
+        pairs = [p for item, _ in batch for p in item]
+        order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][0]) + len(pairs[i][1]))
+        sorted_scores = list(self.model.score([pairs[i] for i in order]))
+        if len(sorted_scores) != len(pairs):
+            raise ValueError(f"cross-encoder returned {len(sorted_scores)} scores for {len(pairs)} pairs")
+
+        scores = [0.0] * len(pairs)
+        for pos, i in enumerate(order):
+            scores[i] = float(sorted_scores[pos])
+        self.batches += 1
+        self.requests += len(batch)
+
+        offset = 0
+        for item, fut in batch:
+            fut.set_result(scores[offset:offset + len(item)])
+            offset += len(item)
+
+
+class RerankScoreCache:
+    """
+    LRU of (normalized query, chunk id, model) -> cross-encoder score.
+    when `db_path` is set, scores are also persisted to SQLite so they survive restarts.
+    """
+
+    def __init__(self, model: str, max_entries: int = 50_000, db_path: Optional[str] = None):
+        self.model = model
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self.hits = 0
+        self.misses = 0
+        self._mem: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        if db_path:
+            self._init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute("PRAGMA busy_timeout = 5000;")
+        return conn
+
+    def _init_db(self):
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS rerank_scores(
+                  key TEXT PRIMARY KEY,
+                  score REAL NOT NULL,
+                  last_used REAL NOT NULL
+                )
+                """
+            )
+            cur.execute("CREATE INDEX IF NOT EXISTS ix_rerank_scores_last_used ON rerank_scores(last_used);")
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(normalize(query).split())
+
+    def key(self, query: str, chunk_id: str) -> str:
+        raw = f"{self.model}\0{self.normalize_query(query)}\0{chunk_id}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, float]:
+        found: Dict[str, float] = {}
+        with self._lock:
+            for k in keys:
+                if k in self._mem:
+                    self._mem.move_to_end(k)
+                    found[k] = self._mem[k]
+        rest = [k for k in keys if k not in found]
+        if rest and self.db_path:
+            from_disk = self._db_get(rest)
+            found.update(from_disk)
+            self._remember(from_disk)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, scores: Dict[str, float]):
+        self._remember(scores)
+        if self.db_path and scores:
+            now = time.time()
+            with self._connect() as conn:
+                cur = conn.cursor()
+                cur.executemany(
+                    "INSERT OR REPLACE INTO rerank_scores(key, score, last_used) VALUES (?, ?, ?)",
+                    [(k, float(v), now) for k, v in scores.items()],
+                )
+                cur.execute("SELECT COUNT(*) FROM rerank_scores")
+                count = cur.fetchone()[0]
+                if count > self.max_entries:
+                    cur.execute(
+                        "DELETE FROM rerank_scores WHERE key IN (SELECT key FROM rerank_scores ORDER BY last_used ASC LIMIT ?)",
+                        (count - int(self.max_entries * 0.9),),
+                    )
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+        if self.db_path:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM rerank_scores")
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / total if total else 0.0}
+
+    def _remember(self, scores: Dict[str, float]):
+        with self._lock:
+            for k, v in scores.items():
+                self._mem[k] = float(v)
+                self._mem.move_to_end(k)
+            while len(self._mem) > self.max_entries:
+                self._mem.popitem(last=False)
+
+    def _db_get(self, keys: List[str], batch: int = 500) -> Dict[str, float]:
+        found: Dict[str, float] = {}
+        with self._connect() as conn:
+            cur = conn.cursor()
+            for i in range(0, len(keys), batch):
+                part = keys[i:i + batch]
+                marks = ",".join("?" * len(part))
+                cur.execute(f"SELECT key, score FROM rerank_scores WHERE key IN ({marks})", part)
+                found.update({k: v for k, v in cur.fetchall()})
+            if found:
+                now = time.time()
+                cur.executemany("UPDATE rerank_scores SET last_used=? WHERE key=?", [(now, k) for k in found])
+        return found
+
+
+class CachedCrossEncoderReranker(BaseDocumentCompressor):
+    """
+    same contract as langchain's CrossEncoderReranker, but only (query, chunk) pairs
+    missing from `cache` are sent to the model
+    """
+
+    model: BaseCrossEncoder
+    cache: RerankScoreCache
+    top_n: int = 3
+
+    model_config = ConfigDict(arbitrary_types_allowed=True, extra="forbid")
+
+    def compress_documents(
+        self,
+        documents: Sequence[Document],
+        query: str,
+        callbacks: Optional[Callbacks] = None,
+    ) -> Sequence[Document]:
+        return self.compress_many([(query, documents)])[0]
+
+    def compress_many(
+        self, requests: Sequence[Tuple[str, Sequence[Document]]], stats: Optional[Dict[str, int]] = None
+    ) -> List[List[Document]]:
+        """
+        rerank several (query, documents) lists, scoring every uncached pair in one call
+        :param stats: filled with cache_hits / scored for this call
+        """
+        keys = [[self.cache.key(query, _chunk_key(d)) for d in docs] for query, docs in requests]
+        known = self.cache.get_many([k for ks in keys for k in ks])
+
+        todo: Dict[str, Tuple[str, str]] = {}
+        for (query, docs), ks in zip(requests, keys):
+            for d, k in zip(docs, ks):
+                if k not in known and k not in todo:
+                    todo[k] = (query, d.page_content)
+        if stats is not None:
+            stats["cache_hits"] = len(known)
+            stats["scored"] = len(todo)
+        if todo:
+            new_scores = self._score(todo)
+            self.cache.put_many(new_scores)
+            known.update(new_scores)
+
+        ranked_lists = []
+        for (_, docs), ks in zip(requests, keys):
+            ranked = sorted(zip(docs, ks), key=lambda dk: known[dk[1]], reverse=True)
+            ranked_lists.append([d for d, _ in ranked[: self.top_n]])
+        return ranked_lists
+
+
+    def _score(self, todo: Dict[str, Tuple[str, str]]) -> Dict[str, float]:
+        """cache key -> score of the pairs; a batch the caller stops waiting for still fills the cache"""
+        submit = getattr(self.model, "submit", None)
+        if submit is None:
+            return {k: float(s) for k, s in zip(todo, self.model.score(list(todo.values())))}
+
+        fut = submit(list(todo.values()))
+        try:
+            fresh = fut.result(timeout=getattr(self.model, "timeout", None))
+        except FutureTimeout:
+            fut.add_done_callback(lambda f: self._cache_late(todo, f))
+            raise
+        return {k: float(s) for k, s in zip(todo, fresh)}
+
+    def _cache_late(self, todo: Dict[str, Tuple[str, str]], fut: Future) -> None:
+        if fut.exception() is None:
+            self.cache.put_many({k: float(s) for k, s in zip(todo, fut.result())})
+
+
+def _chunk_key(doc: Document) -> str:
+    """chunk id, or a content hash for documents that never went through ingestion"""
+    return doc.id or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def _pad_token(model_dir: str) -> str:
+    try:
+        with open(os.path.join(model_dir, "tokenizer_config.json"), "r", encoding="utf-8") as f:
+            pad = json.load(f).get("pad_token")
+        if isinstance(pad, dict):
+            pad = pad.get("content")
+        return pad or "<pad>"
+    except OSError:
+        return "<pad>"
+
+
+def build_cross_encoder(backend: str, model_name: str, onnx_dir: str, threads: int = 0) -> BaseCrossEncoder:
+    """reranker backend selected by RERANKER_BACKEND: torch (sentence_transformers) | onnx"""
+    if backend == "onnx":
+        if os.path.exists(os.path.join(onnx_dir, QUANTIZED_FILE)) or os.path.exists(os.path.join(onnx_dir, ONNX_FILE)):
+            return OnnxCrossEncoder(onnx_dir, intra_op_threads=threads)
+        logger.warning(f"No ONNX reranker under {onnx_dir}, run `python -m utils.rerank export` first. Falling back to torch.")
+    elif backend != "torch":
+        raise ValueError(f"unknown reranker backend: {backend}")
+    return HuggingFaceCrossEncoder(model_name=model_name)
+
+
+def export_onnx(model_name: str, out_dir: str, quantize: bool = True, opset: int = 17) -> str:
+    """export a HF sequence-classification reranker to ONNX and dynamically quantize weights to int8"""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    os.makedirs(out_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name).eval()
+    tokenizer.save_pretrained(out_dir)
+
+    sample = tokenizer([("query", "passage")], return_tensors="pt")
+    input_names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in sample]
+    dynamic = {k: {0: "batch", 1: "seq"} for k in input_names}
+    dynamic["logits"] = {0: "batch"}
+    onnx_path = os.path.join(out_dir, ONNX_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[k] for k in input_names),
+            onnx_path,
+            input_names=input_names,
+            output_names=["logits"],
+            dynamic_axes=dynamic,
+            opset_version=opset,
+        )
+    logger.info(f"Exported {model_name} to {onnx_path}")
+
+    if not quantize:
+        return onnx_path
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    quantized_path = os.path.join(out_dir, QUANTIZED_FILE)
+    # fp32 m3-sized models exceed the 2GB protobuf limit, so read them with external data
+    quantize_dynamic(onnx_path, quantized_path, weight_type=QuantType.QInt8, use_external_data_format=True)
+    logger.info(f"Quantized model written to {quantized_path}")
+    return quantized_path
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+    from config import RERANKER_MODEL, RERANKER_ONNX_DIR
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="reranker backend tools")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    exp = sub.add_parser("export", help="export + int8-quantize the reranker for the onnx backend")
+    exp.add_argument("--model", default=RERANKER_MODEL)
+    exp.add_argument("--out", default=str(RERANKER_ONNX_DIR))
+    exp.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    if args.cmd == "export":
+        export_onnx(args.model, args.out, quantize=not args.no_quantize)
@@ -0,0 +1,72 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from utils.cjk_tokenizer import normalize_query
+from utils.metrics import hit_ratio
+
+
+class ResultCache:
+    """
+    TTL + LRU cache of final tool output keyed by (normalized query, top_k, scope),
+    scope being anything else the answer depends on (e.g. the retrieval filter).
+    every entry is tagged with the corpus generation it was computed against; a lookup
+    under a newer generation is a miss and drops the entry, so re-ingestion invalidates
+    old answers without an explicit flush.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_s: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, int, str], Tuple[int, float, str]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_s > 0
+
+    @staticmethod
+    def key(query: str, top_k: int, scope: str = "") -> Tuple[str, int, str]:
+        return normalize_query(query), int(top_k), scope
+
+    def get(self, query: str, top_k: int, generation: int, scope: str = "") -> Optional[str]:
+        key = self.key(query, top_k, scope)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_generation, expires_at, value = entry
+                if entry_generation == generation and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expired += 1
+            self.misses += 1
+            return None
+
+    def put(self, query: str, top_k: int, generation: int, value: str, scope: str = "") -> None:
+        if not self.enabled:
+            return
+        key = self.key(query, top_k, scope)
+        with self._lock:
+            self._entries[key] = (generation, time.monotonic() + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "size": len(self._entries),
+            "hit_ratio": hit_ratio(self.hits, self.misses),
+        }
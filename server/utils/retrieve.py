@@ -3,146 +3,827 @@
 import os
 import sys
 import json
-import glob
+import asyncio
+import hashlib
 import logging
+import threading
+from concurrent import futures
 from pathlib import Path
-from typing import List, Optional, Dict, Tuple
+from typing import List, Optional, Dict, Tuple, Callable, TYPE_CHECKING
+
+import numpy as np
 from langchain_core.tools import tool
-from langchain_openai import OpenAIEmbeddings
 from langchain_community.docstore.document import Document
-from langchain_chroma.vectorstores import Chroma
 
-from langchain_community.retrievers import BM25Retriever
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_experimental.text_splitter import SemanticChunker
-from langchain.retrievers.document_compressors import EmbeddingsFilter, CrossEncoderReranker
-from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+if TYPE_CHECKING:
+    from langchain_chroma.vectorstores import Chroma
 
 logger = logging.getLogger(__name__)
 
 
 SERVER_ROOT = Path(__file__).resolve().parent.parent
 DATA_DIR = SERVER_ROOT / "data"
-DATA_DIR.mkdir(parents=True, exist_ok=True)
 CHROMA_DIR =  str(DATA_DIR / "retriever.db")
 DOCS_DIR = str(DATA_DIR / "education")
-INGEST_FLAG = os.path.join(DOCS_DIR, ".ingested")
+INGEST_FLAG = os.path.join(DOCS_DIR, ".ingested")  # legacy marker, superseded by the manifest
 
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-from config import CHUNK_SIZE, CHUNK_OVERLAP, EMB_MODEL, RERANKER_MODEL
-EMB = OpenAIEmbeddings(model=EMB_MODEL)
+from config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, EMB_MODEL, RERANKER_MODEL, SPARSE_TOKENIZER, EMB_CACHE_PATH, EMB_CACHE_MAX,
+    RERANKER_BACKEND, RERANKER_ONNX_DIR, RERANKER_THREADS, RERANK_BATCH_WINDOW_MS, RERANK_MAX_BATCH, RERANK_TIMEOUT,
+    RERANK_CACHE_MAX, RERANK_CACHE_PERSIST, RERANK_CACHE_PATH, RETRIEVE_WORKERS, RETRIEVE_STAGE_TIMEOUT,
+    RESULT_CACHE_MAX, RESULT_CACHE_TTL, RRF_K, RRF_WEIGHTS, INGEST_WORKERS, INGEST_EMBED_BATCH, INGEST_EMBED_CONCURRENCY,
+    VECTOR_BACKEND, VECTOR_HNSW_MIN, DEDUP_THRESHOLD,
+)
+from utils.ingest import IngestStore, FileEntry, CHUNK_ID_SCHEME, chunk_ids_for, read_text
+from utils.corpus_meta import ChunkFilter, FILE_META_VERSION, PROVINCES, extract_file_meta
+from utils.ingest_pipeline import IngestPipeline, IngestStats, BackoffEmbeddings
+from utils.dedup import DEDUP_SCHEME, NearDupIndex
+from utils.bm25_index import BM25Index
+from utils.cjk_tokenizer import resolve_tokenizer
+from utils.emb_cache import CachedEmbeddings
+from utils.embeddings import parse_spec, build_embeddings
+from utils.rerank import build_cross_encoder, BatchingCrossEncoder, RerankScoreCache, CachedCrossEncoderReranker
+from utils.result_cache import ResultCache
+from utils.metrics import METRICS, StageTrace
+from utils.vector_index import LocalVectorStore
+
+EMB_SPEC = parse_spec(EMB_MODEL)
+# each embedding backend gets its own collection, manifest and BM25 index: vectors of
+# different dimensions never meet, and neither do semantic chunks cut by different models
+INDEX_DIR = DATA_DIR if EMB_SPEC.is_legacy else DATA_DIR / "indexes" / EMB_SPEC.slug
+INGEST_DB = str(INDEX_DIR / "ingest.db")
+BM25_DIR = str(INDEX_DIR / "bm25_index")
+VECTOR_DIR = str(INDEX_DIR / "vector_index")
+
+RESULT_CACHE = ResultCache(max_entries=RESULT_CACHE_MAX, ttl_s=RESULT_CACHE_TTL)
+FILTER_K = 20
+FILTER_THRESHOLD = EMB_SPEC.filter_threshold
+# how chunks in the store were built; a store recorded under other values is re-ingested
+INGEST_SCHEMA = {
+    "chunk_ids": CHUNK_ID_SCHEME,
+    "file_meta": FILE_META_VERSION,
+    "dedup": f"{DEDUP_SCHEME}@{DEDUP_THRESHOLD:g}" if DEDUP_THRESHOLD > 0 else "off",
+}
+# store meta key: corpus generation the Chroma collection was last synced to (the local index keeps its own)
+CHROMA_GENERATION = "chroma_generation"
+
+# heavy objects are built on first use (or by warm_up), so importing this module stays cheap
+# and touches no disk
+_EMB: Optional[CachedEmbeddings] = None
+_SPLITTER = None
+_USE_SEMANTIC = False
+_RERANKER: Optional[CachedCrossEncoderReranker] = None
+RERANK_CACHE: Optional[RerankScoreCache] = None
+_VECTOR: Optional["Chroma | LocalVectorStore"] = None
+_BM25: Optional[BM25Index] = None
+_STORE: Optional[IngestStore] = None
+_POOL: Optional[futures.ThreadPoolExecutor] = None
+_MODEL_LOCK = threading.RLock()
+_INDEX_LOCK = threading.Lock()
+_LAZY_LOCK = threading.Lock()
+
+METRICS.register("result_cache", RESULT_CACHE.stats)
+METRICS.register("rerank_cache", lambda: RERANK_CACHE.stats() if RERANK_CACHE is not None else {})
+METRICS.register("emb_cache", lambda: _EMB.stats() if _EMB is not None else {})
+
+
+def _store() -> IngestStore:
+    """manifest and chunk cache of the index dir, created on first use"""
+    global _STORE
+    if _STORE is None:
+        with _LAZY_LOCK:
+            if _STORE is None:
+                Path(INGEST_DB).parent.mkdir(parents=True, exist_ok=True)
+                _STORE = IngestStore(INGEST_DB)
+    return _STORE
+
+
+def _pool() -> futures.ThreadPoolExecutor:
+    """dense (network embedding + ANN), sparse (CPU) and rerank stages run here so they overlap"""
+    global _POOL
+    if _POOL is None:
+        with _LAZY_LOCK:
+            if _POOL is None:
+                _POOL = futures.ThreadPoolExecutor(max_workers=RETRIEVE_WORKERS, thread_name_prefix="retrieve")
+    return _POOL
+
+
+def _rerank_cache() -> RerankScoreCache:
+    """cross-encoder scores by (query, chunk); with RERANK_CACHE_PERSIST, also in SQLite"""
+    global RERANK_CACHE
+    if RERANK_CACHE is None:
+        with _LAZY_LOCK:
+            if RERANK_CACHE is None:
+                RERANK_CACHE = RerankScoreCache(
+                    model=f"{RERANKER_BACKEND}:{RERANKER_MODEL}" + ("" if EMB_SPEC.is_legacy else f"@{EMB_SPEC.slug}"),
+                    max_entries=RERANK_CACHE_MAX,
+                    db_path=str(RERANK_CACHE_PATH) if RERANK_CACHE_PERSIST else None,
+                )
+    return RERANK_CACHE
+
+
+def get_embeddings() -> CachedEmbeddings:
+    """embedder shared by the semantic chunker, Chroma and the embedding filter"""
+    global _EMB
+    if _EMB is None:
+        with _MODEL_LOCK:
+            if _EMB is None:
+                _EMB = CachedEmbeddings(
+                    build_embeddings(EMB_SPEC),
+                    model=EMB_SPEC.cache_key,
+                    db_path=str(EMB_CACHE_PATH),
+                    max_entries=EMB_CACHE_MAX,
+                )
+    return _EMB
+
+
+def get_splitter():
+    """semantic chunker, or the recursive splitter when it cannot be built"""
+    global _SPLITTER, _USE_SEMANTIC
+    if _SPLITTER is None:
+        with _MODEL_LOCK:
+            if _SPLITTER is None:
+                from langchain_text_splitters import RecursiveCharacterTextSplitter
+                try:
+                    from langchain_experimental.text_splitter import SemanticChunker
+                    # also runs in the ingest chunking processes, outside the embed stage's backoff
+                    splitter = SemanticChunker(BackoffEmbeddings(get_embeddings()), breakpoint_threshold_type="percentile")
+                    _USE_SEMANTIC = True
+                except Exception as e:
+                    logger.warning("SemanticChunker unavailable, fallback to RecursiveCharacterTextSplitter: %s", e)
+                    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+                    _USE_SEMANTIC = False
+                _SPLITTER = splitter
+    return _SPLITTER
 
-try:
-    SEM_SPLITTER = SemanticChunker(EMB, breakpoint_threshold_type="percentile")
-    _USE_SEMANTIC = True
-except Exception as _e:
-    logger.warning("SemanticChunker unavailable, fallback to RecursiveCharacterTextSplitter: %s", _e)
-    SEM_SPLITTER = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-    _USE_SEMANTIC = False
 
-_HF_CE = HuggingFaceCrossEncoder(model_name=RERANKER_MODEL)
-_RERANKER = CrossEncoderReranker(model=_HF_CE, top_n=50)
-_VECTOR: Optional[Chroma] = None
-_BM25: Optional[BM25Retriever] = None
-_EMB_FILTER = EmbeddingsFilter(embeddings=EMB, similarity_threshold=0.3)
+def get_reranker() -> CachedCrossEncoderReranker:
+    """cross-encoder reranker; loading the model is the slowest part of startup"""
+    global _RERANKER
+    if _RERANKER is None:
+        with _MODEL_LOCK:
+            if _RERANKER is None:
+                cross_encoder = build_cross_encoder(
+                    RERANKER_BACKEND, RERANKER_MODEL, str(RERANKER_ONNX_DIR), threads=RERANKER_THREADS
+                )
+                # concurrent sessions share forward passes instead of contending for cores
+                service = BatchingCrossEncoder(
+                    cross_encoder, window_ms=RERANK_BATCH_WINDOW_MS, max_batch=RERANK_MAX_BATCH, timeout=RERANK_TIMEOUT
+                )
+                _RERANKER = CachedCrossEncoderReranker(model=service, cache=_rerank_cache(), top_n=50)
+    return _RERANKER
+
+
+def warm_up(background: bool = True) -> Optional[threading.Thread]:
+    """load models and indexes ahead of the first query, optionally on a daemon thread"""
+    def _run():
+        try:
+            get_embeddings()
+            get_reranker()
+            _ensure_indexes()
+            logger.info("Retrieval warm-up finished")
+        except Exception:
+            logger.exception("Retrieval warm-up failed")
+
+    if not background:
+        _run()
+        return None
+    thread = threading.Thread(target=_run, name="retrieve-warmup", daemon=True)
+    thread.start()
+    return thread
 
 
 @tool
-def db_retrieve(query: str, top_k: int = 5) -> str:
+def db_retrieve(
+    query: str,
+    top_k: int = 5,
+    timings: bool = False,
+    province: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> str:
     """
     only use this tool when the query is Chinese-education-related.
     Hybrid (BM25 + Dense) -> Reciprocal Rank Fusion -> BGE cross-encoder rerank -> Embedding filter compression.
+    optional filters narrow the corpus before scoring: province (e.g. "江苏") of the student the material
+    is about, and date_from / date_to ("YYYY", "YYYY-MM" or "YYYY-MM-DD") of the material.
+    set timings=True to get per-stage durations and candidate counts under "timings".
     """
+    trace = StageTrace("db_retrieve")
     try:
-        _ensure_indexes()
+        try:
+            flt = ChunkFilter.parse(province, date_from, date_to)
+        except ValueError as e:
+            return _bad_filter(e, province, trace)
+        scope = flt.key if flt else ""
+        generation = _prepare()
+        with trace.stage("result_cache") as rec:
+            cached = RESULT_CACHE.get(query, top_k, generation, scope)
+            rec["hit"] = cached is not None
+        if cached is not None:
+            return _with_timings(cached, trace, timings)
 
-        dense_docs = _VECTOR.similarity_search(query, k=max(20, top_k))
-        if _BM25:
-            _BM25.k = max(50, top_k)
-            sparse_docs = _BM25.invoke(query)
-        else:
-            sparse_docs = []
-        fused = _rrf_fuse({"dense": dense_docs, "sparse": sparse_docs}, k=max(50, top_k))
-        reranked_docs = _RERANKER.compress_documents(fused, query=query)
-        final_docs = _EMB_FILTER.compress_documents(reranked_docs, query=query)[:top_k]
-
-        return json.dumps(
-            {"results": [{"text": d.page_content, "metadata": d.metadata} for d in final_docs]},
-            ensure_ascii=False,
-        )
+        legs = _start_legs(query, top_k, trace, flt)
+        futures.wait(legs.values(), timeout=RETRIEVE_STAGE_TIMEOUT)
+        query_vec, candidates = _leg_results(legs, trace)
+        fused = _fuse(candidates, top_k, trace)
+
+        rerank = _pool().submit(_rerank, query, fused, trace)
+        futures.wait([rerank], timeout=RETRIEVE_STAGE_TIMEOUT)
+        reranked_docs, reranked = _stage_result("rerank", rerank, fallback=fused, trace=trace)
+        final_docs = _select(reranked_docs, query_vec, top_k, trace)
+
+        result = _to_json(final_docs)
+        if reranked and len(candidates) == len(legs):
+            RESULT_CACHE.put(query, top_k, generation, result, scope)
+        return _with_timings(result, trace, timings)
     except Exception as e:
         logger.exception("db_retrieve error")
+        trace.note("request", error=True)
         return json.dumps({"error": str(e)})
+    finally:
+        # failed and timed-out calls are the ones /stats must not miss
+        trace.finish()
+
+
+@tool
+async def adb_retrieve(
+    query: str,
+    top_k: int = 5,
+    timings: bool = False,
+    province: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> str:
+    """
+    only use this tool when the query is Chinese-education-related.
+    Hybrid (BM25 + Dense) -> Reciprocal Rank Fusion -> BGE cross-encoder rerank -> Embedding filter compression.
+    optional filters narrow the corpus before scoring: province (e.g. "江苏") of the student the material
+    is about, and date_from / date_to ("YYYY", "YYYY-MM" or "YYYY-MM-DD") of the material.
+    set timings=True to get per-stage durations and candidate counts under "timings".
+    """
+    trace = StageTrace("db_retrieve")
+    try:
+        try:
+            flt = ChunkFilter.parse(province, date_from, date_to)
+        except ValueError as e:
+            return _bad_filter(e, province, trace)
+        scope = flt.key if flt else ""
+        loop = asyncio.get_running_loop()
+        generation = await loop.run_in_executor(_pool(), _prepare)
+        with trace.stage("result_cache") as rec:
+            cached = RESULT_CACHE.get(query, top_k, generation, scope)
+            rec["hit"] = cached is not None
+        if cached is not None:
+            return _with_timings(cached, trace, timings)
+
+        legs = {name: asyncio.wrap_future(f) for name, f in _start_legs(query, top_k, trace, flt).items()}
+        await asyncio.wait(legs.values(), timeout=RETRIEVE_STAGE_TIMEOUT)
+        query_vec, candidates = _leg_results(legs, trace)
+        fused = _fuse(candidates, top_k, trace)
+
+        rerank = asyncio.wrap_future(_pool().submit(_rerank, query, fused, trace))
+        await asyncio.wait([rerank], timeout=RETRIEVE_STAGE_TIMEOUT)
+        reranked_docs, reranked = _stage_result("rerank", rerank, fallback=fused, trace=trace)
+        final_docs = await loop.run_in_executor(_pool(), _select, reranked_docs, query_vec, top_k, trace)
+
+        result = _to_json(final_docs)
+        if reranked and len(candidates) == len(legs):
+            RESULT_CACHE.put(query, top_k, generation, result, scope)
+        return _with_timings(result, trace, timings)
+    except Exception as e:
+        logger.exception("adb_retrieve error")
+        trace.note("request", error=True)
+        return json.dumps({"error": str(e)})
+    finally:
+        trace.finish()
+
+
+# graphs running on the event loop (ToolNode.ainvoke) get the non-blocking path for the same tool
+db_retrieve.coroutine = adb_retrieve.coroutine
+
+
+@tool
+def db_retrieve_many(
+    queries: List[str],
+    top_k: int = 5,
+    timings: bool = False,
+    province: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+) -> str:
+    """
+    only use this tool when the queries are Chinese-education-related.
+    db_retrieve for several queries at once (e.g. a Chinese/English pair or a plan's sub-queries):
+    one embedding request, one BM25 matrix product and one rerank batch for all of them.
+    province / date_from / date_to filter every query, as in db_retrieve.
+    set timings=True to get per-stage durations and candidate counts under "timings".
+    """
+    trace = StageTrace("db_retrieve_many")
+    try:
+        try:
+            flt = ChunkFilter.parse(province, date_from, date_to)
+        except ValueError as e:
+            return _bad_filter(e, province, trace)
+        scope = flt.key if flt else ""
+        generation = _prepare()
+        unique = list(dict.fromkeys(queries))
+        with trace.stage("result_cache", n_in=len(unique)) as rec:
+            results = {q: RESULT_CACHE.get(q, top_k, generation, scope) for q in unique}
+            todo = [q for q in unique if results[q] is None]
+            rec["hits"] = len(unique) - len(todo)
+
+        if todo:
+            docs_per_query, complete = _retrieve_many(todo, top_k, trace, flt)
+            for q, docs in zip(todo, docs_per_query):
+                results[q] = _to_json(docs)
+                if complete:
+                    RESULT_CACHE.put(q, top_k, generation, results[q], scope)
+
+        out = {"queries": [{"query": q, **json.loads(results[q])} for q in queries]}
+        trace.finish()
+        if timings:
+            out["timings"] = trace.as_dict()
+        return json.dumps(out, ensure_ascii=False)
+    except Exception as e:
+        logger.exception("db_retrieve_many error")
+        trace.note("request", error=True)
+        return json.dumps({"error": str(e)})
+    finally:
+        trace.finish()
+
+
+def _retrieve_many(
+    queries: List[str], top_k: int, trace: StageTrace, flt: Optional[ChunkFilter] = None
+) -> Tuple[List[List[Document]], bool]:
+    """(final docs per query, whether every stage finished in time)"""
+    legs = {
+        "dense": _pool().submit(_dense_many, queries, max(20, top_k), trace, flt),
+        "sparse": _pool().submit(_sparse_many, queries, max(50, top_k), trace, flt),
+    }
+    futures.wait(legs.values(), timeout=RETRIEVE_STAGE_TIMEOUT)
+    query_vecs, candidates = _leg_results(legs, trace)
+    with trace.stage("fuse", n_in=sum(len(docs) for lists in candidates.values() for docs in lists)) as rec:
+        fused = [
+            _rrf_fuse({name: lists[i] for name, lists in candidates.items()}, k=max(50, top_k))
+            for i in range(len(queries))
+        ]
+        rec["n_out"] = sum(len(docs) for docs in fused)
+
+    rerank = _pool().submit(_rerank_many, queries, fused, trace)
+    futures.wait([rerank], timeout=RETRIEVE_STAGE_TIMEOUT)
+    reranked, in_time = _stage_result("rerank", rerank, fallback=fused, trace=trace)
+    return _select_many(reranked, query_vecs, top_k, trace), in_time and len(candidates) == len(legs)
+
+
+def _prepare() -> int:
+    """indexes ready, current corpus generation returned; re-ingestion by another process reloads BM25 / the local vector index"""
+    global _BM25
+    _ensure_indexes()
+    generation = _store().get_generation()
+    if _BM25.generation != generation:
+        with _INDEX_LOCK:
+            if _BM25.generation != generation:
+                _BM25 = _load_bm25()
+    if isinstance(_VECTOR, LocalVectorStore) and _VECTOR.generation != generation:
+        _VECTOR.refresh()
+    return generation
+
+
+def _start_legs(
+    query: str, top_k: int, trace: StageTrace, flt: Optional[ChunkFilter] = None
+) -> Dict[str, futures.Future]:
+    return {
+        "dense": _pool().submit(_dense_leg, query, max(20, top_k), trace, flt),
+        "sparse": _pool().submit(_sparse_leg, query, max(50, top_k), trace, flt),
+    }
+
+
+def _dense_leg(
+    query: str, k: int, trace: Optional[StageTrace] = None, flt: Optional[ChunkFilter] = None
+) -> Tuple[List[float], List[Document]]:
+    trace = trace or StageTrace("db_retrieve")
+    with trace.stage("embed"):
+        query_vec = get_embeddings().embed_query(query)
+    with trace.stage("dense") as rec:
+        docs = _VECTOR.similarity_search_by_vector(query_vec, k=k, filter=_dense_where(flt))
+        rec["n_out"] = len(docs)
+    return query_vec, docs
+
+
+def _sparse_leg(
+    query: str, k: int, trace: Optional[StageTrace] = None, flt: Optional[ChunkFilter] = None
+) -> List[Document]:
+    trace = trace or StageTrace("db_retrieve")
+    rows = _filter_rows(flt, trace)
+    with trace.stage("sparse") as rec:
+        hits = _BM25.search(query, k=k, rows=rows)
+        docs = _docs_by_ids([cid for cid, _ in hits])
+        rec["n_out"] = len(docs)
+    return docs
+
+
+def _dense_many(
+    queries: List[str], k: int, trace: StageTrace, flt: Optional[ChunkFilter] = None
+) -> Tuple[List[List[float]], List[List[Document]]]:
+    with trace.stage("embed", n_in=len(queries)):
+        query_vecs = get_embeddings().embed_queries(queries)
+    with trace.stage("dense") as rec:
+        where = _dense_where(flt)
+        docs = [_VECTOR.similarity_search_by_vector(v, k=k, filter=where) for v in query_vecs]
+        rec["n_out"] = sum(len(d) for d in docs)
+    return query_vecs, docs
+
+
+def _sparse_many(
+    queries: List[str], k: int, trace: StageTrace, flt: Optional[ChunkFilter] = None
+) -> List[List[Document]]:
+    rows = _filter_rows(flt, trace)
+    with trace.stage("sparse") as rec:
+        hits_per_query = _BM25.search_many(queries, k=k, rows=rows)
+        by_id = {d.id: d for d in _docs_by_ids(list({cid for hits in hits_per_query for cid, _ in hits}))}
+        docs = [[by_id[cid] for cid, _ in hits if cid in by_id] for hits in hits_per_query]
+        rec["n_out"] = sum(len(d) for d in docs)
+    return docs
+
+
+def _dense_where(flt: Optional[ChunkFilter]) -> Optional[Dict]:
+    """
+    vector-store filter for the dense leg: the file fields of the chunk itself, or a canonical
+    chunk that stands in for a near-duplicate from a matching file
+    """
+    if flt is None:
+        return None
+    stand_ins = _store().duplicate_canonical_ids(flt)
+    return {"$or": [flt.where(), {"chunk_id": {"$in": stand_ins}}]} if stand_ins else flt.where()
+
+
+def _filter_rows(flt: Optional[ChunkFilter], trace: StageTrace) -> Optional[np.ndarray]:
+    """BM25 rows the filter allows, looked up in the file_meta side index; None = all rows"""
+    if flt is None:
+        return None
+    with trace.stage("prefilter") as rec:
+        rows = _BM25.rows_for(_store().filter_chunk_ids(flt))
+        rec["n_out"] = len(rows)
+    return rows
+
+
+def _leg_results(
+    legs: Dict[str, "futures.Future | asyncio.Future"], trace: StageTrace
+) -> Tuple[Optional[List[float]], Dict[str, List[Document]]]:
+    """
+    collect the legs that finished in time; a slow or failing leg is dropped
+    instead of failing the query. query_vec is None when the dense leg is missing.
+    """
+    query_vec, candidates = None, {}
+    for name, leg in legs.items():
+        if not leg.done():
+            trace.note(name, timed_out=True)
+            logger.warning(f"db_retrieve {name} leg timed out after {RETRIEVE_STAGE_TIMEOUT}s, skipped")
+        elif leg.exception() is not None:
+            trace.note(name, failed=True)
+            logger.warning(f"db_retrieve {name} leg failed, skipped: {leg.exception()}")
+        elif name == "dense":
+            query_vec, candidates[name] = leg.result()
+        else:
+            candidates[name] = leg.result()
+    if not candidates:
+        raise RuntimeError("both dense and sparse retrieval failed or timed out")
+    return query_vec, candidates
+
+
+def _stage_result(
+    name: str, stage: "futures.Future | asyncio.Future", fallback: List[Document], trace: StageTrace
+) -> Tuple[List[Document], bool]:
+    """(docs, finished in time); a late stage yields the fallback"""
+    if not stage.done():
+        trace.note(name, timed_out=True)
+        logger.warning(f"db_retrieve {name} timed out after {RETRIEVE_STAGE_TIMEOUT}s, keeping previous order")
+        return fallback, False
+    return stage.result(), True
+
+
+def _fuse(candidates: Dict[str, List[Document]], top_k: int, trace: StageTrace) -> List[Document]:
+    with trace.stage("fuse", n_in=sum(len(docs) for docs in candidates.values())) as rec:
+        fused = _rrf_fuse(candidates, k=max(50, top_k))
+        rec["n_out"] = len(fused)
+    return fused
+
+
+def _rerank(query: str, docs: List[Document], trace: Optional[StageTrace] = None) -> List[Document]:
+    return _rerank_many([query], [docs], trace)[0]
+
+
+def _rerank_many(queries: List[str], doc_lists: List[List[Document]], trace: Optional[StageTrace] = None) -> List[List[Document]]:
+    trace = trace or StageTrace("db_retrieve")
+    with trace.stage("rerank", n_in=sum(len(docs) for docs in doc_lists)) as rec:
+        ranked = get_reranker().compress_many(list(zip(queries, doc_lists)), stats=rec)
+        rec["n_out"] = sum(len(docs) for docs in ranked)
+    return ranked
+
+
+def _select(
+    docs: List[Document], query_vec: Optional[List[float]], top_k: int, trace: Optional[StageTrace] = None
+) -> List[Document]:
+    """embedding filter when the dense leg produced a query vector, plain cut-off otherwise"""
+    return _select_many([docs], None if query_vec is None else [query_vec], top_k, trace)[0]
+
+
+def _select_many(
+    doc_lists: List[List[Document]],
+    query_vecs: Optional[List[List[float]]],
+    top_k: int,
+    trace: Optional[StageTrace] = None,
+) -> List[List[Document]]:
+    """_select per query, reading all chunk vectors back from Chroma in one request"""
+    trace = trace or StageTrace("db_retrieve")
+    with trace.stage("filter", n_in=sum(len(docs) for docs in doc_lists)) as rec:
+        if query_vecs is None:
+            selected = [docs[:top_k] for docs in doc_lists]
+        else:
+            flat = [d for docs in doc_lists for d in docs]
+            matrix = _doc_matrix(flat) if flat else None
+            selected, start = [], 0
+            for docs, query_vec in zip(doc_lists, query_vecs):
+                end = start + len(docs)
+                selected.append(_embedding_filter(docs, query_vec, matrix=matrix[start:end] if docs else None)[:top_k])
+                start = end
+        selected = _with_sources(selected)
+        rec["n_out"] = sum(len(docs) for docs in selected)
+    return selected
+
+
+def _with_sources(doc_lists: List[List[Document]]) -> List[List[Document]]:
+    """collapsed chunks get "sources": every file the chunk or one of its near-duplicates came from"""
+    sources = _store().duplicate_sources(list({d.id for docs in doc_lists for d in docs if d.id}))
+    if not sources:
+        return doc_lists
+    return [
+        [
+            Document(id=d.id, page_content=d.page_content, metadata={**d.metadata, "sources": sources[d.id]})
+            if d.id in sources else d
+            for d in docs
+        ]
+        for docs in doc_lists
+    ]
+
+
+def _bad_filter(e: ValueError, province: Optional[str], trace: StageTrace) -> str:
+    """a filter argument the corpus cannot match (the LLM made up a province, a date is malformed) is the caller's to fix"""
+    logger.warning(f"{trace.prefix} rejected filter: {e}")
+    trace.note("request", bad_filter=True)
+    out = {"error": str(e)}
+    if province:
+        out["valid_provinces"] = list(PROVINCES)
+    return json.dumps(out, ensure_ascii=False)
+
+
+def _with_timings(result: str, trace: StageTrace, attach: bool) -> str:
+    """emit the trace to the registry, and add it to the JSON output on request"""
+    trace.finish()
+    if not attach:
+        return result
+    out = json.loads(result)
+    out["timings"] = trace.as_dict()
+    return json.dumps(out, ensure_ascii=False)
+
+
+def _to_json(docs: List[Document]) -> str:
+    return json.dumps(
+        {"results": [{"text": d.page_content, "metadata": d.metadata} for d in docs]},
+        ensure_ascii=False,
+    )
 
 
 def _ensure_indexes() -> None:
-    """construct/reuse semanticSearch & BM25"""
+    """construct/reuse semanticSearch & BM25, syncing only new or edited files"""
     global _VECTOR, _BM25
+    if _VECTOR is not None and _BM25 is not None:
+        return
+
+    with _INDEX_LOCK:
+        if _VECTOR is None:
+            vector = _open_vector()
+            _sync_corpus(vector)
+            _VECTOR = vector
+
+        if _BM25 is None:
+            _BM25 = _load_bm25()
+
+
+def ingest_corpus(progress: Optional[Callable[[IngestStats], None]] = None, **pipeline_options) -> IngestStats:
+    """sync the corpus into Chroma and rebuild BM25 up front (`python -m utils.ingest_cli`)"""
+    global _VECTOR, _BM25
+    with _INDEX_LOCK:
+        vector = _VECTOR or _open_vector()
+        stats = _sync_corpus(vector, progress=progress, **pipeline_options)
+        _VECTOR = vector
+        _BM25 = _load_bm25()
+    return stats
+
+
+def _open_vector() -> "Chroma | LocalVectorStore":
+    """
+    the VECTOR_BACKEND store; one behind the chunk cache (another backend was used meanwhile, or an
+    ingest was killed) is rebuilt from it, vectors from the embedding cache
+    """
+    store = _store()
+    generation = store.get_generation()
+    if VECTOR_BACKEND == "local":
+        vector = LocalVectorStore(VECTOR_DIR, embedding_function=get_embeddings(), hnsw_threshold=VECTOR_HNSW_MIN)
+        if vector.generation != generation:
+            logger.info(f"Vector index at generation {vector.generation}, corpus at {generation}: rebuilding from the chunk cache...")
+            vector.rebuild(store.load_chunks(), generation)
+        return vector
+    if VECTOR_BACKEND != "chroma":
+        raise ValueError(f"unknown vector backend: {VECTOR_BACKEND}")
+
+    from langchain_chroma.vectorstores import Chroma
     os.makedirs(CHROMA_DIR, exist_ok=True)
+    vector = Chroma(
+        collection_name=EMB_SPEC.collection, persist_directory=CHROMA_DIR, embedding_function=get_embeddings()
+    )
+    synced = store.get_meta(CHROMA_GENERATION)
+    count, expected = vector._collection.count(), store.count_chunks()
+    # a legacy collection (no manifest yet) is handled by _sync_corpus
+    if not store.is_empty() and (synced not in (None, str(generation)) or count != expected):
+        logger.info(
+            f"Chroma collection at generation {synced} with {count} vectors, corpus at {generation} with {expected} chunks: "
+            "rebuilding from the chunk cache..."
+        )
+        _rebuild_chroma(vector, store.load_chunks())
+    store.set_meta(CHROMA_GENERATION, str(generation))
+    return vector
+
+
+def _rebuild_chroma(vector: "Chroma", chunks: List[Tuple[str, str, Dict]], batch: int = 256) -> None:
+    """replace the collection with (chunk_id, text, metadata) chunks"""
+    vector.reset_collection()
+    for i in range(0, len(chunks), batch):
+        part = chunks[i:i + batch]
+        vector.add_documents(
+            [Document(id=cid, page_content=text, metadata=meta) for cid, text, meta in part], ids=[cid for cid, _, _ in part]
+        )
 
-    docs = _load_local_docs(DOCS_DIR)
 
-    if _VECTOR is None:
-        _VECTOR = Chroma(persist_directory=CHROMA_DIR, embedding_function=EMB)
-        if not os.path.exists(INGEST_FLAG) and docs:
-            _VECTOR.add_documents(docs)
-            open(INGEST_FLAG, "w").close()
+def _sync_corpus(
+    vector: "Chroma | LocalVectorStore", progress: Optional[Callable[[IngestStats], None]] = None, **pipeline_options
+) -> IngestStats:
+    """upsert new/edited files and drop removed ones, driven by the content-hash manifest"""
+    store = _store()
+    if EMB_SPEC.is_legacy and os.path.exists(INGEST_FLAG) and store.is_empty():
+        # collection was filled by the old flag-based ingestion without stable ids
+        logger.info("Legacy ingestion detected, rebuilding collection with manifest...")
+        vector.reset_collection()
+        os.remove(INGEST_FLAG)
+    outdated = [key for key, value in INGEST_SCHEMA.items() if store.get_meta(key) != value]
+    if outdated:
+        if not store.is_empty():
+            logger.info(f"Ingest schema changed ({', '.join(outdated)}), re-ingesting the corpus (vectors come from the embedding cache)...")
+            vector.reset_collection()
+            store.reset()
+        for key in outdated:
+            store.set_meta(key, INGEST_SCHEMA[key])
 
-    if _BM25 is None:
-        if docs:
-            _BM25 = BM25Retriever.from_documents(docs)
+    changed, removed = store.diff(DOCS_DIR)
+    if not changed and not removed:
+        return IngestStats()
+
+    options = {
+        "workers": INGEST_WORKERS,
+        "embed_batch": INGEST_EMBED_BATCH,
+        "embed_concurrency": INGEST_EMBED_CONCURRENCY,
+        **pipeline_options,
+    }
+    dedup = NearDupIndex(DEDUP_THRESHOLD) if DEDUP_THRESHOLD > 0 else None
+    pipeline = IngestPipeline(store, vector, get_embeddings(), _chunk_file, progress=progress, dedup=dedup, **options)
+    # the manifest commits file by file, the vector store records its generation only below: with the
+    # corpus generation ahead of the recorded one, a process killed in between is rebuilt on the next start
+    store.bump_generation()
+    try:
+        stats = pipeline.run(changed, removed)
+    finally:
+        # whatever was committed before a failure is live in the indexes
+        generation = store.bump_generation()
+        if isinstance(vector, LocalVectorStore):
+            vector.flush(generation)
         else:
-            _BM25 = BM25Retriever.from_texts([""])
+            store.set_meta(CHROMA_GENERATION, str(generation))
+    logger.info(
+        f"Corpus synced: {len(changed)} changed, {len(removed)} removed (generation {generation}), "
+        f"{stats.chunks_per_s:.1f} chunks/s"
+    )
+    return stats
 
 
-def _load_local_docs(folder: str) -> List[Document]:
-    docs: List[Document] = []
-    if not os.path.isdir(folder):
-        return docs
-
-    for path in glob.glob(os.path.join(folder, "**", "*"), recursive=True):
-        if os.path.isdir(path):
-            continue
-        if path.lower().endswith((".txt", ".md")):
-            with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                text = f.read()
-
-            chunks = (
-                SEM_SPLITTER.split_text(text)
-                if _USE_SEMANTIC
-                else RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP).split_text(text)
-            )
-            for i, chunk in enumerate(chunks):
-                docs.append(
-                    Document(
-                        page_content=chunk,
-                        metadata={
-                            "source": os.path.basename(path),
-                            "path": path,
-                            "idx": i,
-                            "split": "semantic" if _USE_SEMANTIC else "rc",
-                        },
-                    )
-                )
-    return docs
+def _chunk_file(entry: FileEntry) -> List[Document]:
+    text = read_text(entry.path)
+    chunks = get_splitter().split_text(text)
+    ids = chunk_ids_for(entry.rel_path, chunks)
+    fields = extract_file_meta(entry.rel_path).as_metadata()
+    return [
+        Document(
+            id=chunk_id,
+            page_content=chunk,
+            metadata={
+                "source": os.path.basename(entry.path),
+                "path": entry.path,
+                "idx": i,
+                "chunk_id": chunk_id,
+                "split": "semantic" if _USE_SEMANTIC else "rc",
+                **fields,
+            },
+        )
+        for i, (chunk_id, chunk) in enumerate(zip(ids, chunks))
+    ]
+
+
+def _load_bm25() -> BM25Index:
+    """mmap the prebuilt sparse index, rebuilding it from the chunk cache only if the corpus moved on"""
+    generation = _store().get_generation()
+    tokenizer = resolve_tokenizer(SPARSE_TOKENIZER)
+    index = BM25Index.open(BM25_DIR)
+    if index is None or index.generation != generation or index.tokenizer_name != tokenizer:
+        chunks = [(cid, text) for cid, text, _ in _store().load_chunks()]
+        index = BM25Index.build(BM25_DIR, chunks, generation=generation, tokenizer=tokenizer)
+    return index
+
+
+def _docs_by_ids(ids: List[str]) -> List[Document]:
+    """materialize cached chunks in the given order"""
+    return [Document(id=cid, page_content=text, metadata=meta) for cid, text, meta in _store().get_chunks(ids)]
+
+
+def _embedding_filter(
+    docs: List[Document],
+    query_vec: List[float],
+    k: int = FILTER_K,
+    threshold: Optional[float] = None,
+    matrix: Optional[np.ndarray] = None,
+) -> List[Document]:
+    """
+    same contract as EmbeddingsFilter(similarity_threshold=FILTER_THRESHOLD): keep the k most query-similar
+    docs above the threshold, most similar first. chunk vectors are read back from Chroma by id
+    and the dense leg's query vector is reused, so no embedding request is made here.
+    """
+    if not docs:
+        return []
+    if matrix is None:
+        matrix = _doc_matrix(docs)
+    if threshold is None:
+        threshold = FILTER_THRESHOLD
+
+    q = np.asarray(query_vec, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(q)
+    similarity = matrix @ q / np.where(norms == 0, 1.0, norms)
+
+    order = np.argsort(-similarity, kind="stable")[:k]
+    return [docs[i] for i in order if similarity[i] > threshold]
 
 
-def _rrf_fuse(candidates: Dict[str, List[Document]], k: int = 50, c: int = 60) -> List[Document]:
+def _doc_matrix(docs: List[Document]) -> np.ndarray:
+    """stored chunk vectors in doc order; only docs Chroma doesn't know are embedded"""
+    ids = list(dict.fromkeys(d.id for d in docs if d.id))
+    stored = _VECTOR.get(ids=ids, include=["embeddings"]) if ids else {"ids": [], "embeddings": []}
+    by_id = dict(zip(stored["ids"], stored["embeddings"]))
+
+    missing = [d.page_content for d in docs if d.id not in by_id]
+    fallback = iter(get_embeddings().embed_documents(missing)) if missing else iter(())
+    return np.asarray(
+        [by_id[d.id] if d.id in by_id else next(fallback) for d in docs], dtype=np.float32
+    )
+
+
+def _rrf_fuse(
+    candidates: Dict[str, List[Document]],
+    k: int = 50,
+    c: int = RRF_K,
+    weights: Optional[Dict[str, float]] = None,
+) -> List[Document]:
     """
-    Reciprocal Rank Fusion: score += 1 / (c + rank)
+    weighted Reciprocal Rank Fusion over any number of legs: score(d) = sum_leg w_leg / (c + rank_leg(d)).
+    documents are identified by chunk id, so a chunk found by several legs becomes one candidate
+    and reaches the reranker once; equal scores keep first-seen order.
     """
-    def _doc_key(d: Document) -> Tuple[str, int, str]:
-        return (d.metadata.get("path", ""), int(d.metadata.get("idx", -1)), d.page_content[:30])
+    weights = RRF_WEIGHTS if weights is None else weights
+    docs: List[Document] = []
+    contributions = []
+    for leg, leg_docs in candidates.items():
+        leg_docs = leg_docs[:k]
+        docs.extend(leg_docs)
+        contributions.append(weights.get(leg, 1.0) / (c + np.arange(1, len(leg_docs) + 1, dtype=np.float64)))
+    if not docs:
+        return []
 
-    scores: Dict[Tuple[str, int, str], float] = {}
-    first_doc: Dict[Tuple[str, int, str], Document] = {}
+    keys = np.asarray([_doc_key(d) for d in docs])
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(contributions))
+    order = np.lexsort((first, -scores))
+    return [docs[first[i]] for i in order]
 
-    for _, docs in candidates.items():
-        for rank, d in enumerate(docs[:k], start=1):
-            doc_id = _doc_key(d)
-            first_doc.setdefault(doc_id, d)
-            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (c + rank)
 
-    ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
-    return [first_doc[doc_id] for doc_id, _ in ranked]
+def _doc_key(d: Document) -> str:
+    """chunk id; content hash for documents indexed before ids were stored"""
+    return d.id or d.metadata.get("chunk_id") or hashlib.sha1(d.page_content.encode("utf-8")).hexdigest()
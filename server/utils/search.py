@@ -3,20 +3,82 @@
 import re
 import sys
 import json
-import praw
+import time
+import queue
 import logging
+import threading
+from concurrent import futures
 from urllib.parse import urlparse
 from pathlib import Path
-from tavily import TavilyClient
-from typing import Dict, Any
+from typing import Dict, Any, Tuple, Iterator, Optional, Callable
 from langchain_core.tools import tool
 from pydantic import BaseModel, Field
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-from config import TAVILY_API_KEY, CLIENT_ID, CLIENT_SECRET, REDDIT_USERNAME, REDDIT_PASSWORD, USER_AGENT
+from config import (
+    SEARCH_BRANCH_WORKERS, SEARCH_BRANCH_TIMEOUT, SEARCH_CACHE_PATH, SEARCH_CACHE_MAX, SEARCH_CACHE_STALE, SEARCH_CACHE_TTLS,
+)
+from utils.clients import get_tavily, reddit_pool, http_session, content_clock
+from utils.search_cache import SearchCache
+from utils.metrics import METRICS
 
 logger = logging.getLogger(__name__)
 
+ZHIHU_PARAMS: Dict[str, Any] = {
+    "search_depth": "basic",
+    "topic": "general",
+    "include_answer": False,
+    "include_raw_content": False,
+    "max_results": 20,
+    "include_domains": ["https://www.zhihu.com/question/"],
+}
+REDDIT_PARAMS: Dict[str, Any] = {
+    "search_depth": "basic",
+    "topic": "general",
+    "include_answer": False,
+    "include_raw_content": False,
+    "max_results": 1,
+    "include_domains": ["https://www.reddit.com/"],
+}
+BRANCH_GRACE_S = 2.0
+TAVILY_TIMEOUT = 60.0  # TavilyClient's own default
+# a branch hands over each batch of factors as soon as it has it
+Emit = Callable[[list], None]
+
+# built on first use, so importing this module opens no database and starts no threads
+SEARCH_CACHE: Optional[SearchCache] = None
+_POOL: Optional[futures.ThreadPoolExecutor] = None
+_LAZY_LOCK = threading.Lock()
+
+METRICS.register("search_cache", lambda: SEARCH_CACHE.stats() if SEARCH_CACHE is not None else {})
+
+
+def _search_cache() -> SearchCache:
+    """repeat questions (and analyze_node's identical translations) are answered from here"""
+    global SEARCH_CACHE
+    if SEARCH_CACHE is None:
+        with _LAZY_LOCK:
+            if SEARCH_CACHE is None:
+                SEARCH_CACHE = SearchCache(
+                    str(SEARCH_CACHE_PATH),
+                    ttls=SEARCH_CACHE_TTLS,
+                    stale_s=SEARCH_CACHE_STALE,
+                    max_entries=SEARCH_CACHE_MAX,
+                    refresh_timeout=SEARCH_BRANCH_TIMEOUT,
+                )
+    return SEARCH_CACHE
+
+
+def _pool() -> futures.ThreadPoolExecutor:
+    """the Zhihu and Reddit branches of advan_web_search run here, side by side"""
+    global _POOL
+    if _POOL is None:
+        with _LAZY_LOCK:
+            if _POOL is None:
+                _POOL = futures.ThreadPoolExecutor(max_workers=SEARCH_BRANCH_WORKERS, thread_name_prefix="search")
+    return _POOL
+
+
 class AdvSearchArgs(BaseModel):
     cn_query: str = Field(..., description="Chinese translation to the query")
     en_query: str = Field(..., description="English translation to the query")
@@ -65,7 +127,6 @@ def web_search(query: str) -> str:
         - Use `ensure_ascii=False` to preserve Unicode characters in the output.
     """
 
-    client = TavilyClient(api_key=TAVILY_API_KEY)
     params: Dict[str, Any] = {
         "search_depth": "basic",
         "topic": "general",
@@ -73,7 +134,7 @@ def web_search(query: str) -> str:
         "include_raw_content": False,
         "max_results": 5,
     }
-    res = client.search(query, **params)
+    res = _tavily_search(query, params, TAVILY_TIMEOUT)
 
     results = [{
         "title": it.get("title"),
@@ -121,35 +182,145 @@ def advan_web_search(cn_query: str, en_query: str) -> str:
                       "text": str,
                       "score": int, ... },
                     ...
-                ]
+                ],
+                "incomplete": { "zhihu" | "reddit": str }    # only when a source was cut short
             }
 
     Notes:
         - Zhihu credibility is indicated by higher `vote_count`.
         - Reddit credibility is indicated by higher `score`.
+        - The two sources are searched concurrently, each within SEARCH_BRANCH_TIMEOUT seconds;
+          a source that runs out of time or fails contributes what it gathered so far (possibly
+          nothing) and is named in `incomplete`.
+        - stream_advan_web_search yields the same factors batch by batch as they arrive.
     """
 
-    client = TavilyClient(api_key=TAVILY_API_KEY)
-    zhihu_params: Dict[str, Any] = {
-        "search_depth": "basic",
-        "topic": "general",
-        "include_answer": False,
-        "include_raw_content": False,
-        "max_results": 20,
-        "include_domains": ["https://www.zhihu.com/question/"],
-    }
-    reddit_params: Dict[str, Any] = {
-        "search_depth": "basic",
-        "topic": "general",
-        "include_answer": False,
-        "include_raw_content": False,
-        "max_results": 1,
-        "include_domains": ["https://www.reddit.com/"],
+    return json.dumps(collect_factors(stream_advan_web_search(cn_query, en_query)))
+
+
+def stream_advan_web_search(cn_query: str, en_query: str) -> Iterator[Dict[str, Any]]:
+    """
+    advan_web_search as it arrives: {"source": "zhihu" | "reddit", "factors": [...]} for each Zhihu answer
+    and each subreddit as soon as it is in, and {"source": ..., "done": True, "incomplete": reason | None}
+    once a source has finished or run out of time. a consumer may stop early: the crawls then stop at
+    their next request, so abandoned branches free their _POOL threads, and a partial crawl is not cached.
+    """
+    batches: "queue.Queue[Tuple[str, Optional[list]]]" = queue.Queue()
+    deadline = time.monotonic() + SEARCH_BRANCH_TIMEOUT
+    stop = threading.Event()
+    branches = {
+        "zhihu": _pool().submit(_zhihu_branch, cn_query, deadline, lambda f: batches.put(("zhihu", f)), stop),
+        "reddit": _pool().submit(_reddit_branch, en_query, deadline, lambda f: batches.put(("reddit", f)), stop),
     }
-    zhihu_res = client.search(cn_query, **zhihu_params)
-    reddit_res = client.search(en_query, **reddit_params)
+    for name, branch in branches.items():
+        # after every batch of the branch, it emits before returning
+        branch.add_done_callback(lambda _, name=name: batches.put((name, None)))
+
+    # collectors stop on their own at the deadline; the grace covers a request already in flight
+    wait_until = deadline + BRANCH_GRACE_S
+    pending = set(branches)
+    try:
+        while pending:
+            try:
+                name, factors = batches.get(timeout=max(0.0, wait_until - time.monotonic()))
+            except queue.Empty:
+                break
+            if factors is not None:
+                yield {"source": name, "factors": factors}
+                continue
+            pending.discard(name)
+            yield {"source": name, "done": True, "incomplete": _incomplete(name, branches[name])}
+    finally:
+        # closed early or timed out: nobody reads the rest
+        stop.set()
+
+    for name in branches:
+        if name in pending:
+            logger.warning(f"advan_web_search {name} branch timed out after {SEARCH_BRANCH_TIMEOUT}s, skipped")
+            yield {"source": name, "done": True, "incomplete": "timed out"}
+
+
+def collect_factors(batches: Iterator[Dict[str, Any]], enough: int = 0) -> Dict[str, Any]:
+    """
+    the advan_web_search output from a stream of batches; with `enough`, stops reading once that many
+    credible factors (comments with votes, Reddit pieces with a positive score) are in
+    """
+    factors: Dict[str, list] = {"zhihu": [], "reddit": []}
+    incomplete: Dict[str, str] = {}
+    done = set()
+    credible = 0
+    for batch in batches:
+        name = batch["source"]
+        if batch.get("done"):
+            done.add(name)
+            if batch["incomplete"]:
+                incomplete[name] = batch["incomplete"]
+            continue
+        factors[name].extend(batch["factors"])
+        credible += sum(_credible(name, f) for f in batch["factors"])
+        if enough and credible >= enough:
+            close = getattr(batches, "close", None)
+            if close is not None:
+                close()
+            for name in factors.keys() - done:
+                incomplete[name] = "stopped early: enough factors"
+            logger.debug(f"advan_web_search stopped early with {credible} credible factors")
+            break
+
+    out: Dict[str, Any] = {"factors_from_zhihu": factors["zhihu"], "factors_from_reddit": factors["reddit"]}
+    if incomplete:
+        out["incomplete"] = incomplete
+    return out
+
+
+def _credible(source: str, factor: Any) -> int:
+    if not isinstance(factor, dict):
+        return 0
+    if source == "reddit":
+        return int((factor.get("score") or 0) > 0)
+    return sum(1 for comments in factor.values() if isinstance(comments, list)
+               for c in comments if isinstance(c, dict) and (c.get("vote_count") or 0) > 0)
 
 
+def _incomplete(name: str, branch: futures.Future) -> Optional[str]:
+    if branch.exception() is not None:
+        logger.warning(f"advan_web_search {name} branch failed, skipped: {branch.exception()}")
+        return f"failed: {branch.exception()}"
+    _, cut_short = branch.result()
+    return "partial: deadline reached" if cut_short else None
+
+
+def _streamed(emit: Emit) -> Tuple[Emit, Callable[[list], None]]:
+    """
+    (emit for the crawl, emit for what the crawl did not emit itself): a cached response is emitted whole
+    afterwards, and a background refresh of a stale entry, on another thread, emits nothing
+    """
+    caller = threading.get_ident()
+    emitted = [False]
+
+    def on_factor(factors: list) -> None:
+        if threading.get_ident() == caller:
+            emitted[0] = True
+            emit(factors)
+
+    def rest(factors: list) -> None:
+        if not emitted[0] and factors:
+            emit(factors)
+
+    return on_factor, rest
+
+
+def _crawl_stop(stop: Optional[threading.Event], caller: int) -> Optional[threading.Event]:
+    """the consumer's stop event for the crawl it waits on; a background refresh runs to its own deadline"""
+    return stop if threading.get_ident() == caller else None
+
+
+def _zhihu_branch(
+    cn_query: str, deadline: float, emit: Emit = lambda f: None, stop: Optional[threading.Event] = None
+) -> Tuple[list, bool]:
+    """Tavily search for Zhihu answers, then their comments: (factors, cut short by the deadline)"""
+    zhihu_res = _tavily_search(cn_query, ZHIHU_PARAMS, _remaining(deadline))
+
     _zh_urls = [it.get("url", "") for it in zhihu_res.get("results", [])]
     zhihu_list = [u.rstrip("/").split("/")[-1] for u in _zh_urls if "/answer/" in u]
     if not zhihu_list:
@@ -163,6 +334,46 @@ def advan_web_search(cn_query: str, en_query: str) -> str:
                 except Exception:
                     pass
         zhihu_list = list(dict.fromkeys(tmp))
+    logger.debug(f"zhihu answers: {zhihu_list}")
+
+    from .zhihu_search import ZhihuCollector
+
+    mapped_zhihu: list = []
+
+    def mapped(items: list) -> list:
+        """answer ids replaced by the answer text Tavily returned, in order of arrival"""
+        out = []
+        for item in items:
+            i = len(mapped_zhihu) + len(out)
+            if isinstance(item, dict) and i < len(zhihu_res["results"]):
+                content = zhihu_res["results"][i].get("content") or zhihu_res["results"][i].get("title")
+                out.append({content: list(item.values())[0]})
+            else:
+                out.append(item)
+        mapped_zhihu.extend(out)
+        return out
+
+    on_factor, rest = _streamed(lambda items: emit(mapped(items)))
+    caller = threading.get_ident()
+
+    def crawl(timeout: float) -> Tuple[list, bool]:
+        zhihu = ZhihuCollector(zhihu_list, session=http_session("zhihu"))
+        found = zhihu.search(
+            max_count=10, show_comments=0, return_factor=True, timeout=timeout, on_factor=lambda f: on_factor([f]),
+            stop=_crawl_stop(stop, caller),
+        ) or []
+        return found, not (zhihu.timed_out or zhihu.failures)
+
+    zhihu_factor, complete = _search_cache().fetch("zhihu", ",".join(zhihu_list), {"max_count": 10}, crawl, _remaining(deadline))
+    rest(zhihu_factor)
+    return mapped_zhihu, not complete
+
+
+def _reddit_branch(
+    en_query: str, deadline: float, emit: Emit = lambda f: None, stop: Optional[threading.Event] = None
+) -> Tuple[list, bool]:
+    """Tavily search for subreddits, then their hot posts and comments: (factors, cut short by the deadline)"""
+    reddit_res = _tavily_search(en_query, REDDIT_PARAMS, _remaining(deadline))
 
     reddit_list = []
     for it in reddit_res.get("results", []):
@@ -177,33 +388,33 @@ def advan_web_search(cn_query: str, en_query: str) -> str:
         except Exception:
             pass
     reddit_list = list(dict.fromkeys(reddit_list))
-
-    print(zhihu_list)
-    print(reddit_list)
-    from .zhihu_search import ZhihuCollector
-    zhihu = ZhihuCollector(zhihu_list)
-    zhihu_factor = zhihu.search(max_count=10, show_comments=0, return_factor=True)
+    logger.debug(f"subreddits: {reddit_list}")
 
     from .reddit_search import RedditCollector
-    reddit_client = praw.Reddit(
-        client_id = CLIENT_ID,
-        client_secret = CLIENT_SECRET,
-        username = REDDIT_USERNAME,
-        password = REDDIT_PASSWORD,
-        user_agent = USER_AGENT
+
+    on_factor, rest = _streamed(emit)
+    caller = threading.get_ident()
+
+    def crawl(timeout: float) -> Tuple[list, bool]:
+        with reddit_pool().client() as reddit_client:
+            reddit = RedditCollector(client=reddit_client, subr_list=reddit_list, clock=content_clock("reddit"))
+            found = reddit.search(
+                max_count=10, return_factor=True, timeout=timeout, on_factor=on_factor, stop=_crawl_stop(stop, caller)
+            ) or []
+        return found, not reddit.timed_out
+
+    reddit_factor, complete = _search_cache().fetch("reddit", ",".join(reddit_list), {"max_count": 10}, crawl, _remaining(deadline))
+    rest(reddit_factor)
+    return reddit_factor, not complete
+
+
+def _tavily_search(query: str, params: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """TavilyClient.search through the response cache"""
+    res, _ = _search_cache().fetch(
+        "tavily", query, params, lambda t: (get_tavily().search(query, timeout=t, **params), True), timeout
     )
-    reddit = RedditCollector(client=reddit_client, subr_list=reddit_list)
-    reddit_factor = reddit.search(max_count=10, return_factor=True)
-
-    mapped_zhihu = []
-    for i, item in enumerate(zhihu_factor):
-        if isinstance(item, dict) and i < len(zhihu_res["results"]):
-            content = zhihu_res["results"][i].get("content") or zhihu_res["results"][i].get("title")
-            mapped_zhihu.append({content: list(item.values())[0]})
-        else:
-            mapped_zhihu.append(item)
-
-    return json.dumps({
-        "factors_from_zhihu": mapped_zhihu,
-        "factors_from_reddit": reddit_factor,
-    })
\ No newline at end of file
+    return res
+
+
+def _remaining(deadline: float) -> float:
+    return max(0.1, deadline - time.monotonic())
@@ -0,0 +1,181 @@
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent import futures
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.cjk_tokenizer import normalize_query
+from utils.metrics import hit_ratio
+
+logger = logging.getLogger(__name__)
+
+# fetch(timeout_s) -> (value, complete); only complete values are cached
+Fetch = Callable[[float], Tuple[Any, bool]]
+
+
+class SearchCache:
+    """
+    Persistent TTL cache of search responses keyed by (source, normalized query, parameters).
+    an entry is fresh for its source's TTL; for `stale_s` after that it is still served at
+    once while one background fetch replaces it (stale-while-revalidate), later it is a miss.
+    values are JSON, kept in SQLite so every process and restart shares them; least recently
+    used entries are evicted once the table grows past `max_entries`.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        ttls: Dict[str, float],
+        default_ttl: float = 3600.0,
+        stale_s: float = 86400.0,
+        max_entries: int = 20_000,
+        refresh_timeout: float = 30.0,
+    ):
+        self.db_path = db_path
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.stale_s = stale_s
+        self.max_entries = max_entries
+        self.refresh_timeout = refresh_timeout
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self._lock = threading.Lock()
+        self._refreshing: set = set()
+        self._refresher: Optional[futures.ThreadPoolExecutor] = None
+        if self.enabled:
+            self._init_db()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute("PRAGMA busy_timeout = 5000;")
+        return conn
+
+    def _init_db(self):
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS responses(
+                  key TEXT PRIMARY KEY,
+                  source TEXT NOT NULL,
+                  value TEXT NOT NULL,
+                  fetched_at REAL NOT NULL,
+                  last_used REAL NOT NULL
+                )
+                """
+            )
+            cur.execute("CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses(last_used);")
+
+    @staticmethod
+    def key(source: str, query: str, params: Optional[Dict[str, Any]] = None) -> str:
+        raw = json.dumps([source, normalize_query(query), params or {}], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def fetch(self, source: str, query: str, params: Optional[Dict[str, Any]], fetch: Fetch, timeout: float) -> Tuple[Any, bool]:
+        """
+        (value, complete) for the request, from the cache when possible; `fetch(timeout)` runs on a
+        miss, and in the background with `refresh_timeout` when the cached value is stale
+        """
+        if not self.enabled:
+            return fetch(timeout)
+        key = self.key(source, query, params)
+        cached = self._lookup(key)
+        now = time.time()
+        if cached is not None:
+            value, fetched_at = cached
+            age = now - fetched_at
+            ttl = self.ttls.get(source, self.default_ttl)
+            if age <= ttl:
+                with self._lock:
+                    self.hits += 1
+                return value, True
+            if age <= ttl + self.stale_s:
+                with self._lock:
+                    self.stale_hits += 1
+                self._refresh(key, source, fetch)
+                return value, True
+
+        with self._lock:
+            self.misses += 1
+        value, complete = fetch(timeout)
+        if complete:
+            self._store(key, source, value)
+        return value, complete
+
+    def clear(self) -> None:
+        if self.enabled:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "hit_ratio": hit_ratio(self.hits + self.stale_hits, self.misses),
+        }
+
+    def _refresh(self, key: str, source: str, fetch: Fetch) -> None:
+        """replace a stale entry off the request path, at most one fetch per key at a time"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._refresher is None:
+                self._refresher = futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="search-refresh")
+
+        def _run():
+            try:
+                value, complete = fetch(self.refresh_timeout)
+                if complete:
+                    self._store(key, source, value)
+                    with self._lock:
+                        self.refreshes += 1
+            except Exception as e:
+                logger.warning(f"Search cache refresh failed ({source}), keeping the stale entry: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresher.submit(_run)
+
+    def _lookup(self, key: str) -> Optional[Tuple[Any, float]]:
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT value, fetched_at FROM responses WHERE key=?", (key,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            cur.execute("UPDATE responses SET last_used=? WHERE key=?", (time.time(), key))
+        return json.loads(row[0]), row[1]
+
+    def _store(self, key: str, source: str, value: Any) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT OR REPLACE INTO responses(key, source, value, fetched_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, source, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            cur.execute("SELECT COUNT(*) FROM responses")
+            count = cur.fetchone()[0]
+            if count > self.max_entries:
+                # evict down to 90% so we don't pay for eviction on every insert
+                drop = count - int(self.max_entries * 0.9)
+                cur.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY last_used ASC LIMIT ?)",
+                    (drop,),
+                )
+                logger.debug(f"Search cache evicted {drop} entries")
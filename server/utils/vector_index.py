@@ -0,0 +1,379 @@
+import os
+import json
+import shutil
+import logging
+import operator
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from utils.bm25_index import StringTable, CURRENT_FILE
+
+logger = logging.getLogger(__name__)
+
+SCAN_BLOCK_BYTES = 1 << 20  # float32 copy of int8 rows per matmul; small enough to stay in cache
+MASK_CACHE = 64  # metadata filters remembered per build
+
+_COMPARE: Dict[str, Callable[[Any, Any], bool]] = {
+    "$eq": operator.eq, "$ne": operator.ne,
+    "$gt": operator.gt, "$gte": operator.ge, "$lt": operator.lt, "$lte": operator.le,
+    "$in": lambda value, targets: value in targets, "$nin": lambda value, targets: value not in targets,
+}
+
+
+def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """symmetric per-row int8 codes and scales: vectors ~= codes * scales[:, None]"""
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return (vectors / np.where(norms == 0, 1.0, norms)).astype(np.float32)
+
+
+def _hnswlib():
+    import hnswlib  # optional dependency
+    return hnswlib
+
+
+class _Build:
+    """one immutable, memory-mapped generation of the index"""
+
+    def __init__(self, path: str, hnsw_ef: int):
+        load = lambda name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.path = path
+        self.generation: int = int(self.meta["generation"])
+        self.codes = load("codes")
+        self.scales = load("scales")
+        self.vectors = load("vectors")
+        self.ids = StringTable(load("ids_blob"), load("ids_offsets"))
+        self.docs = StringTable(load("docs_blob"), load("docs_offsets"))
+        self.hnsw = None
+        if self.meta.get("hnsw"):
+            try:
+                self.hnsw = _hnswlib().Index(space="ip", dim=self.vectors.shape[1])
+                self.hnsw.load_index(os.path.join(path, "hnsw.bin"), max_elements=len(self.ids))
+                self.hnsw.set_ef(hnsw_ef)
+            except ImportError:
+                logger.warning("hnswlib not installed, searching the int8 matrix instead of the HNSW graph")
+                self.hnsw = None
+        self._row_of: Optional[Dict[str, int]] = None
+        self._columns: Dict[str, List[Any]] = {}
+        self._masks: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def n(self) -> int:
+        return len(self.ids)
+
+    def row_of(self) -> Dict[str, int]:
+        if self._row_of is None:
+            self._row_of = {cid: i for i, cid in enumerate(self.ids)}
+        return self._row_of
+
+    def record(self, row: int) -> Dict[str, Any]:
+        return json.loads(self.docs[row])
+
+    def approx_scores(self, q: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        """int8 dot products, dequantized a block at a time"""
+        codes = self.codes if rows is None else self.codes[rows]
+        scales = self.scales if rows is None else self.scales[rows]
+        out = np.empty(len(codes), dtype=np.float32)
+        step = max(1, SCAN_BLOCK_BYTES // (4 * max(1, codes.shape[1])))
+        for start in range(0, len(codes), step):
+            block = codes[start:start + step]
+            out[start:start + len(block)] = block.astype(np.float32) @ q
+        return out * scales
+
+    def rows_where(self, where: Dict[str, Any]) -> np.ndarray:
+        """rows whose metadata satisfies a Chroma-style `where` filter"""
+        key = json.dumps(where, sort_keys=True, ensure_ascii=False)
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+        if mask is None:
+            mask = self._mask(where)
+            with self._lock:
+                self._masks[key] = mask
+                while len(self._masks) > MASK_CACHE:
+                    self._masks.popitem(last=False)
+        return np.flatnonzero(mask)
+
+    def _mask(self, where: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(self.n, dtype=bool)
+        for field, cond in where.items():
+            if field in ("$and", "$or"):
+                parts = [self._mask(c) for c in cond]
+                combined = np.logical_and.reduce(parts) if field == "$and" else np.logical_or.reduce(parts)
+                mask &= combined
+                continue
+            ops = cond if isinstance(cond, dict) else {"$eq": cond}
+            values = self._column(field)
+            for op, target in ops.items():
+                test = _COMPARE[op]
+                mask &= np.fromiter((_holds(test, v, target) for v in values), dtype=bool, count=self.n)
+        return mask
+
+    def _column(self, field: str) -> List[Any]:
+        values = self._columns.get(field)
+        if values is None:
+            values = [self.record(i)["metadata"].get(field) for i in range(self.n)]
+            self._columns[field] = values
+        return values
+
+
+def _holds(test: Callable[[Any, Any], bool], value: Any, target: Any) -> bool:
+    """a missing field or a type mismatch never matches, as in Chroma"""
+    if value is None:
+        return False
+    try:
+        return bool(test(value, target))
+    except TypeError:
+        return False
+
+
+class LocalVectorStore:
+    """
+    in-process alternative to Chroma with the subset of its interface retrieve.py uses.
+    vectors are stored L2-normalized, as int8 codes with one scale per row plus the float32
+    originals, all memory-mapped .npy files of one build directory (made current through a
+    CURRENT file, like the BM25 index). a query scans the int8 matrix, or walks an HNSW graph
+    once the corpus has `hnsw_threshold` vectors and hnswlib is installed, for
+    `rescore_factor * k` candidates, and reranks those by their exact float scores; only the
+    candidates' float rows are paged in. filtered queries scan just the matching rows.
+
+    writes (add_documents / delete / reset_collection) are staged in memory and become
+    visible, on disk and to searches, with flush(generation).
+    """
+
+    def __init__(
+        self,
+        root: str,
+        embedding_function: Embeddings,
+        hnsw_threshold: int = 10_000,
+        rescore_factor: int = 4,
+        hnsw_ef: int = 128,
+        hnsw_m: int = 16,
+    ):
+        self.root = root
+        self.embedding_function = embedding_function
+        self.hnsw_threshold = hnsw_threshold
+        self.rescore_factor = max(1, rescore_factor)
+        self.hnsw_ef = hnsw_ef
+        self.hnsw_m = hnsw_m
+        self._staged: "OrderedDict[str, Tuple[np.ndarray, str, Dict[str, Any]]]" = OrderedDict()
+        self._deleted: set = set()
+        self._reset = False
+        self._write_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._build = self._open_current()
+
+    @property
+    def generation(self) -> int:
+        """corpus generation of the visible build, -1 before the first flush"""
+        return self._build.generation if self._build is not None else -1
+
+    def refresh(self) -> int:
+        """switch to a build another process flushed since; returns the visible generation"""
+        build = self._open_current()
+        if build is not None and build.generation != self.generation:
+            self._build = build
+        return self.generation
+
+    def count(self) -> int:
+        return self._build.n if self._build is not None else 0
+
+    # -- writes ---------------------------------------------------------------------------
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        ids = list(ids) if ids is not None else [d.id for d in documents]
+        if not documents:
+            return ids
+        vectors = self.embedding_function.embed_documents([d.page_content for d in documents])
+        self.add_vectors(ids, vectors, [d.page_content for d in documents], [d.metadata for d in documents])
+        return ids
+
+    def add_vectors(
+        self, ids: Sequence[str], vectors: Iterable[Sequence[float]], texts: Sequence[str], metadatas: Sequence[Dict[str, Any]]
+    ) -> None:
+        """stage precomputed embeddings, replacing any vector with the same id"""
+        matrix = _normalize(np.asarray(list(vectors), dtype=np.float32))
+        with self._write_lock:
+            for cid, vec, text, meta in zip(ids, matrix, texts, metadatas):
+                self._deleted.discard(cid)
+                self._staged[cid] = (vec, text, dict(meta or {}))
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs) -> None:
+        with self._write_lock:
+            for cid in ids or []:
+                self._staged.pop(cid, None)
+                self._deleted.add(cid)
+
+    def reset_collection(self) -> None:
+        with self._write_lock:
+            self._staged.clear()
+            self._deleted.clear()
+            self._reset = True
+
+    def flush(self, generation: int) -> None:
+        """write the current build plus staged changes as a new build and make it current"""
+        with self._write_lock:
+            staged, deleted, reset = self._staged, self._deleted, self._reset
+            self._staged, self._deleted, self._reset = OrderedDict(), set(), False
+        old = None if reset else self._build
+
+        keep = []
+        if old is not None:
+            keep = [i for i, cid in enumerate(old.ids) if cid not in deleted and cid not in staged]
+        ids = [old.ids[i] for i in keep] + list(staged)
+        docs = [old.docs[i] for i in keep] + [
+            json.dumps({"text": text, "metadata": meta}, ensure_ascii=False) for _, text, meta in staged.values()
+        ]
+        parts = []
+        if keep:
+            parts.append(np.asarray(old.vectors[np.asarray(keep)], dtype=np.float32))
+        if staged:
+            parts.append(np.stack([vec for vec, _, _ in staged.values()]))
+        dim = parts[0].shape[1] if parts else (old.vectors.shape[1] if old is not None else 0)
+        vectors = np.concatenate(parts) if parts else np.zeros((0, dim), dtype=np.float32)
+        self._write(ids, docs, vectors, generation)
+
+    def rebuild(self, chunks: Iterable[Tuple[str, str, Dict[str, Any]]], generation: int, batch: int = 256) -> None:
+        """replace everything with (chunk_id, text, metadata) chunks, embedding them in batches"""
+        self.reset_collection()
+        pending: List[Tuple[str, str, Dict[str, Any]]] = []
+
+        def _stage():
+            vectors = self.embedding_function.embed_documents([text for _, text, _ in pending])
+            self.add_vectors([c for c, _, _ in pending], vectors, [t for _, t, _ in pending], [m for _, _, m in pending])
+            pending.clear()
+
+        for chunk in chunks:
+            pending.append(chunk)
+            if len(pending) >= batch:
+                _stage()
+        if pending:
+            _stage()
+        self.flush(generation)
+
+    # -- reads ----------------------------------------------------------------------------
+
+    def similarity_search_by_vector(
+        self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict[str, Any]] = None, **kwargs
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_scores(embedding, k=k, filter=filter)]
+
+    def similarity_search_by_vector_with_scores(
+        self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float]]:
+        """(document, cosine similarity), most similar first"""
+        build = self._build
+        if build is None or not build.n:
+            return []
+        q = _normalize(np.asarray(embedding, dtype=np.float32))
+        rows = None if filter is None else build.rows_where(filter)
+        if rows is not None and not len(rows):
+            return []
+
+        n = build.n if rows is None else len(rows)
+        n_cand = min(n, k * self.rescore_factor)
+        if rows is None and build.hnsw is not None:
+            labels, _ = build.hnsw.knn_query(q, k=n_cand, num_threads=1)
+            candidates = np.asarray(labels[0], dtype=np.int64)
+        else:
+            approx = build.approx_scores(q, rows)
+            top = np.argpartition(-approx, n_cand - 1)[:n_cand]
+            candidates = top if rows is None else rows[top]
+
+        # exact rescoring reads only the candidates' float rows
+        candidates = np.sort(candidates)
+        exact = np.asarray(build.vectors[candidates], dtype=np.float32) @ q
+        order = np.argsort(-exact, kind="stable")[:k]
+        return [(self._document(build, int(candidates[i])), float(exact[i])) for i in order]
+
+    def get(self, ids: Optional[List[str]] = None, include: Optional[List[str]] = None, **kwargs) -> Dict[str, Any]:
+        """chroma-style get: found ids in request order, with "embeddings" / "documents" / "metadatas" on request"""
+        include = include or ["documents", "metadatas"]
+        build = self._build
+        out: Dict[str, Any] = {"ids": [], "embeddings": [], "documents": [], "metadatas": []}
+        if build is None:
+            return out
+        row_of = build.row_of()
+        rows = [row_of[cid] for cid in (ids if ids is not None else list(build.ids)) if cid in row_of]
+        out["ids"] = [build.ids[r] for r in rows]
+        if "embeddings" in include:
+            out["embeddings"] = np.asarray(build.vectors[np.asarray(rows, dtype=np.int64)], dtype=np.float32)
+        if "documents" in include or "metadatas" in include:
+            records = [build.record(r) for r in rows]
+            out["documents"] = [rec["text"] for rec in records]
+            out["metadatas"] = [rec["metadata"] for rec in records]
+        return out
+
+    @staticmethod
+    def _document(build: _Build, row: int) -> Document:
+        record = build.record(row)
+        return Document(id=build.ids[row], page_content=record["text"], metadata=record["metadata"])
+
+    # -- storage --------------------------------------------------------------------------
+
+    def _open_current(self) -> Optional[_Build]:
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), "r", encoding="utf-8") as f:
+                name = f.read().strip()
+            return _Build(os.path.join(self.root, name), self.hnsw_ef)
+        except (OSError, ValueError, KeyError) as e:
+            logger.debug(f"No usable vector index under {self.root}: {e}")
+            return None
+
+    def _write(self, ids: List[str], docs: List[str], vectors: np.ndarray, generation: int) -> None:
+        name = f"gen_{generation}_{os.getpid()}"
+        path = os.path.join(self.root, name)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+
+        codes, scales = quantize(vectors) if len(vectors) else (np.zeros(vectors.shape, np.int8), np.zeros(0, np.float32))
+        ids_blob, ids_offsets = StringTable.encode(ids)
+        docs_blob, docs_offsets = StringTable.encode(docs)
+        arrays = {
+            "codes": codes, "scales": scales, "vectors": vectors,
+            "ids_blob": ids_blob, "ids_offsets": ids_offsets,
+            "docs_blob": docs_blob, "docs_offsets": docs_offsets,
+        }
+        for key, arr in arrays.items():
+            np.save(os.path.join(path, f"{key}.npy"), arr)
+        hnsw = len(ids) >= self.hnsw_threshold and self._write_hnsw(path, vectors)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"generation": generation, "n": len(ids), "dim": int(vectors.shape[1]), "hnsw": hnsw}, f)
+
+        tmp = os.path.join(self.root, CURRENT_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(name)
+        os.replace(tmp, os.path.join(self.root, CURRENT_FILE))
+        self._build = _Build(path, self.hnsw_ef)
+        for other in os.listdir(self.root):
+            if other.startswith("gen_") and other != name:
+                # open mmaps in other processes stay valid after unlink
+                shutil.rmtree(os.path.join(self.root, other), ignore_errors=True)
+        logger.info(f"Vector index written: {len(ids)} vectors{' + HNSW' if hnsw else ''} (generation {generation})")
+
+    def _write_hnsw(self, path: str, vectors: np.ndarray) -> bool:
+        try:
+            hnswlib = _hnswlib()
+        except ImportError:
+            logger.warning(f"{len(vectors)} vectors but hnswlib is not installed, keeping the int8 scan")
+            return False
+        index = hnswlib.Index(space="ip", dim=vectors.shape[1])
+        index.init_index(max_elements=len(vectors), ef_construction=200, M=self.hnsw_m)
+        index.add_items(vectors, np.arange(len(vectors)))
+        index.save_index(os.path.join(path, "hnsw.bin"))
+        return True
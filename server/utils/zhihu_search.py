@@ -2,8 +2,9 @@
 
 import requests
 import logging
+import threading
 import time
-from typing import Optional
+from typing import Callable, Optional
 from datetime import datetime
 import pandas as pd
 
@@ -14,25 +15,50 @@ from config import DATA_DIR
 class ZhihuCollector:
 
     # ['81964408445','82586149604','82493740255','81348057992','81748398040','81531639383']
-    def __init__(self, list_ids: list[str], log: Optional[logging.Logger] = logger) -> None:
+    def __init__(
+        self, list_ids: list[str], log: Optional[logging.Logger] = logger, session: Optional[requests.Session] = None
+    ) -> None:
         self.answer_ids = list_ids
+        self.session = session or requests.Session()
+        self.timed_out = False
+        self.failures = 0
+        self._stop: Optional[threading.Event] = None
         self.province_dict = {}
         self.logger = log
 
-    def search(self, max_count: int = 20, show_comments: int = 0, return_factor: bool = True) -> Optional[list[dict]]:
+    def search(
+        self,
+        max_count: int = 20,
+        show_comments: int = 0,
+        return_factor: bool = True,
+        timeout: Optional[float] = None,
+        on_factor: Optional[Callable[[dict], None]] = None,
+        stop: Optional[threading.Event] = None,
+    ) -> Optional[list[dict]]:
         """
         Run gathering sequence over all answer_ids.
 
         :param max_count: maximum number of comments to fetch per answer_id
         :param show_comments: number of comments to print as examples
         :param return_factor: if True, return gathered comments; otherwise save to file
+        :param timeout: seconds for the whole sequence; answers not reached by then are skipped and `timed_out` is set
+        :param on_factor: called with each answer's {answer_id: comments} as soon as it is gathered
+        :param stop: once set, the sequence ends as at the deadline (the caller has stopped waiting)
         :return: list of dicts (comments grouped per answer_id) or None
         """
         factors = []
+        self.timed_out = False
+        self.failures = 0
+        self._stop = stop
+        deadline = time.monotonic() + timeout if timeout is not None else None
 
         for answer_id in self.answer_ids:
+            if self._stopped() or (deadline is not None and time.monotonic() >= deadline):
+                self.timed_out = True
+                self.logger.debug(f"Deadline reached, {answer_id} and later answers skipped")
+                break
             self.logger.debug(f"Start gathering comments from {answer_id}...")
-            comments = self._get_all_comments(answer_id, max_count)
+            comments = self._get_all_comments(answer_id, max_count, deadline)
 
             if not comments:
                 self.logger.debug(f"No comments found for {answer_id}")
@@ -54,17 +80,20 @@ class ZhihuCollector:
 
             if return_factor:
                 factors.append({answer_id: comments})
+                if on_factor is not None:
+                    on_factor({answer_id: comments})
             else:
                 self._save_to_file(comments, answer_id)
 
         return factors or None
 
 
-    def _get_all_comments(self, answer_id: str, max_count: int):
+    def _get_all_comments(self, answer_id: str, max_count: int, deadline: Optional[float] = None):
         """
         getting all comments
         :param answer_id: targeted answer_id
         :param max_count: maximum number of comments to get
+        :param deadline: time.monotonic() after which no further page is requested
         :return: all comment's list
         """
         all_comments = []
@@ -73,7 +102,7 @@ class ZhihuCollector:
 
         while True:
             self.logger.debug(f"Now getting comments on {offset // limit + 1} page...")
-            data = self._get_zhihu_answer_comments(answer_id, limit, offset)
+            data = self._get_zhihu_answer_comments(answer_id, limit, offset, deadline)
 
             if not data or "data" not in data:
                 self.logger.debug("No more comments")
@@ -83,7 +112,7 @@ class ZhihuCollector:
             all_comments.extend(comments)
 
             # check if there's still more comments
-            if data.get("paging", {}).get("is_end", True) and len(comments) == 0:
+            if data.get("paging", {}).get("is_end", True) or len(comments) == 0:
                 self.logger.debug("Reach the bottom / Comments empty.")
                 break
 
@@ -93,16 +122,36 @@ class ZhihuCollector:
                 break
 
             offset += limit
-            time.sleep(2)
+            if deadline is not None and time.monotonic() + 2 >= deadline:
+                self.timed_out = True
+                self.logger.debug("Deadline reached, no further pages")
+                break
+            if self._pause(2):
+                self.timed_out = True
+                self.logger.debug("Stopped, no further pages")
+                break
         return all_comments
 
 
-    def _get_zhihu_answer_comments(self, answer_id: str, limit: int, offset: int):
+    def _stopped(self) -> bool:
+        return self._stop is not None and self._stop.is_set()
+
+
+    def _pause(self, seconds: float) -> bool:
+        """wait between pages; True when stopped meanwhile"""
+        if self._stop is None:
+            time.sleep(seconds)
+            return False
+        return self._stop.wait(seconds)
+
+
+    def _get_zhihu_answer_comments(self, answer_id: str, limit: int, offset: int, deadline: Optional[float] = None):
         """
         get commentes from zhihu answers
         :param answer_id: the targeted answer
         :param limit: maximum number of comments per request
         :param offset: offset (starting from offset.value)
+        :param deadline: time.monotonic() the request must not outlast
         :return: list of comments (in json)
         """
         url = f"https://www.zhihu.com/api/v4/answers/{answer_id}/root_comments"
@@ -120,12 +169,14 @@ class ZhihuCollector:
         }
 
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=10)
+            timeout = 10 if deadline is None else max(0.1, min(10, deadline - time.monotonic()))
+            response = self.session.get(url, headers=headers, params=params, timeout=timeout)
             response.raise_for_status()
             data = response.json()
             return data
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Request failed: {e}")
+            self.failures += 1
             return None
 
     